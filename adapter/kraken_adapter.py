@@ -1,118 +1,590 @@
 # -*- coding: utf-8 -*-
+import os
+import select
 import socket
-import subprocess
+import sqlite3
+import time
+from ConfigParser import NoOptionError, NoSectionError
+from collections import deque
 
-from core.adapterinterfaces.a5 import A5ReconstructionAdapter
+from adapter.kraken_scheduler import KrakenScheduler
+from core.adapterinterfaces.a5 import A5BurstSetBatch, A5ReconstructionAdapter, bits_from_strings, bits_to_string
+from core.gsm import a51
+
+
+class KrakenError(Exception):
+    """
+    Signals a failed connection to the Kraken server.
+    """
+    pass
+
+
+class KrakenRequest(object):
+    """
+    A crack request for a single burst set of a batch.
+    """
+
+    def __init__(self, batch, index, keystream, session=0):
+        self.batch = batch
+        self.index = index
+        self.keystream = keystream
+        self.session = session
+        self.timeout = None
+        self.deadline = None
+        self.job_id = None
+        self.tried = set()  # servers the request was submitted to
+        self.found = []  # (key, bitpos) tuples reported by the server
+        self.complete = False  # True once the server finished the table lookup
+
+    @property
+    def burst_set(self):
+        return self.batch[self.index]
+
+
+class KrakenCache(object):
+    """
+    Persistent cache of Kraken results, keyed by the table set and the keystream.
+
+    The result of a table lookup only depends on the keystream, so a keystream that was cracked before
+    is not sent to Kraken again. The candidates of finished requests are stored, they are empty if the keystream
+    was not found. The Kc is not stored, it also depends on the frame number of the burst and is verified again
+    from the candidates. The least recently used entries are evicted if the cache grows beyond its size.
+    """
+
+    def __init__(self, path, table_set="default", size=100000):
+        self.table_set = table_set
+        self.size = size
+        self.__used = []  # (time, keystream) of the lookups since the last commit
+        self.__db = sqlite3.connect(path)
+        # caches of older versions also have a kc column, the columns are named in every statement
+        self.__db.execute("CREATE TABLE IF NOT EXISTS results (table_set TEXT, keystream TEXT, candidates TEXT, "
+                          "last_used REAL, PRIMARY KEY (table_set, keystream))")
+        self.__db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self.__db.commit()
+
+    def close(self):
+        self.flush()
+        self.__db.close()
+
+    def get(self, keystream):
+        """
+        Look up a keystream. The time of the lookup is written with the next put or flush.
+
+        :return: the list of (key, bitpos) tuples found by Kraken, or None if the keystream is not cached.
+        """
+        row = self.__db.execute("SELECT candidates FROM results WHERE table_set = ? AND keystream = ?",
+                                (self.table_set, keystream)).fetchone()
+        if row is None:
+            return None
+        self.__used.append((time.time(), keystream))
+        return [(str(key), int(bitpos)) for key, bitpos in (c.split("@") for c in row[0].split(",") if c)]
+
+    def flush(self):
+        """
+        Write the times of the pending lookups in one transaction.
+        """
+        self.__update_used()
+        self.__db.commit()
+
+    def put(self, keystream, candidates):
+        """
+        Store the result of a request, together with the times of the pending lookups.
+
+        :param keystream: the keystream as string of '0' and '1'.
+        :param candidates: the list of (key, bitpos) tuples found by Kraken.
+        """
+        self.__update_used()
+        self.__db.execute("INSERT OR REPLACE INTO results (table_set, keystream, candidates, last_used) "
+                          "VALUES (?, ?, ?, ?)",
+                          (self.table_set, keystream, ",".join("%s@%s" % c for c in candidates), time.time()))
+        count = self.__db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.size:
+            self.__db.execute("DELETE FROM results WHERE rowid IN "
+                              "(SELECT rowid FROM results ORDER BY last_used LIMIT ?)", (count - self.size,))
+        self.__db.commit()
+
+    def __update_used(self):
+        if self.__used:
+            self.__db.executemany("UPDATE results SET last_used = ? WHERE table_set = ? AND keystream = ?",
+                                  [(used, self.table_set, keystream) for used, keystream in self.__used])
+            self.__used = []
+
+
+class KrakenClient(object):
+    """
+    A persistent connection to a single Kraken server with pipelined crack requests.
+
+    The server acknowledges every request with its job id and the keystream, which is used to match
+    the results to the requests.
+    """
+
+    def __init__(self, host="localhost", port=9999, connect_timeout=10.0):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.unacknowledged = []  # submitted requests without a job id, in submission order
+        self.jobs = dict()  # job id -> request
+        self.__sock = None
+        self.__buffer = ""
+
+    def __str__(self):
+        return "%s:%s" % (self.host, self.port)
+
+    @property
+    def in_flight(self):
+        return len(self.unacknowledged) + len(self.jobs)
+
+    def connect(self):
+        if self.__sock is not None:
+            return
+        try:
+            self.__sock = socket.create_connection((self.host, self.port), self.connect_timeout)
+        except socket.error as e:
+            self.__sock = None
+            raise KrakenError("Connection to Kraken at %s failed: %s" % (self, e))
+        self.__buffer = ""
+
+    def close(self):
+        if self.__sock is not None:
+            self.__sock.close()
+            self.__sock = None
+
+    def fileno(self):
+        return self.__sock.fileno()
+
+    def submit(self, request, timeout):
+        """
+        Send a request. The timeout counts from the acknowledgement of the server, so the time a request waits
+        in the pipeline is not held against it. An unacknowledged request expires after the timeout as well.
+        """
+        request.timeout = timeout
+        request.deadline = time.time() + timeout
+        request.job_id = None
+        request.found = []
+        request.complete = False
+        request.tried.add(str(self))
+        self.__send("crack %s\n" % request.keystream)
+        self.unacknowledged.append(request)
+
+    def read(self):
+        """
+        Read the available responses of the server.
+
+        :return: a tuple of a dictionary mapping the requests to lists of the (key, bitpos) tuples found for them,
+        and the list of requests that finished.
+        """
+        data = self.__sock.recv(4096)
+        if not data:
+            raise socket.error("connection closed by server")
+        lines = (self.__buffer + data).split("\n")
+        self.__buffer = lines.pop()
+
+        candidates = dict()
+        finished = []
+        for line in lines:
+            parts = line.split()
+            if line.startswith("Cracking #") and len(parts) >= 3:
+                self.__acknowledge(parts[1][1:], parts[2])
+            elif line.startswith("Found ") and len(parts) >= 5:
+                # Found <key> @ <bitpos> #<job id> (table:<table>)
+                request = self.jobs.get(parts[4][1:])
+                if request is not None:
+                    candidates.setdefault(request, []).append((parts[1], int(parts[3])))
+            elif line.startswith("crack #") and len(parts) >= 2:
+                request = self.jobs.pop(parts[1][1:], None)
+                if request is not None:
+                    request.complete = True
+                    finished.append(request)
+        return candidates, finished
+
+    def expire(self, now):
+        """
+        Cancel the requests whose deadline passed.
+
+        :return: the list of cancelled requests.
+        """
+        expired = [r for r in self.unacknowledged if r.deadline <= now]
+        for request in expired:
+            self.unacknowledged.remove(request)  # a late acknowledgement is cancelled in __acknowledge
+        for job_id in [j for j in self.jobs if self.jobs[j].deadline <= now]:
+            expired.append(self.jobs.pop(job_id))
+            self.__cancel(job_id)
+        return expired
+
+    def cancel(self, predicate=None):
+        """
+        Cancel requests.
+
+        :param predicate: a function that selects the requests to cancel, None to cancel all requests.
+        :return: the list of cancelled requests.
+        """
+        if predicate is None:
+            predicate = lambda request: True
+        cancelled = [r for r in self.unacknowledged if predicate(r)]
+        for request in cancelled:
+            self.unacknowledged.remove(request)
+        for job_id in [j for j in self.jobs if predicate(self.jobs[j])]:
+            cancelled.append(self.jobs.pop(job_id))
+            self.__cancel(job_id)
+        return cancelled
+
+    def __acknowledge(self, job_id, keystream):
+        for request in self.unacknowledged:
+            if request.keystream == keystream:
+                self.unacknowledged.remove(request)
+                request.job_id = job_id
+                request.deadline = time.time() + request.timeout
+                self.jobs[job_id] = request
+                return
+        # left over from a previous session or already expired
+        self.__cancel(job_id)
+
+    def __cancel(self, job_id):
+        try:
+            self.__send("cancel %s\n" % job_id)
+        except socket.error:
+            pass
+
+    def __send(self, data):
+        if self.__sock is None:
+            raise socket.error("not connected")
+        self.__sock.sendall(data)
+
+
+class KrakenPool(object):
+    """
+    Distributes crack requests over several Kraken servers.
+
+    Every request is dispatched to the connected server with the fewest requests in flight. Requests that
+    do not finish before their deadline, or whose server went down, are retried on a server they were not
+    submitted to yet. Requests without a server left to try are dropped and reported. Once a key of a session
+    was verified, the remaining requests of the session are cancelled.
+    """
+
+    def __init__(self, clients, max_in_flight=8, request_timeout=120.0, cache=None, printmsg=None):
+        """
+        :param clients: a list of KrakenClient.
+        :param max_in_flight: the maximum number of requests in flight per server.
+        :param request_timeout: seconds after the acknowledgement of a request by a server after which it is
+        cancelled and retried on another server.
+        :param cache: an optional KrakenCache that is consulted before a request is sent.
+        :param printmsg: an optional function that is called with messages about the servers.
+        """
+        self.clients = clients
+        self.printmsg = printmsg
+        self.cache = cache
+        self.max_in_flight = max_in_flight
+        self.request_timeout = request_timeout
+        self.__down = set()
+        self.__outstanding = dict()
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def crack(self, burst_sets, verify, progress=None):
+        """
+        Submit burst sets to the Kraken servers until a key is verified or all requests finished.
+
+        :param burst_sets: an A5BurstSetBatch or a list of A5BurstSet.
+        :param verify: a function taking the batch, the index of the burst set in the batch and a list of
+        (found key, bit position) tuples, that returns the verified Kc or None. All candidates of one response
+        of a server are verified together.
+        :param progress: an optional function that is called with every burst set when it is submitted first.
+        :return: a tuple of the Kc and the burst set it was found with, or None.
+        """
+        results = []
+        self.crack_sessions([(None, burst_sets)], verify, lambda session, kc, burst_set: results.append(
+            (kc, burst_set)), progress)
+        if results and results[0][0] is not None:
+            return results[0]
+        return None
+
+    def crack_sessions(self, sessions, verify, finished, progress=None):
+        """
+        Crack the burst sets of several sessions. The requests of all sessions share the in-flight slots
+        of the servers and are submitted in the order of the sessions.
+
+        :param sessions: a list of (session, burst sets) tuples, the burst sets as A5BurstSetBatch or
+        list of A5BurstSet.
+        :param verify: a function taking the batch, the index of the burst set in the batch and a list of
+        (found key, bit position) tuples, that returns the verified Kc or None.
+        :param finished: a function taking the session, the Kc and the burst set it was found with. It is called
+        once per session, as soon as a key was verified or with None for Kc and burst set after all requests
+        of the session finished without a key.
+        :param progress: an optional function that is called with every burst set when it is submitted first.
+        """
+        pending = deque()
+        self.__outstanding = dict()
+        dropped = [0]
+
+        def give_up(requests):
+            dropped[0] += len([r for r in requests if r.session in self.__outstanding])
+            complete(requests)
+
+        def complete(requests):
+            for request in requests:
+                if request.session not in self.__outstanding:
+                    continue  # the session is solved already
+                self.__outstanding[request.session] -= 1
+                if self.__outstanding[request.session] == 0:
+                    del self.__outstanding[request.session]
+                    finished(sessions[request.session][0], None, None)
+
+        def solve(request, kc):
+            # the candidates of a lookup that is still running are incomplete and not cached
+            if self.cache is not None and request.complete:
+                self.cache.put(request.keystream, request.found)
+            del self.__outstanding[request.session]
+            for other in [r for r in pending if r.session == request.session]:
+                pending.remove(other)
+            for client in self.__connected():
+                client.cancel(lambda r: r.session == request.session)
+            finished(sessions[request.session][0], kc, request.burst_set)
+
+        requests = []
+        for index, (session, batch) in enumerate(sessions):
+            if not isinstance(batch, A5BurstSetBatch):
+                batch = A5BurstSetBatch.from_burst_sets(batch)
+            if len(batch) == 0:
+                finished(session, None, None)
+                continue
+            self.__outstanding[index] = len(batch)
+            # the keystreams of the whole batch are computed at once
+            keystreams = batch.keystreams() + ord("0")
+            requests.extend(KrakenRequest(batch, i, keystreams[i].tostring(), index) for i in range(len(batch)))
+
+        for request in requests:
+            cached = self.cache.get(request.keystream) if self.cache is not None else None
+            if cached is None:
+                pending.append(request)
+            elif request.session in self.__outstanding:
+                # known result, no round trip to Kraken
+                request.found = cached
+                kc = verify(request.batch, request.index, cached) if cached else None
+                if kc is not None:
+                    solve(request, kc)
+                else:
+                    complete([request])
+        if self.cache is not None:
+            self.cache.flush()
+
+        try:
+            while self.__outstanding:
+                give_up(self.__dispatch(pending, progress))
+                busy = [client for client in self.__connected() if client.in_flight > 0]
+                if not busy:
+                    break
+
+                timeout = max(0.0, min(r.deadline for c in busy for r in c.unacknowledged + c.jobs.values()) -
+                              time.time())
+                readable, _, _ = select.select(busy, [], [], timeout)
+                for client in readable:
+                    try:
+                        candidates, done = client.read()
+                    except socket.error:
+                        give_up(self.__retry(self.__disconnect(client), pending))
+                        continue
+                    for request in candidates:
+                        request.found.extend(candidates[request])
+                        if request.session not in self.__outstanding:
+                            continue
+                        kc = verify(request.batch, request.index, candidates[request])
+                        if kc is not None:
+                            solve(request, kc)
+                    if self.cache is not None:
+                        for request in done:
+                            self.cache.put(request.keystream, request.found)
+                    complete(done)
+
+                now = time.time()
+                for client in busy:
+                    give_up(self.__retry(client.expire(now), pending))
+        finally:
+            for client in self.__connected():
+                client.cancel()
+            if dropped[0] and self.printmsg is not None:
+                self.printmsg("%s lookups were dropped, they timed out or lost their server and no other server "
+                              "was left to try" % dropped[0])
+
+    def __connected(self):
+        return [client for client in self.clients if str(client) not in self.__down]
+
+    def __disconnect(self, client):
+        self.__down.add(str(client))
+        requests = client.cancel()
+        client.close()
+        return requests
+
+    def __retry(self, requests, pending):
+        # requests are retried on servers they were not submitted to, the others are returned
+        dropped = []
+        for request in requests:
+            if len(request.tried) < len(self.clients):
+                pending.append(request)
+            else:
+                dropped.append(request)
+        return dropped
+
+    def __dispatch(self, pending, progress):
+        skipped = deque()
+        dropped = []
+        while pending:
+            request = pending.popleft()
+            candidates = [c for c in self.__connected()
+                          if c.in_flight < self.max_in_flight and str(c) not in request.tried]
+            if not candidates:
+                if [c for c in self.__connected() if str(c) not in request.tried]:
+                    skipped.append(request)
+                else:
+                    dropped.append(request)  # no server left to try
+                continue
+
+            client = min(candidates, key=lambda c: c.in_flight)
+            try:
+                client.connect()
+                client.submit(request, self.request_timeout)
+            except (KrakenError, socket.error) as e:
+                if self.printmsg is not None:
+                    self.printmsg("Kraken at %s is not available: %s" % (client, e))
+                dropped.extend(self.__retry(self.__disconnect(client), pending))
+                pending.appendleft(request)
+                continue
+            if progress is not None and len(request.tried) == 1:
+                progress(request.burst_set)
+        pending.extend(skipped)
+
+        if not self.__connected():
+            raise KrakenError("No Kraken server is reachable.")
+        return dropped
 
 
 class KrakenA51ReconstructorAdapter(A5ReconstructionAdapter):
-    def __init__(self, config_provider):
+    def __init__(self, config_provider, servers=None, use_cache=True, printmsg=None):
+        """
+        :param servers: comma separated list of host:port, None for the servers in the configuration.
+        :param use_cache: if False, the result cache is not used, e.g. for benchmarks.
+        :param printmsg: an optional function that is called with messages about the Kraken servers.
+        """
         super(KrakenA51ReconstructorAdapter, self).__init__(config_provider)
+        if servers is None:
+            servers = self.__get_option(config_provider, "servers", "localhost:9999")
+        clients = []
+        for server in servers.split(","):
+            host, port = server.strip().rsplit(":", 1)
+            clients.append(KrakenClient(host, int(port)))
+        cache = None
+        cache_file = self.__get_option(config_provider, "cache", os.path.join(config_provider.config_dir,
+                                                                              "kraken.cache"))
+        if cache_file and use_cache:
+            cache = KrakenCache(os.path.expanduser(cache_file), self.__get_option(config_provider, "table_set",
+                                                                                 "default"),
+                                int(self.__get_option(config_provider, "cache_size", 100000)))
+        self.__pool = KrakenPool(clients, max_in_flight=int(self.__get_option(config_provider, "in_flight", 8)),
+                                 request_timeout=float(self.__get_option(config_provider, "timeout", 120)),
+                                 cache=cache, printmsg=printmsg)
+        statistics_file = self.__get_option(config_provider, "statistics",
+                                            os.path.join(config_provider.config_dir, "kraken.stats"))
+        self.scheduler = KrakenScheduler(os.path.expanduser(statistics_file) if statistics_file else None)
+
+    @staticmethod
+    def __get_option(config_provider, option, default):
+        # configuration files created by older versions have no kraken section
+        try:
+            return config_provider.get("kraken", option)
+        except (NoSectionError, NoOptionError):
+            return default
 
     def reconstruct(self, a5_burst_set):
         super(KrakenA51ReconstructorAdapter, self).reconstruct(a5_burst_set)
 
-    def send2kraken(self, kraken_burst, verbose=False):
-        host = "localhost"
-        port = 9999
-        cracked = False
-        invalid = False
-        failed = False
-        found_key = None
-
-        # Todo: Timeout for connection
-        remote_address = (host, port)
-        sock = None
+    def crack(self, burst_sets, verbose=False, progress=None):
+        """
+        Try to reconstruct the session key from a list of burst sets. The burst sets are cracked concurrently
+        by the configured Kraken servers, the remaining requests are cancelled as soon as a key is verified.
+
+        :param burst_sets: an A5BurstSetBatch or a list of A5BurstSet.
+        :param verbose: if True, candidate keys are printed.
+        :param progress: an optional function that is called with every burst set when it is submitted.
+        :return: the Kc as hex string or None.
+        """
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        except socket.error as e:
-            print("Socket error")
+            result = self.__pool.crack(burst_sets, self.__verifier(verbose), progress)
+        except KrakenError as e:
+            print(e.message)
             return None
+        if result is not None:
+            return result[0]
+        return None
+
+    def crack_sessions(self, sessions, finished, verbose=False, progress=None):
+        """
+        Reconstruct the session keys of several sessions. The burst sets of all sessions share the configured
+        Kraken servers, the remaining requests of a session are cancelled as soon as its key is verified.
 
+        :param sessions: a list of (session, burst sets) tuples, the burst sets as A5BurstSetBatch or
+        list of A5BurstSet.
+        :param finished: a function taking the session, the Kc as hex string and the burst set it was found with.
+        It is called once per session, with None for Kc and burst set if no key was found.
+        :param verbose: if True, candidate keys are printed.
+        :param progress: an optional function that is called with every burst set when it is submitted.
+        :return: False if the Kraken servers could not be reached, True otherwise.
+        """
         try:
-            sock.connect(remote_address)
-        except socket.error as e:
-            sock.close()
-            sock = None
-            print("Connection error")
-            return None
+            self.__pool.crack_sessions(sessions, self.__verifier(verbose), finished, progress)
+        except KrakenError as e:
+            print(e.message)
+            return False
+        return True
 
-        burst_xored = KrakenA51ReconstructorAdapter.xor(kraken_burst.burst_data_cipher, kraken_burst.burst_data_plain)
-        sock.send("crack " + burst_xored + "\n")
+    def __verifier(self, verbose):
+        def verify(batch, index, found_keys):
+            if verbose:
+                for key, bitpos in found_keys:
+                    print "Candidate %s @ %s for burst %s" % (key, bitpos, batch.frame_numbers[index])
+            return self.verify_burst_set(batch, index, found_keys, verbose)
 
-        while True:
-            msg = sock.recv(1024)
-            if not msg:
-                break
-            else:
-                lines = msg.splitlines()
-                for line in lines:
-                    if "crack #" in line:
-                        # not found:
-                        failed = True
-                    elif "Cracking #" in line:
-                        pass
-                    elif "Found " in line:
-                        msg_parts = line.split(" ")
-                        found_key = msg_parts[1]
-                        bitpos = msg_parts[3]
-                        table = msg_parts[7].replace("(table:", "").replace(")", "")
-
-                        if verbose:
-                            print "Candidate %s in table %s" % (found_key, table)
-
-                        fn_count = KrakenA51ReconstructorAdapter.fn2count(kraken_burst.frame_number)
-                        check_fn_count = KrakenA51ReconstructorAdapter.fn2count(kraken_burst.check_frame_number)
-                        check_burst_xored = KrakenA51ReconstructorAdapter.xor(kraken_burst.check_burst_data_cipher,
-                                                                              kraken_burst.check_burst_data_plain)
-
-                        found_key = KrakenA51ReconstructorAdapter.verify_key(found_key, bitpos, fn_count,
-                                                                             check_fn_count,
-                                                                             check_burst_xored, verbose)
-                        if found_key is not None:
-                            cracked = True
-
-                    if cracked or failed:
-                        break
-
-                if cracked or failed:
-                    break
+        return verify
 
-        if sock is not None:
-            sock.close()
-        if cracked:
-            return found_key
-        return None
+    def send2kraken(self, kraken_burst, verbose=False):
+        return self.crack([kraken_burst], verbose)
+
+    def close(self):
+        self.__pool.close()
+        self.scheduler.save()
 
     @staticmethod
-    def verify_key(found_key, bitpos, framecount, check_framecount, check_burst, verbose=False):
-        # todo: error handling if find_kc not found
-        cmd = "find_kc %s %s %s %s %s " % (found_key, bitpos, framecount, check_framecount, check_burst)
-        output = subprocess.check_output([cmd], shell=True, stderr=subprocess.STDOUT)
-        # print(output)
-        key = None
+    def verify_burst_set(batch, index, found_keys, verbose=False):
+        fn_count = KrakenA51ReconstructorAdapter.fn2count(int(batch.frame_numbers[index]))
+        check_fn_count = KrakenA51ReconstructorAdapter.fn2count(int(batch.check_frame_numbers[index]))
+        check_burst_xored = batch.check_keystreams(index)
+        return KrakenA51ReconstructorAdapter.verify_key(found_keys, fn_count, check_fn_count, check_burst_xored,
+                                                        verbose)
+
+    @staticmethod
+    def verify_key(found_keys, framecount, check_framecount, check_burst, verbose=False):
+        """
+        Backclock the states found by Kraken to Kc and check the keys against the verification burst.
+
+        :param found_keys: a list of (state as hex string, bit position) tuples as reported by Kraken.
+        :param framecount: the frame count of the cracked burst.
+        :param check_framecount: the frame count of the verification burst.
+        :param check_burst: the keystream of the verification burst as bits or string of '0' and '1'.
+        :return: the Kc as hex string or None.
+        """
+        candidates = [(int(key, 16), int(bitpos)) for key, bitpos in found_keys]
+        keys = a51.find_kc(candidates, framecount, check_framecount, check_burst)
         if verbose:
-            mismatch_count = output.count("mismatch")
-            match_count = output.count("*** MATCHED ***")
-            print "Backclocking results in %s possible keys, %s match" % (mismatch_count + match_count, match_count)
-
-        if "*** MATCHED ***" in output:
-            output_lines = output.split('\n')
-            for line in output_lines:
-                if "*** MATCHED ***" in line:
-                    parts = line.split(' ')
-                    key = parts[1] + parts[2] + parts[3] + parts[4] + parts[5] + parts[6] + parts[7] + parts[8]
-            return key
+            print "Backclocking results in %s matching keys" % len(keys)
+        if keys:
+            return keys[0]
         return None
 
     @staticmethod
     def xor(burst_unencrypted, burst_encrypted):
-        r = ""
-        for i in range(114):
-            a = ord(burst_unencrypted[i])
-            b = ord(burst_encrypted[i])
-            r += chr(48 ^ a ^ b)
-        return r
+        return bits_to_string(bits_from_strings([burst_unencrypted[:114]]) ^ bits_from_strings([burst_encrypted[:114]]))
 
     @staticmethod
     def fn2count(fn):
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import math
+import os
+
+import numpy
+
+# probability that the guessed plaintext of a burst set is right: LAPDm fill frames are sent in almost every
+# session, the System Information on SACCH is a guess of the message type and of the timing advance. The
+# timing advance of a mobile rarely changes, so the neighbours of the observed timing advance are unlikely.
+PLAINTEXT_CONFIDENCE = {"LAPDm": 0.9, "SACCH": 0.6, "SACCH TA": 0.1}
+DEFAULT_CONFIDENCE = 0.5
+
+# the channel the plaintext of a kind is sent on, the attacks on the channels race each other
+CHANNELS = {"LAPDm": "SDCCH", "SACCH": "SACCH", "SACCH TA": "SACCH"}
+
+# fraction of the keyspace covered by the tables, i.e. the probability that a correct keystream is found
+TABLE_COVERAGE = 0.15
+
+# weight of the prior against the observed hits, in burst sets
+PRIOR_WEIGHT = 20
+
+
+class KrakenScheduler(object):
+    """
+    Orders burst sets by the probability that Kraken finds their keystream and it leads to the key.
+
+    The score of a burst set is the hit rate of the kind of its plaintext times the probability that
+    the cipher and the verification burst were received without bit errors. The hit rate starts with
+    the plaintext confidence and is refined with the hits observed in previous sessions, which are kept
+    in a statistics file.
+    """
+
+    def __init__(self, statistics_file=None):
+        """
+        :param statistics_file: file the hit statistics are kept in, None to keep them in memory only.
+        """
+        self.statistics_file = statistics_file
+        self.statistics = dict()  # kind -> [submitted burst sets, hits]
+        self.__load()
+
+    def hit_rate(self, kind):
+        """
+        :return: the estimated probability that a burst set of a kind leads to the key.
+        """
+        prior = PLAINTEXT_CONFIDENCE.get(kind, DEFAULT_CONFIDENCE) * TABLE_COVERAGE
+        submitted, hits = self.statistics.get(kind, (0, 0))
+        return (hits + prior * PRIOR_WEIGHT) / float(submitted + PRIOR_WEIGHT)
+
+    @staticmethod
+    def error_free(snr_db):
+        """
+        :return: the probability that a burst payload is received without bit errors, 1.0 if the SNR
+        is not known. A SNR of 0 is treated as not measured.
+        """
+        if snr_db is None or snr_db <= 0:
+            return 1.0
+        # bit error rate of coherently detected GMSK
+        ber = 0.5 * math.erfc(math.sqrt(10 ** (snr_db / 10.0)))
+        return (1.0 - ber) ** 114
+
+    def score(self, kind, snr_db=None, check_snr_db=None):
+        return self.hit_rate(kind) * self.error_free(snr_db) * self.error_free(check_snr_db)
+
+    def schedule(self, batch, kinds, snr=None, race=True, weights=None):
+        """
+        Order burst sets by their score, burst sets with the same score stay in frame order.
+
+        :param batch: an A5BurstSetBatch.
+        :param kinds: the kind of the plaintext of every burst set, e.g. "LAPDm" or "SACCH".
+        :param snr: a dictionary mapping framenumbers to the SNR of the bursts in dB, None if not known.
+        :param race: if True, the channels take turns, so the attacks on the SDCCH and SACCH run concurrently and
+        the fastest one wins. Within a channel the burst sets stay ordered by score. Otherwise the burst sets are
+        ordered by score only.
+        :param weights: an optional dictionary with factors for the scores of kinds, e.g. the probability that
+        the plaintext of a kind is used by the cell.
+        :return: a tuple of the ordered batch and the ordered kinds.
+        """
+        if snr is None:
+            snr = dict()
+        if weights is None:
+            weights = dict()
+        scores = numpy.array([weights.get(kinds[i], 1.0) *
+                              self.score(kinds[i], snr.get(int(batch.frame_numbers[i])),
+                                         snr.get(int(batch.check_frame_numbers[i]))) for i in range(len(batch))])
+        order = numpy.lexsort((batch.frame_numbers, -scores))
+        if race:
+            # the rank of every burst set among the burst sets of its channel decides the turn
+            rank = numpy.zeros(len(batch), dtype=numpy.int64)
+            counts = dict()
+            for i in order:
+                channel = CHANNELS.get(kinds[i], kinds[i])
+                rank[i] = counts.get(channel, 0)
+                counts[channel] = rank[i] + 1
+            order = numpy.lexsort((batch.frame_numbers, -scores, rank))
+        return batch.take(order), [kinds[i] for i in order]
+
+    def submitted(self, kind):
+        """
+        Count a burst set of a kind that was sent to Kraken.
+        """
+        self.statistics.setdefault(kind, [0, 0])[0] += 1
+
+    def found(self, kind):
+        """
+        Count a burst set of a kind that led to the key.
+        """
+        self.statistics.setdefault(kind, [0, 0])[1] += 1
+
+    def save(self):
+        if self.statistics_file is None:
+            return
+        try:
+            with open(self.statistics_file, "w") as f:
+                f.write("# kind\tsubmitted\thits\n")
+                for kind in sorted(self.statistics):
+                    f.write("%s\t%s\t%s\n" % (kind, self.statistics[kind][0], self.statistics[kind][1]))
+        except IOError:
+            pass  # the statistics are kept in memory only
+
+    def __load(self):
+        if self.statistics_file is None or not os.path.isfile(self.statistics_file):
+            return
+        with open(self.statistics_file) as f:
+            for line in f:
+                parts = line.split("\t")
+                if len(parts) == 3 and not line.startswith("#"):
+                    self.statistics[parts[0]] = [int(parts[1]), int(parts[2])]
+
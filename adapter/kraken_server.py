@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import random
+import socket
+import threading
+from SocketServer import StreamRequestHandler, ThreadingTCPServer
+
+from core.gsm import a51
+
+# the table ids of the Berlin A5/1 rainbow tables
+TABLE_IDS = [100, 108, 116, 124, 132, 140, 148, 156, 164, 172, 180, 188, 196, 204, 212, 220, 230, 238, 250, 260,
+             268, 276, 292, 324, 332, 340, 348, 356, 364, 372, 380, 388, 396, 404, 412, 420, 428, 436, 492, 500]
+
+# Kraken needs 64 consecutive keystream bits, so a state is found at bit position 0 up to 50 of a burst
+MAX_BITPOS = a51.BURST_KEYSTREAM_LENGTH - 64
+
+
+class KrakenStandInServer(ThreadingTCPServer):
+    """
+    A local stand-in for a Kraken server, for testing and benchmarking without the rainbow tables.
+
+    The server speaks the line protocol of Kraken: a crack request is acknowledged with "Cracking #<id>",
+    after the configured latency the states found are reported with "Found" and the job is finished with
+    "crack #<id> took <n> msec". It only finds keystreams of the keys it was seeded with, and of these only
+    a fraction given by the hit rate, like the tables cover only a part of the keyspace.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host="localhost", port=9999, latency=1.0, jitter=0.0, hit_rate=1.0, seed=None):
+        """
+        :param latency: seconds a crack request takes.
+        :param jitter: maximum seconds added randomly to the latency of a request.
+        :param hit_rate: probability that the keystream of a seeded key is found.
+        :param seed: seed of the random decisions, None for a random seed.
+        """
+        ThreadingTCPServer.__init__(self, (host, port), KrakenStandInHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.hit_rate = hit_rate
+        self.seed = random.random() if seed is None else seed
+        self.states = dict()  # keystream -> (state, bitpos)
+        self.requests = 0
+        self.__job_id = 0
+        self.__lock = threading.Lock()
+        self.__thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def add_keys(self, kc, counts):
+        """
+        Seed the server with the keystreams of a key.
+
+        :param kc: Kc as hex string.
+        :param counts: the frame counts of the keystreams, e.g. as returned by fn2count.
+        """
+        keystreams = a51.burst_keystreams(int(kc, 16), counts) + ord("0")
+        for i, count in enumerate(counts):
+            bitpos = random.Random("%s%s%s" % (self.seed, kc, count)).randint(0, MAX_BITPOS)
+            # the state that outputs keystream bit bitpos, as reported by Kraken
+            state = a51.pack(*a51.advance(*a51.load(int(kc, 16), count), clocks=a51.MIXING_CLOCKS + 1 + bitpos))
+            self.states[keystreams[i].tostring()] = ("%016x" % int(state[()]), bitpos)
+
+    def lookup(self, keystream):
+        """
+        :return: the list of (state as hex string, bitpos) tuples found for a keystream.
+        """
+        if keystream not in self.states:
+            return []
+        # the decision only depends on the keystream, so a request that is repeated gets the same answer
+        if random.Random("%s%s" % (self.seed, keystream)).random() >= self.hit_rate:
+            return []
+        return [self.states[keystream]]
+
+    def delay(self):
+        return self.latency + random.uniform(0, self.jitter)
+
+    def next_job_id(self):
+        with self.__lock:
+            job_id = self.__job_id
+            self.__job_id += 1
+            self.requests += 1
+            return job_id
+
+    def start(self):
+        """
+        Serve in a background thread.
+        """
+        self.__thread = threading.Thread(target=self.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class KrakenStandInHandler(StreamRequestHandler):
+    def setup(self):
+        StreamRequestHandler.setup(self)
+        self.jobs = dict()  # job id -> timer of the running job
+        self.lock = threading.Lock()
+
+    def handle(self):
+        try:
+            for line in iter(self.rfile.readline, ""):
+                parts = line.split()
+                if len(parts) == 2 and parts[0] == "crack" and len(parts[1]) == a51.BURST_KEYSTREAM_LENGTH:
+                    self.crack(parts[1])
+                elif len(parts) == 2 and parts[0] == "cancel" and parts[1].isdigit():
+                    self.cancel(int(parts[1]))
+        except socket.error:
+            pass  # the client disconnected
+        finally:
+            with self.lock:
+                for timer in self.jobs.values():
+                    timer.cancel()
+                self.jobs.clear()
+
+    def crack(self, keystream):
+        job_id = self.server.next_job_id()
+        self.send("Cracking #%s %s\n" % (job_id, keystream))
+        delay = self.server.delay()
+        timer = threading.Timer(delay, self.report, (job_id, keystream, delay))
+        timer.daemon = True
+        with self.lock:
+            self.jobs[job_id] = timer
+        timer.start()
+
+    def cancel(self, job_id):
+        with self.lock:
+            timer = self.jobs.pop(job_id, None)
+        if timer is not None:
+            timer.cancel()
+
+    def report(self, job_id, keystream, delay):
+        with self.lock:
+            if self.jobs.pop(job_id, None) is None:
+                return
+        lines = ["Found %s @ %s  #%s  (table:%s)\n" % (state, bitpos, job_id, random.choice(TABLE_IDS))
+                 for state, bitpos in self.server.lookup(keystream)]
+        lines.append("crack #%s took %d msec\n" % (job_id, delay * 1000))
+        self.send("".join(lines))
+
+    def send(self, data):
+        try:
+            with self.lock:
+                self.wfile.write(data)
+                self.wfile.flush()
+        except socket.error:
+            pass  # the client disconnected
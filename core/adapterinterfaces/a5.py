@@ -1,6 +1,12 @@
 # -*- coding: utf-8 -*-
 from abc import abstractmethod
 
+import numpy
+
+BURST_PAYLOAD_LENGTH = 114
+
+_batch_fields = ["frame_numbers", "cipher", "plain", "check_frame_numbers", "check_cipher", "check_plain"]
+
 
 class A5ReconstructionAdapter(object):
     lapdm_ui = [
@@ -36,3 +42,134 @@ class A5BurstSet(object):
         self.check_frame_number = check_frame_number
         self.check_burst_data_cipher = check_burst_data_cipher
         self.check_burst_data_plain = check_burst_data_plain
+
+
+class A5BurstSetBatch(object):
+    """
+    A batch of burst sets backed by NumPy arrays, one row per burst set.
+
+    The payloads are packed into uint8 matrices of shape (number of burst sets, 15) holding eight bits per element,
+    so the keystreams of the whole batch are computed with a single XOR on an eighth of the data. They are unpacked
+    to one bit per element where the bits are used, e.g. for the requests to Kraken and the verification.
+    """
+
+    def __init__(self, frame_numbers, cipher, plain, check_frame_numbers, check_cipher, check_plain):
+        """
+        The payloads are given as uint8 matrices of shape (number of burst sets, 114) holding one bit per element.
+        """
+        self.frame_numbers = numpy.asarray(frame_numbers, dtype=numpy.int64)
+        self.cipher = pack_bits(cipher)
+        self.plain = pack_bits(plain)
+        self.check_frame_numbers = numpy.asarray(check_frame_numbers, dtype=numpy.int64)
+        self.check_cipher = pack_bits(check_cipher)
+        self.check_plain = pack_bits(check_plain)
+
+    def __len__(self):
+        return len(self.frame_numbers)
+
+    def __getitem__(self, index):
+        """
+        Get a single burst set.
+
+        :rtype: A5BurstSet
+        """
+        return A5BurstSet(int(self.frame_numbers[index]), bits_to_string(unpack_bits(self.cipher[index])),
+                          bits_to_string(unpack_bits(self.plain[index])), int(self.check_frame_numbers[index]),
+                          bits_to_string(unpack_bits(self.check_cipher[index])),
+                          bits_to_string(unpack_bits(self.check_plain[index])))
+
+    def keystreams(self, indices=None):
+        """
+        :param indices: an index or indices of burst sets, None for all burst sets.
+        :return: the keystreams of the bursts as uint8 matrix holding one bit per element.
+        """
+        indices = slice(None) if indices is None else indices
+        return unpack_bits(self.cipher[indices] ^ self.plain[indices])
+
+    def check_keystreams(self, indices=None):
+        """
+        :param indices: an index or indices of burst sets, None for all burst sets.
+        :return: the keystreams of the verification bursts as uint8 matrix holding one bit per element.
+        """
+        indices = slice(None) if indices is None else indices
+        return unpack_bits(self.check_cipher[indices] ^ self.check_plain[indices])
+
+    def take(self, indices):
+        """
+        Select burst sets.
+
+        :param indices: the indices of the burst sets, in the order of the new batch.
+        :rtype: A5BurstSetBatch
+        """
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        return A5BurstSetBatch.__packed([getattr(self, name)[indices] for name in _batch_fields])
+
+    @staticmethod
+    def concatenate(batches):
+        batches = [batch for batch in batches if batch is not None]
+        if not batches:
+            return A5BurstSetBatch.empty()
+        return A5BurstSetBatch.__packed([numpy.concatenate([getattr(b, name) for b in batches])
+                                         for name in _batch_fields])
+
+    @staticmethod
+    def empty():
+        bits = numpy.zeros((0, BURST_PAYLOAD_LENGTH), dtype=numpy.uint8)
+        return A5BurstSetBatch([], bits, bits, [], bits, bits)
+
+    @staticmethod
+    def from_burst_sets(burst_sets):
+        """
+        Create a batch from a list of A5BurstSet.
+        """
+        if not burst_sets:
+            return A5BurstSetBatch.empty()
+        return A5BurstSetBatch([b.frame_number for b in burst_sets],
+                               bits_from_strings([b.burst_data_cipher for b in burst_sets]),
+                               bits_from_strings([b.burst_data_plain for b in burst_sets]),
+                               [b.check_frame_number for b in burst_sets],
+                               bits_from_strings([b.check_burst_data_cipher for b in burst_sets]),
+                               bits_from_strings([b.check_burst_data_plain for b in burst_sets]))
+
+    @staticmethod
+    def __packed(fields):
+        # the fields are taken from other batches, the payloads are packed already
+        batch = A5BurstSetBatch.__new__(A5BurstSetBatch)
+        for name, value in zip(_batch_fields, fields):
+            setattr(batch, name, value)
+        return batch
+
+
+def pack_bits(bits):
+    """
+    Pack payloads holding one bit per element into eight bits per element.
+
+    :param bits: an uint8 matrix of shape (number of payloads, 114).
+    :return: an uint8 matrix of shape (number of payloads, 15).
+    """
+    bits = numpy.asarray(bits, dtype=numpy.uint8).reshape(-1, BURST_PAYLOAD_LENGTH)
+    return numpy.packbits(bits, axis=1)
+
+
+def unpack_bits(packed):
+    """
+    Unpack payloads packed by pack_bits.
+
+    :param packed: a packed payload or a matrix of packed payloads.
+    :return: the payloads holding one bit per element.
+    """
+    return numpy.unpackbits(packed, axis=-1)[..., :BURST_PAYLOAD_LENGTH]
+
+
+def bits_from_strings(strings):
+    """
+    Convert payloads given as strings of '0' and '1' into an uint8 matrix.
+    """
+    return (numpy.frombuffer("".join(strings), dtype=numpy.uint8).reshape(len(strings), -1) - ord("0"))
+
+
+def bits_to_string(bits):
+    """
+    Convert the bits of a payload into a string of '0' and '1'.
+    """
+    return (numpy.asarray(bits, dtype=numpy.uint8) + ord("0")).tostring()
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+A5/1 stream cipher, vectorized over many cipher states with NumPy.
+
+Register layout and bit numbering follow the reference implementation by Briceno, Goldberg and Wagner.
+A packed 64-bit state holds R1 in bits 0-18, R2 in bits 19-40 and R3 in bits 41-63, which is the format
+of the states reported by Kraken.
+"""
+import numpy
+
+R1_LENGTH = 19
+R2_LENGTH = 22
+R3_LENGTH = 23
+
+R1_MASK = (1 << R1_LENGTH) - 1
+R2_MASK = (1 << R2_LENGTH) - 1
+R3_MASK = (1 << R3_LENGTH) - 1
+
+R1_TAPS = 0x072000  # bits 13, 16, 17, 18
+R2_TAPS = 0x300000  # bits 20, 21
+R3_TAPS = 0x700080  # bits 7, 20, 21, 22
+
+R1_CLOCK_BIT = 8
+R2_CLOCK_BIT = 10
+R3_CLOCK_BIT = 10
+
+KEY_LENGTH = 64
+COUNT_LENGTH = 22
+MIXING_CLOCKS = 100
+BURST_KEYSTREAM_LENGTH = 114
+
+# registers that are clocked, for every possible outcome of the majority rule
+_clock_patterns = [(True, True, True), (True, True, False), (True, False, True), (False, True, True)]
+
+
+def _parity(x):
+    x = x ^ (x >> 16)
+    x ^= x >> 8
+    x ^= x >> 4
+    x ^= x >> 2
+    x ^= x >> 1
+    return x & 1
+
+
+def _clock(register, mask, taps):
+    return ((register << 1) & mask) | _parity(register & taps)
+
+
+def _unclock(register, length, taps):
+    # the bit shifted out at the top is the only unknown, it follows from the feedback bit at the bottom
+    previous = register >> 1
+    top = (register & 1) ^ _parity(previous & (taps & ~(1 << (length - 1))))
+    return previous | (top << (length - 1))
+
+
+def _majority_bits(r1, r2, r3):
+    b1 = (r1 >> R1_CLOCK_BIT) & 1
+    b2 = (r2 >> R2_CLOCK_BIT) & 1
+    b3 = (r3 >> R3_CLOCK_BIT) & 1
+    majority = (b1 & b2) | (b1 & b3) | (b2 & b3)
+    return b1 == majority, b2 == majority, b3 == majority
+
+
+def pack(r1, r2, r3):
+    """
+    Pack the registers into 64-bit states.
+    """
+    return (numpy.asarray(r1, dtype=numpy.uint64) | (numpy.asarray(r2, dtype=numpy.uint64) << numpy.uint64(19)) |
+            (numpy.asarray(r3, dtype=numpy.uint64) << numpy.uint64(41)))
+
+
+def unpack(states):
+    """
+    Unpack 64-bit states into the three registers.
+
+    :return: a tuple of int64 arrays (r1, r2, r3).
+    """
+    states = numpy.atleast_1d(numpy.asarray(states, dtype=numpy.uint64))
+    return ((states & numpy.uint64(R1_MASK)).astype(numpy.int64),
+            ((states >> numpy.uint64(19)) & numpy.uint64(R2_MASK)).astype(numpy.int64),
+            ((states >> numpy.uint64(41)) & numpy.uint64(R3_MASK)).astype(numpy.int64))
+
+
+def clock_regular(r1, r2, r3, bits=0):
+    """
+    Clock all registers once and add an input bit, as done while loading Kc and the frame count.
+    """
+    return (_clock(r1, R1_MASK, R1_TAPS) ^ bits, _clock(r2, R2_MASK, R2_TAPS) ^ bits,
+            _clock(r3, R3_MASK, R3_TAPS) ^ bits)
+
+
+def clock_majority(r1, r2, r3):
+    """
+    Clock the registers whose clocking bit agrees with the majority.
+    """
+    c1, c2, c3 = _majority_bits(r1, r2, r3)
+    return (numpy.where(c1, _clock(r1, R1_MASK, R1_TAPS), r1), numpy.where(c2, _clock(r2, R2_MASK, R2_TAPS), r2),
+            numpy.where(c3, _clock(r3, R3_MASK, R3_TAPS), r3))
+
+
+def output_bit(r1, r2, r3):
+    return ((r1 >> (R1_LENGTH - 1)) ^ (r2 >> (R2_LENGTH - 1)) ^ (r3 >> (R3_LENGTH - 1))) & 1
+
+
+def load(kc, count):
+    """
+    Compute the state after loading Kc and the frame count, before the mixing clocks.
+
+    :param kc: Kc as integer, key bit i is bit (i % 8) of byte i / 8.
+    :param count: the 22-bit frame count.
+    :return: the registers as a tuple of ints.
+    """
+    r1 = r2 = r3 = 0
+    for i in range(KEY_LENGTH):
+        byte = (kc >> (8 * (7 - i // 8))) & 0xff
+        r1, r2, r3 = clock_regular(r1, r2, r3, (byte >> (i & 7)) & 1)
+    for i in range(COUNT_LENGTH):
+        r1, r2, r3 = clock_regular(r1, r2, r3, (count >> i) & 1)
+    return r1, r2, r3
+
+
+def advance(r1, r2, r3, clocks):
+    """
+    Clock the registers a number of times with the majority rule.
+    """
+    for i in range(clocks):
+        r1, r2, r3 = clock_majority(r1, r2, r3)
+    return r1, r2, r3
+
+
+def keystream(r1, r2, r3, length=BURST_KEYSTREAM_LENGTH, mixing=MIXING_CLOCKS):
+    """
+    Generate keystream for many states at once.
+
+    :param r1, r2, r3: int64 arrays with the loaded registers of every state.
+    :param length: number of keystream bits.
+    :param mixing: number of majority clocks without output before the first keystream bit.
+    :return: an uint8 array of shape (number of states, length).
+    """
+    r1, r2, r3 = advance(*(numpy.atleast_1d(numpy.asarray(r, dtype=numpy.int64)) for r in (r1, r2, r3)),
+                         clocks=mixing)
+    result = numpy.zeros((len(r1), length), dtype=numpy.uint8)
+    for i in range(length):
+        r1, r2, r3 = clock_majority(r1, r2, r3)
+        result[:, i] = output_bit(r1, r2, r3)
+    return result
+
+
+def loaded_states(kc, counts):
+    """
+    Compute the states after loading a key with many frame counts at once. Loading is linear, so the state is
+    the xor of the state of Kc alone and the states of the set bits of the frame count.
+
+    :param kc: Kc as integer.
+    :param counts: the frame counts.
+    :return: the packed 64-bit states as uint64 array.
+    """
+    global _count_states
+    if _count_states is None:
+        _count_states = numpy.array([_state_of(0, 1 << i) for i in range(COUNT_LENGTH)], dtype=numpy.uint64)
+    counts = numpy.asarray(counts, dtype=numpy.int64)
+    bits = ((counts[:, None] >> numpy.arange(COUNT_LENGTH)) & 1).astype(bool)
+    states = numpy.bitwise_xor.reduce(numpy.where(bits, _count_states, numpy.uint64(0)), axis=1)
+    return states ^ numpy.uint64(_state_of(kc, 0))
+
+
+def burst_keystreams(kc, counts, length=BURST_KEYSTREAM_LENGTH):
+    """
+    Generate the keystreams of a key for several frames.
+
+    :param kc: Kc as integer.
+    :param counts: the frame counts.
+    :param length: number of keystream bits per frame, 228 for the downlink followed by the uplink keystream.
+    :return: an uint8 array of shape (len(counts), length).
+    """
+    if len(counts) == 0:
+        return numpy.zeros((0, length), dtype=numpy.uint8)
+    return keystream(*unpack(loaded_states(kc, counts)), length=length)
+
+
+def frame_counts(frame_numbers):
+    """
+    Compute the frame counts (T1, T3, T2) the keystream of a frame is generated with, vectorized.
+
+    :param frame_numbers: the TDMA frame numbers.
+    :return: an int64 array with the 22-bit frame counts.
+    """
+    frame_numbers = numpy.asarray(frame_numbers, dtype=numpy.int64)
+    return ((frame_numbers // 1326) << 11) | ((frame_numbers % 51) << 5) | (frame_numbers % 26)
+
+
+def backclock(states, steps):
+    """
+    Find all states that result in the given states after a number of majority clocks.
+    The majority rule is not invertible, so a state can have none or several predecessors.
+
+    :param states: packed 64-bit states.
+    :param steps: number of clocks to go back, an int or an array with one entry per state.
+    :return: a tuple of the packed predecessor states and the index of the state each one belongs to.
+    """
+    r1, r2, r3 = unpack(states)
+    origin = numpy.arange(len(r1))
+    remaining = numpy.zeros(len(r1), dtype=numpy.int64) + steps
+
+    while numpy.any(remaining > 0):
+        active = remaining > 0
+        a1, a2, a3 = r1[active], r2[active], r3[active]
+        u1, u2, u3 = _unclock(a1, R1_LENGTH, R1_TAPS), _unclock(a2, R2_LENGTH, R2_TAPS), _unclock(a3, R3_LENGTH,
+                                                                                                  R3_TAPS)
+        parts = [(r1[~active], r2[~active], r3[~active], origin[~active], remaining[~active])]
+        for pattern in _clock_patterns:
+            p1 = u1 if pattern[0] else a1
+            p2 = u2 if pattern[1] else a2
+            p3 = u3 if pattern[2] else a3
+            # the predecessor is only valid if the majority rule clocks exactly these registers
+            c1, c2, c3 = _majority_bits(p1, p2, p3)
+            valid = (c1 == pattern[0]) & (c2 == pattern[1]) & (c3 == pattern[2])
+            parts.append((p1[valid], p2[valid], p3[valid], origin[active][valid], remaining[active][valid] - 1))
+
+        r1, r2, r3, origin, remaining = (numpy.concatenate(column) for column in zip(*parts))
+
+    return pack(r1, r2, r3), origin
+
+
+def _state_of(kc, count):
+    return int(pack(*load(kc, count))[()])
+
+
+def _key_setup_inverse():
+    # loading Kc is linear over GF(2), so Kc can be recovered from the loaded state by a matrix inversion.
+    # the rows are solved by gaussian elimination on the columns, i.e. the states of the unit keys.
+    columns = [_state_of(1 << (KEY_LENGTH - 1 - (8 * (i // 8) + 7 - (i & 7))), 0) for i in range(KEY_LENGTH)]
+    rows = []  # (state mask, key mask) pairs
+    for key_bit, column in enumerate(columns):
+        key_mask = 1 << key_bit
+        for state_mask, row_key_mask in rows:
+            if column & (state_mask & -state_mask):
+                column ^= state_mask
+                key_mask ^= row_key_mask
+        if column == 0:
+            raise ValueError("A5/1 key setup is not invertible")
+        pivot = column & -column
+        rows = [(s ^ column, k ^ key_mask) if s & pivot else (s, k) for s, k in rows]
+        rows.append((column, key_mask))
+    # the pivot of every row is its lowest set bit, state bit p contributes to the key bits in its key mask
+    inverse = [0] * KEY_LENGTH
+    for state_mask, key_mask in rows:
+        pivot = (state_mask & -state_mask).bit_length() - 1
+        inverse[pivot] = key_mask
+    return inverse
+
+
+_inverse = None
+_count_states = None
+
+
+def kc_from_state(state):
+    """
+    Recover Kc from the state right after loading Kc with a frame count of 0.
+
+    :param state: the packed 64-bit state.
+    :return: Kc as integer.
+    """
+    global _inverse
+    if _inverse is None:
+        _inverse = _key_setup_inverse()
+    key_bits = 0
+    for pivot in range(KEY_LENGTH):
+        if (state >> pivot) & 1:
+            key_bits ^= _inverse[pivot]
+    kc = 0
+    for i in range(KEY_LENGTH):
+        if (key_bits >> i) & 1:
+            kc |= 1 << (KEY_LENGTH - 1 - (8 * (i // 8) + 7 - (i & 7)))
+    return kc
+
+
+def find_kc(candidates, count, check_count, check_keystream):
+    """
+    Recover Kc from the internal states found by Kraken and verify it against a second burst.
+    All candidates are processed as one batch.
+
+    :param candidates: a list of (state, bitpos) tuples, where state is the packed state that outputs
+    keystream bit bitpos of the burst.
+    :param count: the frame count of the burst the states were found in.
+    :param check_count: the frame count of the verification burst.
+    :param check_keystream: the 114 keystream bits of the verification burst, as bits or string of '0' and '1'.
+    :return: a list of the verified Kc as hex strings.
+    """
+    if not candidates:
+        return []
+    states = numpy.array([state for state, bitpos in candidates], dtype=numpy.uint64)
+    steps = numpy.array([MIXING_CLOCKS + 1 + bitpos for state, bitpos in candidates], dtype=numpy.int64)
+    loaded, origin = backclock(states, steps)
+    if len(loaded) == 0:
+        return []
+
+    # the loaded state is the xor of the states of Kc and the frame count alone
+    key_states = loaded ^ numpy.uint64(_state_of(0, count))
+    check_states = key_states ^ numpy.uint64(_state_of(0, check_count))
+    expected = numpy.array([int(b) for b in check_keystream], dtype=numpy.uint8)
+    matches = numpy.all(keystream(*unpack(check_states)) == expected, axis=1)
+
+    result = []
+    for state in numpy.unique(key_states[matches]):
+        kc = "%016x" % kc_from_state(int(state))
+        if kc not in result:
+            result.append(kc)
+    return result
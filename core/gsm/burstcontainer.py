@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+import bz2
+import os
+import struct
+import tempfile
+import zlib
+
+import numpy
+
+from core.gsm.burstfile import BURST_LENGTH, BurstFileError
+from core.gsm.burstindex import BurstFileIndex
+from core.gsm.burstreader import BurstArrayReader, BurstFileReader, burst_dtype
+
+CONTAINER_MAGIC = "GATBURST"
+CONTAINER_VERSION = 1
+
+# file header: magic, version
+_file_header = struct.Struct("<8sH")
+# chunk header: number of bursts, compressor, size of the (compressed) chunk data,
+# lowest and highest frame number in the chunk
+_chunk_header = struct.Struct("<IBIII")
+
+COMPRESSORS = ["none", "zlib", "bz2"]
+_compress = {
+    "none": lambda data: data,
+    "zlib": lambda data: zlib.compress(data, 6),
+    "bz2": lambda data: bz2.compress(data, 9),
+}
+_decompress = {
+    "none": lambda data: data,
+    "zlib": zlib.decompress,
+    "bz2": bz2.decompress,
+}
+
+DEFAULT_CHUNK_SIZE = 4096
+
+# columns of a chunk, in storage order. The frame numbers are stored as the first frame number followed
+# by the differences between consecutive frame numbers, the bits are packed 8 per byte.
+_columns = [("timeslot", "u1"), ("arfcn", "<u2"), ("sub_type", "u1"), ("sub_slot", "u1"), ("signal_dbm", "i1"),
+            ("snr_db", "i1")]
+_packed_burst_length = (BURST_LENGTH + 7) // 8
+
+
+def is_container(path):
+    """
+    Check if a file is a burst container.
+
+    :param path: path of the file.
+    :return: True, if the file starts with the container magic.
+    """
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(CONTAINER_MAGIC)) == CONTAINER_MAGIC
+    except IOError:
+        return False
+
+
+class BurstContainerWriter(object):
+    """
+    Writes bursts into the compact burst container format.
+
+    The bursts are grouped into chunks that are stored column by column: frame numbers delta-encoded,
+    GSMTAP header fields as arrays and the burst bits packed 8 per byte. Every chunk can be compressed.
+    """
+
+    def __init__(self, path, compressor="zlib", chunk_size=DEFAULT_CHUNK_SIZE):
+        if compressor not in COMPRESSORS:
+            raise BurstFileError("Unknown compressor %s" % compressor)
+        self.compressor = compressor
+        self.chunk_size = chunk_size
+        self.__pending = []
+        self.__pending_count = 0
+        self.__file = open(path, "wb")
+        self.__file.write(_file_header.pack(CONTAINER_MAGIC, CONTAINER_VERSION))
+
+    def write(self, bursts):
+        """
+        Append bursts to the container.
+
+        :param bursts: an array of burst_dtype.
+        """
+        packed = numpy.zeros(len(bursts), dtype=burst_dtype)
+        for name in burst_dtype.names:  # the fields of memory-mapped bursts have another layout
+            packed[name] = bursts[name]
+        self.__pending.append(packed)
+        self.__pending_count += len(bursts)
+        if self.__pending_count >= self.chunk_size:
+            pending = numpy.concatenate(self.__pending)
+            full = len(pending) - len(pending) % self.chunk_size
+            for start in range(0, full, self.chunk_size):
+                self.__write_chunk(pending[start:start + self.chunk_size])
+            self.__pending = [pending[full:]]
+            self.__pending_count = len(pending) - full
+
+    def close(self):
+        if self.__pending_count > 0:
+            self.__write_chunk(numpy.concatenate(self.__pending))
+        self.__pending = []
+        self.__pending_count = 0
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __write_chunk(self, bursts):
+        frame_numbers = bursts["frame_number"].astype(numpy.int64)
+        deltas = numpy.diff(frame_numbers).astype("<i4")
+        parts = [struct.pack("<I", int(frame_numbers[0])), deltas.tostring()]
+        for name, fmt in _columns:
+            parts.append(bursts[name].astype(fmt).tostring())
+        parts.append(numpy.packbits(bursts["bits"], axis=1).tostring())
+
+        data = _compress[self.compressor]("".join(parts))
+        self.__file.write(_chunk_header.pack(len(bursts), COMPRESSORS.index(self.compressor), len(data),
+                                             int(frame_numbers.min()), int(frame_numbers.max())))
+        self.__file.write(data)
+
+
+class BurstContainerReader(BurstArrayReader):
+    """
+    Reads a burst container into a NumPy structured array of burst_dtype.
+    If a frame number window is given, chunks outside the window are skipped without decompressing them.
+    """
+
+    def __init__(self, path, fnr_start=None, fnr_end=None):
+        super(BurstContainerReader, self).__init__()
+        self.burst_file = path
+        chunks = list(_iter_container_chunks(path, fnr_start, fnr_end))
+        if chunks:
+            self.bursts = numpy.concatenate(chunks)
+
+
+def _iter_container_chunks(path, fnr_start=None, fnr_end=None):
+    """
+    Decompress the chunks of a burst container one after the other, skipping the chunks outside of a frame
+    number window.
+
+    :return: a generator of arrays of burst_dtype.
+    """
+    with open(path, "rb") as f:
+        magic, version = _file_header.unpack(f.read(_file_header.size))
+        if magic != CONTAINER_MAGIC or version != CONTAINER_VERSION:
+            raise BurstFileError("%s is no burst container of version %s" % (path, CONTAINER_VERSION))
+
+        while True:
+            header = f.read(_chunk_header.size)
+            if len(header) < _chunk_header.size:
+                break
+            count, compressor, size, chunk_fnr_min, chunk_fnr_max = _chunk_header.unpack(header)
+            if (fnr_start is not None and chunk_fnr_max < fnr_start) or (
+                    fnr_end is not None and chunk_fnr_min > fnr_end):
+                f.seek(size, os.SEEK_CUR)
+                continue
+            data = f.read(size)
+            if len(data) < size:
+                break  # the last chunk is incomplete, e.g. because the capture is still running
+            yield _read_chunk(count, COMPRESSORS[compressor], data)
+
+
+def _read_chunk(count, compressor, data):
+    data = _decompress[compressor](data)
+    bursts = numpy.zeros(count, dtype=burst_dtype)
+
+    first = struct.unpack_from("<I", data, 0)[0]
+    pos = 4
+    deltas = numpy.frombuffer(data, dtype="<i4", count=count - 1, offset=pos)
+    pos += 4 * (count - 1)
+    bursts["frame_number"][0] = first
+    bursts["frame_number"][1:] = first + numpy.cumsum(deltas)
+
+    for name, fmt in _columns:
+        column = numpy.frombuffer(data, dtype=fmt, count=count, offset=pos)
+        bursts[name] = column
+        pos += column.nbytes
+
+    packed = numpy.frombuffer(data, dtype=numpy.uint8, count=count * _packed_burst_length, offset=pos)
+    bursts["bits"] = numpy.unpackbits(packed.reshape(count, _packed_burst_length), axis=1)[:, :BURST_LENGTH]
+    return bursts
+
+
+def open_burst_reader(path, fnr_start=None, fnr_end=None):
+    """
+    Open a reader for a burst file in either the grgsm or the container format.
+
+    :param path: path of the burst file.
+    :param fnr_start: first framenumber needed, a container reader only decompresses the chunks in the window.
+    :param fnr_end: last framenumber needed.
+    :rtype: BurstArrayReader
+    """
+    if is_container(path):
+        return BurstContainerReader(path, fnr_start, fnr_end)
+    return BurstFileReader(path)
+
+
+class BurstWindowReader(object):
+    """
+    Provides the bursts of many frame number windows of a burst file. A burst file in the grgsm format is mapped
+    once and the windows are located through its sidecar index, the chunks of a container are only decompressed
+    for the windows.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__reader = None if is_container(path) else BurstFileReader(path)
+
+    def window(self, fnr_start, fnr_end):
+        """
+        :return: a BurstArrayReader with at least the bursts of the window. It is closed with the BurstWindowReader.
+        :rtype: BurstArrayReader
+        """
+        if self.__reader is not None:
+            return self.__reader
+        return BurstContainerReader(self.path, fnr_start, fnr_end)
+
+    def chunks(self, fnr_start=None, fnr_end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Read the bursts in chunks, so the burst file does not need to fit into memory.
+
+        :param fnr_start: first framenumber needed, None for the beginning of the file.
+        :param fnr_end: last framenumber needed, None for the end of the file.
+        :param chunk_size: number of bursts per chunk of a burst file in the grgsm format, the chunks of a container
+        are read as they were written.
+        :return: a generator of arrays of burst_dtype in file order, which hold at least the bursts of the window.
+        """
+        if self.__reader is None:
+            for bursts in _iter_container_chunks(self.path, fnr_start, fnr_end):
+                yield bursts
+            return
+        first, last = self.__reader.window(fnr_start, fnr_end)
+        for start in range(first, last, chunk_size):
+            # the bursts are copied out of the mapped file, which is closed with the reader
+            view = self.__reader.bursts[start:min(start + chunk_size, last)]
+            bursts = numpy.zeros(len(view), dtype=burst_dtype)
+            for name in burst_dtype.names:
+                bursts[name] = view[name]
+            yield bursts
+
+    def arfcn(self, timeslot=None):
+        """
+        Get the ARFCN the bursts were received on from the first chunk with bursts on a timeslot.
+
+        :param timeslot: the timeslot of the bursts, None for all timeslots.
+        :return: the ARFCN without the GSMTAP band and uplink flags, None if there are no bursts on the timeslot.
+        """
+        for bursts in self.chunks():
+            arfcn = BurstArrayReader(bursts).get_arfcn(timeslot)
+            if arfcn is not None:
+                return arfcn
+        return None
+
+    def close(self):
+        if self.__reader is not None:
+            self.__reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def iter_burst_chunks(path, fnr_start=None, fnr_end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Read the bursts of a burst file, in the grgsm or the container format, in chunks.
+
+    :return: a generator of arrays of burst_dtype, see BurstWindowReader.chunks.
+    """
+    with BurstWindowReader(path) as reader:
+        for bursts in reader.chunks(fnr_start, fnr_end, chunk_size):
+            yield bursts
+
+
+def read_arfcn(path, timeslot=None):
+    """
+    Get the ARFCN a burst file was received on from its first bursts, without reading the whole file.
+
+    :param path: path of the burst file, in the grgsm or the container format.
+    :param timeslot: the timeslot of the bursts, None for all timeslots.
+    :return: the ARFCN without the GSMTAP band and uplink flags, None if there are no bursts on the timeslot.
+    """
+    with BurstWindowReader(path) as reader:
+        return reader.arfcn(timeslot)
+
+
+def import_burst_file(source, destination, compressor="zlib", chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Convert a burst file written by grgsm.burst_file_sink into a burst container.
+
+    :return: the number of converted bursts.
+    """
+    with BurstFileReader(source) as reader, BurstContainerWriter(destination, compressor, chunk_size) as writer:
+        for start in range(0, len(reader), chunk_size):
+            writer.write(reader.bursts[start:start + chunk_size])
+        return len(reader)
+
+
+def export_burst_file(source, destination):
+    """
+    Convert a burst container into a burst file in the format of grgsm.burst_file_sink.
+
+    :return: the number of converted bursts.
+    """
+    with BurstContainerReader(source) as reader:
+        reader.write(destination, numpy.arange(len(reader)))
+        return len(reader)
+
+
+class PlainBurstFile(object):
+    """
+    Context manager that provides a burst file in the format of grgsm.burst_file_source.
+    A burst container is exported to a temporary file, any other file (or None) is passed through.
+    """
+
+    def __init__(self, path):
+        self.source = path
+        self.path = None
+
+    def __enter__(self):
+        if self.source is None or not is_container(self.source):
+            return self.source
+        fd, self.path = tempfile.mkstemp(suffix=".bursts")
+        os.close(fd)
+        export_burst_file(self.source, self.path)
+        return self.path
+
+    def __exit__(self, type, value, traceback):
+        if self.path is not None and os.path.isfile(self.path):
+            os.remove(self.path)
+
+
+class BurstFileWindow(object):
+    """
+    Context manager that provides a temporary burst file in the format of grgsm.burst_file_source
+    holding only the bursts in a frame number window.
+    Bursts in the grgsm format are located through the sidecar index, containers are read chunk-wise,
+    so the cost depends on the size of the window only.
+    """
+
+    def __init__(self, burst_file, fnr_start=None, fnr_end=None, timeslot=None):
+        self.burst_file = burst_file
+        self.fnr_start = fnr_start
+        self.fnr_end = fnr_end
+        self.timeslot = timeslot
+        self.path = None
+
+    def __enter__(self):
+        fd, self.path = tempfile.mkstemp(suffix=".bursts")
+        os.close(fd)
+        if is_container(self.burst_file):
+            with BurstContainerReader(self.burst_file, self.fnr_start, self.fnr_end) as reader:
+                reader.write(self.path, reader.select(self.timeslot, self.fnr_start, self.fnr_end))
+        else:
+            index = BurstFileIndex(self.burst_file)
+            index.extract(self.path, self.fnr_start, self.fnr_end, self.timeslot)
+        return self.path
+
+    def __exit__(self, type, value, traceback):
+        if self.path is not None and os.path.isfile(self.path):
+            os.remove(self.path)
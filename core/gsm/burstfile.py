@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import struct
+
+# Tags of serialized PMTs, as written by pmt::serialize_str.
+PST_TRUE = 0x00
+PST_FALSE = 0x01
+PST_SYMBOL = 0x02
+PST_INT32 = 0x03
+PST_DOUBLE = 0x04
+PST_COMPLEX = 0x05
+PST_NULL = 0x06
+PST_PAIR = 0x07
+PST_VECTOR = 0x08
+PST_DICT = 0x09
+PST_UNIFORM_VECTOR = 0x0a
+PST_UINT64 = 0x0b
+PST_TUPLE = 0x0c
+PST_INT64 = 0x0d
+
+# item sizes of the uniform vector types, indexed by their type tag
+UVI_ITEM_SIZES = [1, 1, 2, 2, 4, 4, 8, 8, 4, 8, 8, 16]
+
+# Layout of the GSMTAP header that precedes the burst bits in the blob of every burst message.
+GSMTAP_HEADER_LENGTH = 16
+GSMTAP_VERSION = 0x02
+GSMTAP_TYPE_UM_BURST = 0x03
+GSMTAP_OFFSET_TIMESLOT = 3
+GSMTAP_OFFSET_ARFCN = 4
+GSMTAP_OFFSET_SIGNAL_DBM = 6
+GSMTAP_OFFSET_SNR_DB = 7
+GSMTAP_OFFSET_FRAME_NUMBER = 8
+GSMTAP_OFFSET_SUB_TYPE = 12
+GSMTAP_OFFSET_SUB_SLOT = 14
+GSMTAP_ARFCN_MASK = 0x3fff
+GSMTAP_ARFCN_F_UPLINK = 0x4000
+
+BURST_LENGTH = 148
+
+
+class BurstFileError(Exception):
+    """
+    Signals a burst file that can not be parsed.
+    """
+    pass
+
+
+class BurstRecord(object):
+    """
+    Location and GSMTAP header fields of a single burst message in a burst file.
+    """
+
+    def __init__(self, offset, length, frame_number, timeslot, arfcn, sub_slot, sub_type, data_offset):
+        self.offset = offset
+        self.length = length
+        self.frame_number = frame_number
+        self.timeslot = timeslot
+        self.arfcn = arfcn
+        self.sub_slot = sub_slot
+        self.sub_type = sub_type
+        self.data_offset = data_offset
+
+
+def skip_pmt(buf, pos):
+    """
+    Skip a serialized PMT.
+
+    :param buf: a buffer (str or mmap) containing serialized PMTs.
+    :param pos: position of the PMT's tag in the buffer.
+    :return: the position right after the PMT.
+    """
+    tag = ord(buf[pos])
+    pos += 1
+    if tag in (PST_TRUE, PST_FALSE, PST_NULL):
+        return pos
+    elif tag == PST_SYMBOL:
+        return pos + 2 + struct.unpack_from(">H", buf, pos)[0]
+    elif tag == PST_INT32:
+        return pos + 4
+    elif tag in (PST_DOUBLE, PST_UINT64, PST_INT64):
+        return pos + 8
+    elif tag == PST_COMPLEX:
+        return pos + 16
+    elif tag == PST_PAIR:
+        return skip_pmt(buf, skip_pmt(buf, pos))
+    elif tag in (PST_VECTOR, PST_TUPLE):
+        count = struct.unpack_from(">I", buf, pos)[0]
+        pos += 4
+        for i in xrange(count):
+            pos = skip_pmt(buf, pos)
+        return pos
+    elif tag == PST_UNIFORM_VECTOR:
+        item_type, count, npad = struct.unpack_from(">BIB", buf, pos)
+        return pos + 6 + npad + count * UVI_ITEM_SIZES[item_type]
+    raise BurstFileError("Unknown PMT tag 0x%02x at offset %s" % (tag, pos - 1))
+
+
+def read_record(buf, offset):
+    """
+    Parse the burst message at the given offset.
+
+    A burst message is a PMT pair of a metadata PMT and an u8 vector holding the GSMTAP header
+    followed by one byte per bit of the burst.
+
+    :param buf: a buffer (str or mmap) containing the burst file.
+    :param offset: offset of the burst message in the buffer.
+    :return: the parsed record.
+    :rtype: BurstRecord
+    """
+    if ord(buf[offset]) != PST_PAIR:
+        raise BurstFileError("No burst message at offset %s" % offset)
+
+    pos = skip_pmt(buf, offset + 1)  # metadata is not needed
+    if ord(buf[pos]) != PST_UNIFORM_VECTOR:
+        raise BurstFileError("Burst message at offset %s has no data" % offset)
+    item_type, count, npad = struct.unpack_from(">BIB", buf, pos + 1)
+    data_offset = pos + 7 + npad
+    if item_type != 0 or count < GSMTAP_HEADER_LENGTH:
+        raise BurstFileError("Burst message at offset %s has invalid data" % offset)
+
+    timeslot, arfcn = struct.unpack_from(">BH", buf, data_offset + GSMTAP_OFFSET_TIMESLOT)
+    frame_number, sub_type = struct.unpack_from(">IB", buf, data_offset + GSMTAP_OFFSET_FRAME_NUMBER)
+    sub_slot = ord(buf[data_offset + GSMTAP_OFFSET_SUB_SLOT])
+
+    length = data_offset + count - offset
+    return BurstRecord(offset, length, frame_number, timeslot, arfcn & GSMTAP_ARFCN_MASK, sub_slot, sub_type,
+                       data_offset + GSMTAP_HEADER_LENGTH)
+
+
+def iter_records(buf, start=0, end=None):
+    """
+    Iterate over the burst messages in a buffer.
+
+    :param buf: a buffer (str or mmap) containing the burst file.
+    :param start: offset of the first burst message.
+    :param end: end of the buffer, defaults to the length of the buffer.
+    :return: a generator of BurstRecord.
+    """
+    if end is None:
+        end = len(buf)
+    offset = start
+    while offset < end:
+        try:
+            record = read_record(buf, offset)
+        except (IndexError, struct.error, BurstFileError):
+            break  # the last message is incomplete, e.g. because the capture is still running
+        if offset + record.length > end:
+            break
+        yield record
+        offset += record.length
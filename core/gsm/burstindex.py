@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+import mmap
+import os
+import struct
+
+import numpy
+
+from core.gsm.burstfile import BurstFileError, iter_records, read_record
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 2
+
+index_dtype = numpy.dtype([("frame_number", "<u4"), ("timeslot", "u1"), ("sub_slot", "u1"),
+                           ("offset", "<u8"), ("length", "<u4")])
+
+
+class BurstFileIndex(object):
+    """
+    Sidecar index of a burst file that maps frame number and timeslot of every burst to its byte offset.
+
+    The index is stored next to the burst file and rebuilt when the burst file changes.
+    If the burst file only grew, e.g. because the capture is still running, only the new bursts are indexed.
+    A burst file that was replaced, recognized by its inode or by the last indexed burst, is indexed again.
+    """
+
+    def __init__(self, burst_file):
+        self.burst_file = burst_file
+        self.index_file = burst_file + INDEX_SUFFIX
+        self.entries = numpy.zeros(0, dtype=index_dtype)
+        self.__file_size = 0
+        self.__file_mtime = 0.0
+        self.__file_inode = 0
+        self.__indexed_size = 0
+        self.__ascending = True
+
+        self.__load()
+        self.refresh()
+
+    def refresh(self):
+        """
+        Update the index if the burst file changed since it was indexed.
+        """
+        stat = os.stat(self.burst_file)
+        if stat.st_size == self.__file_size and stat.st_mtime == self.__file_mtime:
+            return
+
+        if stat.st_ino != self.__file_inode or not self.__appended(stat.st_size):  # file was replaced, start over
+            self.entries = numpy.zeros(0, dtype=index_dtype)
+            self.__indexed_size = 0
+
+        new_entries = self.__build(self.__indexed_size)
+        self.entries = numpy.concatenate((self.entries, new_entries))
+        self.__update_order()
+        if len(self.entries) > 0:
+            self.__indexed_size = int(self.entries["offset"][-1] + self.entries["length"][-1])
+        self.__file_size = stat.st_size
+        self.__file_mtime = stat.st_mtime
+        self.__file_inode = stat.st_ino
+        self.__save()
+
+    def select(self, fnr_start=None, fnr_end=None, timeslot=None):
+        """
+        Select the index entries of the bursts in a frame number window.
+
+        :param fnr_start: lowest framenumber, None for no lower bound.
+        :param fnr_end: highest framenumber, None for no upper bound.
+        :param timeslot: select only bursts on this timeslot, None for all timeslots.
+        :return: the selected entries in file order.
+        """
+        entries = self.entries
+        frame_numbers = entries["frame_number"]
+
+        if self.__ascending:
+            # the usual case: frame numbers are ascending, so the window is a contiguous range of the file.
+            first, last = self.window(fnr_start, fnr_end)
+            entries = entries[first:last]
+        else:
+            # frame numbers wrapped around, fall back to a full scan of the index
+            mask = numpy.ones(len(entries), dtype=bool)
+            if fnr_start is not None:
+                mask &= frame_numbers >= fnr_start
+            if fnr_end is not None:
+                mask &= frame_numbers <= fnr_end
+            entries = entries[mask]
+
+        if timeslot is not None:
+            entries = entries[entries["timeslot"] == timeslot]
+        return entries
+
+    def window(self, fnr_start=None, fnr_end=None):
+        """
+        Find the contiguous range of entries that holds the bursts in a frame number window, using binary search.
+
+        :param fnr_start: lowest framenumber, None for no lower bound.
+        :param fnr_end: highest framenumber, None for no upper bound.
+        :return: a tuple of the first entry and the entry behind the last one. If the frame numbers of the burst
+        file are not ascending, e.g. because they wrapped around, the range covers all entries.
+        """
+        if not self.__ascending:
+            return 0, len(self.entries)
+        frame_numbers = self.entries["frame_number"]
+        first = 0 if fnr_start is None else int(numpy.searchsorted(frame_numbers, fnr_start, side="left"))
+        last = len(frame_numbers) if fnr_end is None else int(numpy.searchsorted(frame_numbers, fnr_end,
+                                                                                 side="right"))
+        return first, max(first, last)
+
+    def extract(self, destination, fnr_start=None, fnr_end=None, timeslot=None):
+        """
+        Copy the bursts in a frame number window into a new burst file.
+        Only the selected byte ranges of the source file are read.
+
+        :param destination: the destination burst file.
+        :param fnr_start: lowest framenumber, None for no lower bound.
+        :param fnr_end: highest framenumber, None for no upper bound.
+        :param timeslot: copy only bursts on this timeslot, None for all timeslots.
+        :return: the number of copied bursts.
+        """
+        entries = self.select(fnr_start, fnr_end, timeslot)
+        with open(self.burst_file, "rb") as source, open(destination, "wb") as dest:
+            i = 0
+            while i < len(entries):
+                # merge adjacent records into a single read
+                start = int(entries["offset"][i])
+                end = start + int(entries["length"][i])
+                i += 1
+                while i < len(entries) and entries["offset"][i] == end:
+                    end += int(entries["length"][i])
+                    i += 1
+                source.seek(start)
+                dest.write(source.read(end - start))
+        return len(entries)
+
+    def __appended(self, size):
+        """
+        :return: True if the bursts indexed so far are unchanged at the beginning of a burst file of this size.
+        """
+        if size < self.__indexed_size:
+            return False
+        if len(self.entries) == 0:
+            return True
+        last = self.entries[-1]
+        with open(self.burst_file, "rb") as f:
+            f.seek(int(last["offset"]))
+            data = f.read(int(last["length"]))
+        try:
+            record = read_record(data, 0)
+        except (IndexError, struct.error, BurstFileError):
+            return False
+        return (record.length, record.frame_number, record.timeslot) == \
+            (last["length"], last["frame_number"], last["timeslot"])
+
+    def __update_order(self):
+        frame_numbers = self.entries["frame_number"]
+        self.__ascending = bool(numpy.all(frame_numbers[1:] >= frame_numbers[:-1]))
+
+    def __build(self, start):
+        with open(self.burst_file, "rb") as f:
+            if os.fstat(f.fileno()).st_size <= start:
+                return numpy.zeros(0, dtype=index_dtype)
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                records = [(r.frame_number, r.timeslot, r.sub_slot, r.offset, r.length)
+                           for r in iter_records(buf, start)]
+            finally:
+                buf.close()
+        return numpy.array(records, dtype=index_dtype)
+
+    def __load(self):
+        if not os.path.isfile(self.index_file):
+            return
+        try:
+            with open(self.index_file, "rb") as f:
+                stored = numpy.load(f)
+                if int(stored["version"]) != INDEX_VERSION:
+                    return
+                self.entries = stored["entries"]
+                self.__file_size = int(stored["file_size"])
+                self.__file_mtime = float(stored["file_mtime"])
+                self.__file_inode = int(stored["file_inode"])
+                self.__indexed_size = int(stored["indexed_size"])
+                self.__update_order()
+        except (IOError, ValueError, KeyError):
+            pass  # a broken index is simply rebuilt
+
+    def __save(self):
+        try:
+            with open(self.index_file, "wb") as f:
+                numpy.savez(f, version=INDEX_VERSION, entries=self.entries, file_size=self.__file_size,
+                            file_mtime=self.__file_mtime, file_inode=self.__file_inode,
+                            indexed_size=self.__indexed_size)
+        except IOError:
+            pass  # e.g. read-only capture directory, the index is kept in memory only
+
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+import mmap
+
+import numpy
+
+from core.gsm.burstfile import BURST_LENGTH, GSMTAP_ARFCN_MASK, GSMTAP_HEADER_LENGTH, GSMTAP_VERSION, \
+    GSMTAP_TYPE_UM_BURST, GSMTAP_OFFSET_TIMESLOT, GSMTAP_OFFSET_ARFCN, GSMTAP_OFFSET_SIGNAL_DBM, GSMTAP_OFFSET_SNR_DB, \
+    GSMTAP_OFFSET_FRAME_NUMBER, GSMTAP_OFFSET_SUB_TYPE, GSMTAP_OFFSET_SUB_SLOT, PST_PAIR, PST_NULL, \
+    PST_UNIFORM_VECTOR
+from core.gsm.burstindex import BurstFileIndex
+
+SS_FILTER_SDCCH4 = 0
+SS_FILTER_SDCCH8 = 1
+
+burst_dtype = numpy.dtype([("frame_number", "<u4"), ("timeslot", "u1"), ("arfcn", "<u2"), ("sub_type", "u1"),
+                           ("sub_slot", "u1"), ("signal_dbm", "i1"), ("snr_db", "i1"),
+                           ("bits", "u1", (BURST_LENGTH,))])
+
+# GSMTAP header offset and big-endian format of the fields in burst_dtype
+_header_fields = [("frame_number", GSMTAP_OFFSET_FRAME_NUMBER, ">u4"), ("timeslot", GSMTAP_OFFSET_TIMESLOT, "u1"),
+                  ("arfcn", GSMTAP_OFFSET_ARFCN, ">u2"), ("sub_type", GSMTAP_OFFSET_SUB_TYPE, "u1"),
+                  ("sub_slot", GSMTAP_OFFSET_SUB_SLOT, "u1"), ("signal_dbm", GSMTAP_OFFSET_SIGNAL_DBM, "i1"),
+                  ("snr_db", GSMTAP_OFFSET_SNR_DB, "i1")]
+
+
+def _subslot_table(layout):
+    table = numpy.full(102, -1, dtype=numpy.int8)
+    for start, subslot in layout:
+        table[start:start + 4] = subslot
+    return table
+
+
+# subslot of every frame of the 102-multiframe, -1 if the frame does not belong to a SDCCH or SACCH subslot.
+SDCCH4_SUBSLOTS = _subslot_table([(22, 0), (26, 1), (32, 2), (36, 3), (42, 0), (46, 1),
+                                  (73, 0), (77, 1), (83, 2), (87, 3), (93, 2), (97, 3)])
+SDCCH8_SUBSLOTS = _subslot_table([(i * 4, i) for i in range(8)] + [(32 + i * 4, i) for i in range(4)] +
+                                 [(51 + i * 4, i) for i in range(8)] + [(83 + i * 4, 4 + i) for i in range(4)])
+
+# the dummy burst as specified in 3GPP TS 45.002, including the tail bits
+DUMMY_BURST = numpy.array([0, 0, 0] + [int(b) for b in (
+    "11111011011101100000101001001110000010010001000000011111000111000101110001011100010101110100101000110011"
+    "00111001111010011111000100101111101010")] + [0, 0, 0], dtype=numpy.uint8)
+
+
+class BurstArrayReader(object):
+    """
+    Base class for readers that provide the bursts of a file as a NumPy structured array of burst_dtype
+    in the attribute bursts. On its own, it provides the bursts of an array.
+    """
+
+    def __init__(self, bursts=None):
+        self.bursts = bursts if bursts is not None else numpy.zeros(0, dtype=burst_dtype)
+
+    def close(self):
+        self.bursts = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.bursts)
+
+    def select(self, timeslot=None, fnr_start=None, fnr_end=None, subslot=None, subslot_mode=SS_FILTER_SDCCH8,
+               remove_dummy=False):
+        """
+        Select bursts. All criteria are evaluated vectorized, over the bursts of the frame number window only if
+        the reader can locate it without a scan.
+
+        :param timeslot: select only bursts on this timeslot.
+        :param fnr_start: select only bursts with a framenumber greater than or equal this one.
+        :param fnr_end: select only bursts with a framenumber less than or equal this one.
+        :param subslot: select only bursts on this SDCCH/SACCH subslot.
+        :param subslot_mode: SS_FILTER_SDCCH8 or SS_FILTER_SDCCH4, determines the channel combination for subslot.
+        :param remove_dummy: if True, dummy bursts are not selected.
+        :return: an array with the indices of the selected bursts, in file order.
+        """
+        first, last = self.window(fnr_start, fnr_end)
+        bursts = self.bursts[first:last]
+        mask = numpy.ones(len(bursts), dtype=bool)
+        frame_numbers = bursts["frame_number"]
+        if timeslot is not None:
+            mask &= bursts["timeslot"] == timeslot
+        if fnr_start is not None:
+            mask &= frame_numbers >= fnr_start
+        if fnr_end is not None:
+            mask &= frame_numbers <= fnr_end
+        if subslot is not None:
+            table = SDCCH4_SUBSLOTS if subslot_mode == SS_FILTER_SDCCH4 else SDCCH8_SUBSLOTS
+            mask &= table[frame_numbers % 102] == subslot
+        if remove_dummy:
+            candidates = numpy.flatnonzero(mask)
+            is_dummy = numpy.all(bursts["bits"][candidates] == DUMMY_BURST, axis=1)
+            mask[candidates[is_dummy]] = False
+        return first + numpy.flatnonzero(mask)
+
+    def window(self, fnr_start=None, fnr_end=None):
+        """
+        :return: a tuple of the first burst and the burst behind the last one that can be in a frame number window.
+        """
+        return 0, len(self.bursts)
+
+    def payloads(self, indices):
+        """
+        Get the 114 payload bits of bursts.
+
+        :param indices: indices of the bursts.
+        :return: an array of shape (len(indices), 114).
+        """
+        bits = self.bursts["bits"][indices]
+        return numpy.concatenate((bits[:, 3:60], bits[:, 88:145]), axis=1)
+
+    def get_payloads(self, timeslot, fnr_start, fnr_end):
+        """
+        Get the payloads of the bursts on a timeslot within a frame number window.
+
+        :return: a dictionary mapping the framenumbers to the payloads as strings of '0' and '1'.
+        """
+        indices = self.select(timeslot=timeslot, fnr_start=fnr_start, fnr_end=fnr_end)
+        frame_numbers = self.bursts["frame_number"][indices]
+        payloads = self.payloads(indices) + ord("0")
+        result = dict()
+        for i in range(len(indices)):
+            result[int(frame_numbers[i])] = payloads[i].tostring()
+        return result
+
+    def get_snr(self, timeslot, fnr_start, fnr_end):
+        """
+        Get the signal to noise ratio of the bursts on a timeslot within a frame number window.
+
+        :return: a dictionary mapping the framenumbers to the SNR in dB.
+        """
+        indices = self.select(timeslot=timeslot, fnr_start=fnr_start, fnr_end=fnr_end)
+        return dict(zip(self.bursts["frame_number"][indices].tolist(), self.bursts["snr_db"][indices].tolist()))
+
+    def get_arfcn(self, timeslot=None):
+        """
+        Get the ARFCN the bursts were received on, without the GSMTAP band and uplink flags.
+
+        :return: the most frequent ARFCN of the bursts on the timeslot, None if there are no bursts.
+        """
+        indices = self.select(timeslot=timeslot)
+        if len(indices) == 0:
+            return None
+        return int(numpy.bincount(self.bursts["arfcn"][indices] & GSMTAP_ARFCN_MASK).argmax())
+
+    def write(self, destination, indices):
+        """
+        Write bursts into a new burst file in the format of grgsm.burst_file_sink.
+
+        :param destination: the destination burst file.
+        :param indices: indices of the bursts, e.g. as returned by select().
+        """
+        write_burst_file(destination, self.bursts[indices])
+
+
+class BurstFileReader(BurstArrayReader):
+    """
+    Memory-mapped access to the bursts of a burst file written by grgsm.burst_file_sink.
+
+    If all burst messages in the file have the same size, which is the case for files written by a single
+    receiver, the array is a zero-copy view on the mapped file. Otherwise the bursts are copied into a packed array.
+    The arfcn field includes the GSMTAP band and uplink flags.
+    """
+
+    def __init__(self, burst_file):
+        super(BurstFileReader, self).__init__()
+        index = BurstFileIndex(burst_file)
+        self.burst_file = burst_file
+        self.__index = index
+        self.offsets = index.entries["offset"].astype(numpy.int64)
+        self.lengths = index.entries["length"].astype(numpy.int64)
+
+        self.__file = open(burst_file, "rb")
+        if len(self.offsets) > 0:
+            self.__mmap = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__buffer = numpy.frombuffer(self.__mmap, dtype=numpy.uint8)
+        else:
+            self.__mmap = None
+            self.__buffer = numpy.zeros(0, dtype=numpy.uint8)
+        self.bursts = self.__map_bursts()
+
+    def close(self):
+        super(BurstFileReader, self).close()
+        self.__buffer = None
+        if self.__mmap is not None:
+            self.__mmap.close()
+        self.__file.close()
+
+    def window(self, fnr_start=None, fnr_end=None):
+        # the window is located by binary search in the sidecar index, so the mapped file is only read within it
+        return self.__index.window(fnr_start, fnr_end)
+
+    def write(self, destination, indices, append=False):
+        """
+        Write bursts into a new burst file. The burst messages are copied unchanged, including their metadata.
+
+        :param destination: the destination burst file.
+        :param indices: indices of the bursts, e.g. as returned by select().
+        :param append: if True, the bursts are appended to the destination instead of replacing it.
+        """
+        with open(destination, "ab" if append else "wb") as dest:
+            i = 0
+            while i < len(indices):
+                # merge adjacent messages into a single write
+                start = self.offsets[indices[i]]
+                end = start + self.lengths[indices[i]]
+                i += 1
+                while i < len(indices) and self.offsets[indices[i]] == end:
+                    end += self.lengths[indices[i]]
+                    i += 1
+                dest.write(self.__buffer[start:end].tostring())
+
+    def __map_bursts(self):
+        count = len(self.offsets)
+        if count == 0:
+            return numpy.zeros(0, dtype=burst_dtype)
+
+        # the blob with GSMTAP header and burst bits is the last element of every message
+        header_offsets = self.offsets + self.lengths - (GSMTAP_HEADER_LENGTH + BURST_LENGTH)
+        length = int(self.lengths[0])
+        is_uniform = numpy.all(self.lengths == length) and numpy.all(numpy.diff(self.offsets) == length)
+
+        if is_uniform:
+            header = length - (GSMTAP_HEADER_LENGTH + BURST_LENGTH)
+            view_dtype = numpy.dtype({
+                "names": [name for name, offset, fmt in _header_fields] + ["bits"],
+                "formats": [fmt for name, offset, fmt in _header_fields] + [("u1", (BURST_LENGTH,))],
+                "offsets": ([header + offset for name, offset, fmt in _header_fields] +
+                            [header + GSMTAP_HEADER_LENGTH]),
+                "itemsize": length})
+            return numpy.ndarray(shape=(count,), dtype=view_dtype, buffer=self.__buffer, offset=int(self.offsets[0]))
+
+        blobs = self.__buffer[header_offsets[:, None] + numpy.arange(GSMTAP_HEADER_LENGTH + BURST_LENGTH)]
+        return bursts_from_blobs(blobs)
+
+
+def bursts_from_blobs(blobs):
+    """
+    Convert the blobs of burst messages, i.e. GSMTAP header followed by the burst bits, to bursts.
+
+    :param blobs: an uint8 array of shape (number of bursts, 164).
+    :return: an array of burst_dtype.
+    """
+    blobs = numpy.ascontiguousarray(blobs, dtype=numpy.uint8)
+    bursts = numpy.zeros(len(blobs), dtype=burst_dtype)
+    for name, offset, fmt in _header_fields:
+        size = numpy.dtype(fmt).itemsize
+        bursts[name] = blobs[:, offset:offset + size].copy().view(fmt)[:, 0]
+    bursts["bits"] = blobs[:, GSMTAP_HEADER_LENGTH:GSMTAP_HEADER_LENGTH + BURST_LENGTH]
+    return bursts
+
+
+def write_burst_file(destination, bursts, append=False):
+    """
+    Write bursts into a burst file in the format of grgsm.burst_file_sink, without metadata.
+
+    :param destination: the destination burst file.
+    :param bursts: an array of burst_dtype.
+    :param append: if True, the bursts are appended to the destination instead of replacing it.
+    """
+    blob_length = GSMTAP_HEADER_LENGTH + BURST_LENGTH
+    prefix = [PST_PAIR, PST_NULL, PST_UNIFORM_VECTOR, 0] + [(blob_length >> s) & 0xff for s in (24, 16, 8, 0)] + [1, 0]
+
+    records = numpy.zeros((len(bursts), len(prefix) + blob_length), dtype=numpy.uint8)
+    records[:, :len(prefix)] = prefix
+    header = records[:, len(prefix):len(prefix) + GSMTAP_HEADER_LENGTH]
+    header[:, 0] = GSMTAP_VERSION
+    header[:, 1] = GSMTAP_HEADER_LENGTH / 4
+    header[:, 2] = GSMTAP_TYPE_UM_BURST
+    for name, offset, fmt in _header_fields:
+        size = numpy.dtype(fmt).itemsize
+        header[:, offset:offset + size] = bursts[name].astype(fmt).view(numpy.uint8).reshape(-1, size)
+    records[:, len(prefix) + GSMTAP_HEADER_LENGTH:] = bursts["bits"]
+
+    with open(destination, "ab" if append else "wb") as dest:
+        records.tofile(dest)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import numpy
+
+from core.adapterinterfaces.a5 import BURST_PAYLOAD_LENGTH
+
+PACKED_PAYLOAD_LENGTH = (BURST_PAYLOAD_LENGTH + 7) // 8
+
+# memory per stored burst: packed payload, frame number and the entry in the slot dictionary
+BYTES_PER_BURST = PACKED_PAYLOAD_LENGTH + 8 + 100
+
+DEFAULT_MEMORY_LIMIT = 64 * 1024 * 1024
+
+
+class BurstRing(object):
+    """
+    Bounded in-memory store of burst payloads, indexed by frame number.
+
+    The payloads are packed 8 bits per byte into arrays that are allocated once for the configured memory
+    limit. When the store is full, the bursts added first are overwritten, so only the bursts around the
+    most recent frames of interest are kept.
+    """
+
+    def __init__(self, memory_limit=DEFAULT_MEMORY_LIMIT):
+        """
+        :param memory_limit: the maximum memory used by the store, in bytes.
+        """
+        self.capacity = max(1, int(memory_limit) // BYTES_PER_BURST)
+        self.frame_numbers = numpy.full(self.capacity, -1, dtype=numpy.int64)
+        self.bits = numpy.zeros((self.capacity, PACKED_PAYLOAD_LENGTH), dtype=numpy.uint8)
+        self.__slots = dict()  # frame number -> slot
+        self.__next = 0
+
+    def __len__(self):
+        return len(self.__slots)
+
+    def __contains__(self, framenumber):
+        return int(framenumber) in self.__slots
+
+    def add(self, framenumbers, payloads):
+        """
+        Store the payloads of bursts, replacing stored bursts with the same frame numbers.
+
+        :param framenumbers: the frame numbers of the bursts.
+        :param payloads: the payloads as uint8 array of shape (number of bursts, 114).
+        """
+        framenumbers = numpy.asarray(framenumbers, dtype=numpy.int64)[-self.capacity:]
+        payloads = numpy.asarray(payloads, dtype=numpy.uint8)[-self.capacity:]
+        slots = (self.__next + numpy.arange(len(framenumbers))) % self.capacity
+        for slot, framenumber in zip(slots.tolist(), framenumbers.tolist()):
+            evicted = int(self.frame_numbers[slot])
+            if evicted >= 0 and self.__slots.get(evicted) == slot:
+                del self.__slots[evicted]
+            previous = self.__slots.get(framenumber)
+            if previous is not None:
+                self.frame_numbers[previous] = -1
+            self.__slots[framenumber] = slot
+        self.frame_numbers[slots] = framenumbers
+        self.bits[slots] = numpy.packbits(payloads, axis=1)
+        self.__next = (self.__next + len(framenumbers)) % self.capacity
+
+    def payloads(self, framenumbers):
+        """
+        Get the payloads of bursts.
+
+        :param framenumbers: the frame numbers of the bursts.
+        :return: an uint8 array of shape (len(framenumbers), 114).
+        :raise KeyError: if a burst is not stored, e.g. because it was not captured.
+        """
+        slots = [self.__slots[int(framenumber)] for framenumber in framenumbers]
+        return numpy.unpackbits(self.bits[slots], axis=1)[:, :BURST_PAYLOAD_LENGTH]
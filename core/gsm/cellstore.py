@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import time
+from ConfigParser import NoOptionError, NoSectionError
+
+import numpy
+
+from core.gsm import framecoder
+
+# the second octet of the L1 header of SACCH messages is the timing advance
+TIMING_ADVANCE_OCTET = 1
+TIMING_ADVANCES = 64
+
+
+class CellStore(object):
+    """
+    Persistent knowledge about cells, collected over all captures and indexed by ARFCN.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__db = sqlite3.connect(path)
+        self.__db.text_factory = str
+        self.__db.execute("CREATE TABLE IF NOT EXISTS padding (arfcn INTEGER PRIMARY KEY, fixed INTEGER, "
+                          "randomized INTEGER, updated REAL)")
+        # the System Information messages on SACCH with the timing advance set to 0 and their bursts for all
+        # timing advances, packed 8 bits per byte
+        self.__db.execute("CREATE TABLE IF NOT EXISTS sacch_messages (arfcn INTEGER, si_type TEXT, message TEXT, "
+                          "bursts BLOB, updated REAL, PRIMARY KEY (arfcn, si_type, message))")
+        self.__db.commit()
+
+    def close(self):
+        self.__db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def padding(self, arfcn):
+        """
+        :return: a tuple of the number of fill frames with fixed and with randomized padding seen on a cell.
+        """
+        row = self.__db.execute("SELECT fixed, randomized FROM padding WHERE arfcn = ?", (arfcn,)).fetchone()
+        if row is None:
+            return 0, 0
+        return row
+
+    def add_padding(self, arfcn, fixed, randomized):
+        """
+        Count fill frames seen on a cell.
+        """
+        if fixed == 0 and randomized == 0:
+            return
+        known_fixed, known_randomized = self.padding(arfcn)
+        self.__db.execute("INSERT OR REPLACE INTO padding VALUES (?, ?, ?, ?)",
+                          (arfcn, known_fixed + fixed, known_randomized + randomized, time.time()))
+        self.__db.commit()
+
+    def add_sacch_messages(self, arfcn, messages):
+        """
+        Add System Information messages on SACCH to the library of a cell. The bursts of every message are coded
+        for all timing advances, so an attack can try several timing advances without coding the messages again.
+
+        :param arfcn: the ARFCN of the cell.
+        :param messages: a dictionary mapping the System Information types to the messages as hex strings,
+        including the L1 header.
+        """
+        known = set(self.__db.execute("SELECT si_type, message FROM sacch_messages WHERE arfcn = ?", (arfcn,)))
+        now = time.time()
+        for si_type in messages:
+            message = without_timing_advance(messages[si_type])
+            if (si_type, message) in known:
+                self.__db.execute("UPDATE sacch_messages SET updated = ? WHERE arfcn = ? AND si_type = ? AND "
+                                  "message = ?", (now, arfcn, si_type, message))
+                continue
+            variants = numpy.tile(numpy.frombuffer(message.decode("hex"), dtype=numpy.uint8), (TIMING_ADVANCES, 1))
+            variants[:, TIMING_ADVANCE_OCTET] = numpy.arange(TIMING_ADVANCES)
+            bursts = numpy.packbits(framecoder.encode_xcch(variants), axis=2)
+            self.__db.execute("INSERT INTO sacch_messages VALUES (?, ?, ?, ?, ?)",
+                              (arfcn, si_type, message, sqlite3.Binary(bursts.tostring()), now))
+        self.__db.commit()
+
+    def sacch_messages(self, arfcn):
+        """
+        :return: a dictionary mapping the System Information types on SACCH of a cell to the latest message
+        as hex string, with the timing advance set to 0.
+        """
+        return dict(self.__db.execute("SELECT si_type, message FROM sacch_messages WHERE arfcn = ? "
+                                      "ORDER BY updated", (arfcn,)))
+
+    def sacch_bursts(self, arfcn, message):
+        """
+        Get the coded bursts of a message in the library for all timing advances.
+
+        :param message: the message as hex string, its timing advance is ignored.
+        :return: an uint8 array of shape (64, 4, 114) indexed by the timing advance, or None if the message
+        is not in the library.
+        """
+        row = self.__db.execute("SELECT bursts FROM sacch_messages WHERE arfcn = ? AND message = ?",
+                                (arfcn, without_timing_advance(message))).fetchone()
+        if row is None:
+            return None
+        packed = numpy.frombuffer(str(row[0]), dtype=numpy.uint8).reshape(TIMING_ADVANCES, framecoder.BURSTS, -1)
+        return numpy.unpackbits(packed, axis=2)[:, :, :framecoder.BURST_BITS]
+
+
+def without_timing_advance(message):
+    """
+    :param message: a SACCH message as hex string.
+    :return: the message with the timing advance set to 0.
+    """
+    message = message.lower()
+    return message[:2 * TIMING_ADVANCE_OCTET] + "00" + message[2 * TIMING_ADVANCE_OCTET + 2:]
+
+
+def open_cell_store(config_provider):
+    """
+    Open the cell store configured in the gat section.
+
+    :rtype: CellStore
+    """
+    try:
+        path = config_provider.get("gat", "cell_store")
+    except (NoSectionError, NoOptionError):
+        path = os.path.join(config_provider.config_dir, "cells.db")
+    return CellStore(os.path.expanduser(path))
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+import os
+import struct
+
+import numpy
+
+CFILE_MAGIC = "GATCFILE"
+CFILE_VERSION = 1
+
+# file header: magic, version, sample format, scale factor, sample rate, center frequency (0 if not known).
+# The header is padded to a multiple of the sample sizes, so the samples can be read with a fixed item size.
+_header = struct.Struct("<8sHHddd")
+HEADER_LENGTH = 64
+
+# the quantized sample formats, the samples are stored as interleaved I and Q integers
+SAMPLE_FORMATS = ["int16", "int8"]
+_dtypes = {"int16": numpy.dtype("<i2"), "int8": numpy.dtype("i1")}
+_format_codes = {"int16": 1, "int8": 2}
+
+# the samples of the receiver are within [-1, 1]
+DEFAULT_AMPLITUDE = 1.0
+
+# factor between the peak of the first samples written and the largest value represented without clipping,
+# leaves room for cells received stronger later in the capture
+PEAK_HEADROOM = 4.0
+
+# sample rate that holds a 200 kHz channel with room for the transition band of the decimation filter
+MIN_CHANNEL_RATE = 400e3
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+class CfileHeader(object):
+    """
+    Header of a quantized cfile. A sample is the I and Q integers times the scale factor.
+    """
+
+    def __init__(self, sample_format, scale, samp_rate, fc=None):
+        self.sample_format = sample_format
+        self.scale = scale
+        self.samp_rate = samp_rate
+        self.fc = fc
+
+    @property
+    def dtype(self):
+        return _dtypes[self.sample_format]
+
+    @property
+    def sample_size(self):
+        return 2 * self.dtype.itemsize
+
+    def pack(self):
+        data = _header.pack(CFILE_MAGIC, CFILE_VERSION, _format_codes[self.sample_format], self.scale,
+                            self.samp_rate, self.fc or 0)
+        return data + "\0" * (HEADER_LENGTH - len(data))
+
+    @staticmethod
+    def unpack(data):
+        """
+        :return: the CfileHeader, or None if the data does not start with a header.
+        """
+        if len(data) < _header.size or not data.startswith(CFILE_MAGIC):
+            return None
+        magic, version, format_code, scale, samp_rate, fc = _header.unpack(data[:_header.size])
+        if version != CFILE_VERSION or format_code not in _format_codes.values():
+            return None
+        sample_format = [name for name in _format_codes if _format_codes[name] == format_code][0]
+        return CfileHeader(sample_format, scale, samp_rate, fc or None)
+
+
+def read_cfile_header(path):
+    """
+    :param path: path of a cfile.
+    :return: the CfileHeader of a quantized cfile, None for a cfile of raw gr_complex samples.
+    """
+    try:
+        with open(path, "rb") as f:
+            return CfileHeader.unpack(f.read(HEADER_LENGTH))
+    except IOError:
+        return None
+
+
+def decimation(samp_rate, min_rate=MIN_CHANNEL_RATE):
+    """
+    :return: the largest integer decimation that keeps the sample rate at or above min_rate.
+    """
+    return max(1, int(samp_rate // min_rate))
+
+
+class QuantizedCfileWriter(object):
+    """
+    Writes complex samples as interleaved int16 or int8 I and Q values behind a header with the scale factor.
+    Samples beyond the amplitude are clipped.
+    """
+
+    def __init__(self, path, sample_format, samp_rate, fc=None, amplitude=None):
+        """
+        :param sample_format: one of SAMPLE_FORMATS.
+        :param samp_rate: the sample rate of the samples written.
+        :param fc: the center frequency of the samples, if known.
+        :param amplitude: the largest magnitude of I and Q that is represented without clipping, None to derive it
+        from the peak of the first samples written.
+        """
+        dtype = _dtypes[sample_format]
+        self.__limit = numpy.iinfo(dtype).max
+        self.header = CfileHeader(sample_format, None, samp_rate, fc)
+        self.__file = open(path, "wb")
+        if amplitude is not None:
+            self.__write_header(amplitude)
+        self.samples = 0
+
+    def write(self, samples):
+        """
+        :param samples: a complex64 array.
+        """
+        if not len(samples):
+            return
+        values = samples.view(numpy.float32)
+        if self.header.scale is None:
+            self.__write_header(PEAK_HEADROOM * float(numpy.max(numpy.abs(values))))
+        values = values / self.header.scale
+        numpy.clip(values, -self.__limit, self.__limit, out=values)
+        numpy.rint(values).astype(self.header.dtype).tofile(self.__file)
+        self.samples += len(samples)
+
+    def close(self):
+        if self.header.scale is None:
+            self.__write_header(DEFAULT_AMPLITUDE)
+        self.__file.close()
+
+    def __write_header(self, amplitude):
+        # the header is written with the first samples, once the scale factor is known
+        self.header.scale = (amplitude if amplitude > 0 else DEFAULT_AMPLITUDE) / float(self.__limit)
+        self.__file.write(self.header.pack())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def _layout(header):
+    """
+    :return: a tuple of the dtype of the I and Q values, the offset of the first sample and the size of a sample.
+    """
+    if header is None:
+        return numpy.dtype(numpy.float32), 0, numpy.dtype(numpy.complex64).itemsize
+    return header.dtype, HEADER_LENGTH, header.sample_size
+
+
+def sample_count(path):
+    """
+    :return: the number of samples in a cfile of raw gr_complex samples or in a quantized cfile.
+    """
+    dtype, offset, sample_size = _layout(read_cfile_header(path))
+    return max(0, (os.path.getsize(path) - offset) // sample_size)
+
+
+def read_samples(path, start=0, count=None):
+    """
+    Read samples from a cfile of raw gr_complex samples or from a quantized cfile.
+
+    :param start: index of the first sample.
+    :param count: number of samples, None to read until the end of the file.
+    :return: a complex64 array.
+    """
+    header = read_cfile_header(path)
+    dtype, offset, sample_size = _layout(header)
+    available = max(0, (os.path.getsize(path) - offset) // sample_size - start)
+    count = available if count is None else min(count, available)
+    with open(path, "rb") as f:
+        f.seek(offset + start * sample_size)
+        values = numpy.fromfile(f, dtype=dtype, count=2 * count).astype(numpy.float32)
+    if header is not None:
+        values *= header.scale
+    return values.view(numpy.complex64)
+
+
+def export_cfile(source, destination, start=0, count=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Convert a range of a cfile, raw or quantized, into a cfile of raw gr_complex samples.
+
+    :param start: index of the first sample.
+    :param count: number of samples, None to convert until the end of the file.
+    :return: the number of converted samples.
+    """
+    samples = 0
+    with open(destination, "wb") as f:
+        while count is None or samples < count:
+            size = chunk_size if count is None else min(chunk_size, count - samples)
+            chunk = read_samples(source, start + samples, size)
+            if not len(chunk):
+                break
+            chunk.tofile(f)
+            samples += len(chunk)
+    return samples
+
+
+def connect_cfile_source(tb, path, start=0, count=None):
+    """
+    Build the blocks that stream the samples of a cfile, raw or quantized, into a flowgraph. Quantized samples are
+    converted to gr_complex while they are read, so no converted copy of the cfile is needed.
+
+    :param tb: the flowgraph the blocks are connected in.
+    :param start: index of the first sample.
+    :param count: number of samples, None for all samples up to the end of the file.
+    :return: the last block of the source, its output are gr_complex samples.
+    """
+    # gnuradio is only needed by the flowgraphs, the format of the cfiles works without it
+    from gnuradio import blocks, gr
+
+    header = read_cfile_header(path)
+    if header is None:
+        source = blocks.file_source(gr.sizeof_gr_complex, path, False)
+        source.seek(start, os.SEEK_SET)
+        samples = source
+    else:
+        # the file source reads single integers, the header is a multiple of their size
+        item_size = header.dtype.itemsize
+        source = blocks.file_source(item_size, path, False)
+        source.seek(HEADER_LENGTH // item_size + 2 * start, os.SEEK_SET)
+        if item_size == 2:
+            converter = blocks.interleaved_short_to_complex(False, False)
+        else:
+            converter = blocks.interleaved_char_to_complex(False)
+        samples = blocks.multiply_const_cc(header.scale)
+        tb.connect(source, converter, samples)
+    if count is None:
+        return samples
+    head = blocks.head(gr.sizeof_gr_complex, count)
+    tb.connect(samples, head)
+    return head
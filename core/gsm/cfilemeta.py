@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+import numpy
+
+META_SUFFIX = ".meta"
+
+# duration of a TDMA frame in seconds and the number of frames until the frame number wraps around
+FRAME_DURATION = 120e-3 / 26
+HYPERFRAME = 2715648
+
+# seconds between two anchors written by a capture
+ANCHOR_INTERVAL = 1.0
+
+# seconds read in front of and behind a window, the anchors are approximate and the receiver needs to
+# synchronize on the cell before it demodulates bursts
+WINDOW_MARGIN = 1.0
+
+
+class CfileMetadata(object):
+    """
+    Sidecar of a cfile with the parameters of the capture and anchors that relate sample offsets in the cfile to
+    frame numbers and wall clock times, so a window of a long capture can be read without demodulating all
+    samples in front of it.
+
+    The sidecar is a text file next to the cfile, with a tab separated name and value per line. The anchors are
+    appended while the capture runs, so an interrupted capture keeps the anchors written until then.
+    """
+
+    def __init__(self, samp_rate, fc=None, ppm=None, start_time=None, anchors=()):
+        """
+        :param samp_rate: the sample rate of the samples in the cfile.
+        :param fc: the center frequency of the capture.
+        :param ppm: the frequency correction of the device.
+        :param start_time: the wall clock time of the first sample.
+        :param anchors: a list of (sample offset, frame number, wall clock time) tuples.
+        """
+        self.samp_rate = samp_rate
+        self.fc = fc
+        self.ppm = ppm
+        self.start_time = start_time
+        self.anchors = list(anchors)
+
+    @staticmethod
+    def load(cfile):
+        """
+        :return: the CfileMetadata of a cfile, None if it has no sidecar.
+        """
+        path = cfile + META_SUFFIX
+        if not os.path.isfile(path):
+            return None
+        values = dict()
+        anchors = []
+        with open(path) as f:
+            for line in f:
+                parts = line.strip().split("\t")
+                if line.startswith("#") or len(parts) < 2:
+                    continue
+                if parts[0] == "anchor" and len(parts) == 4:
+                    anchors.append((int(parts[1]), int(parts[2]), float(parts[3])))
+                else:
+                    values[parts[0]] = parts[1]
+        if "samp_rate" not in values:
+            return None
+        optional = lambda name, convert: convert(values[name]) if name in values else None
+        return CfileMetadata(float(values["samp_rate"]), optional("fc", float), optional("ppm", int),
+                             optional("start_time", float), anchors)
+
+    def offset_at_time(self, timestamp):
+        """
+        :return: the estimated sample offset of a wall clock time, measured from the nearest anchor.
+        """
+        if not self.anchors:
+            if self.start_time is None:
+                raise ValueError("The capture time of the cfile is not known")
+            return int((timestamp - self.start_time) * self.samp_rate)
+        anchors = numpy.array(self.anchors, dtype=numpy.float64)
+        nearest = anchors[numpy.argmin(numpy.abs(anchors[:, 2] - timestamp))]
+        return int(nearest[0] + (timestamp - nearest[2]) * self.samp_rate)
+
+    def offset_at_frame(self, frame_number):
+        """
+        :return: the estimated sample offset of a frame, measured from the anchor with the nearest frame number.
+        """
+        if not self.anchors:
+            raise ValueError("The cfile has no frame number anchors")
+        anchors = numpy.array(self.anchors, dtype=numpy.int64)
+        frames = (frame_number - anchors[:, 1] + HYPERFRAME // 2) % HYPERFRAME - HYPERFRAME // 2
+        nearest = numpy.argmin(numpy.abs(frames))
+        return int(anchors[nearest, 0] + frames[nearest] * FRAME_DURATION * self.samp_rate)
+
+    def offset_at(self, position):
+        """
+        :param position: a position as returned by parse_position.
+        :return: the estimated sample offset of the position.
+        """
+        kind, value = position
+        if kind == "frame":
+            return self.offset_at_frame(value)
+        return self.offset_at_time(value)
+
+    def sample_range(self, start=None, end=None, margin=WINDOW_MARGIN):
+        """
+        Find the samples of a window, including a margin on both sides.
+
+        :param start: the position of the beginning of the window, None for the beginning of the cfile.
+        :param end: the position of the end of the window, None for the end of the cfile.
+        :return: a tuple of the first sample and the number of samples, which is None up to the end of the cfile.
+        """
+        margin = int(margin * self.samp_rate)
+        first = 0 if start is None else max(0, self.offset_at(start) - margin)
+        if end is None:
+            return first, None
+        return first, max(0, self.offset_at(end) + margin - first)
+
+
+class CfileMetadataWriter(object):
+    """
+    Writes the sidecar of a cfile while it is captured. Anchors are written at most every ANCHOR_INTERVAL seconds.
+    """
+
+    def __init__(self, cfile, metadata, interval=ANCHOR_INTERVAL):
+        self.metadata = metadata
+        self.interval = interval
+        self.__last = None
+        self.__file = open(cfile + META_SUFFIX, "w")
+        self.__file.write("# name\tvalue, anchor\tsample offset\tframe number\twall clock time\n")
+        for name in ("samp_rate", "fc", "ppm", "start_time"):
+            value = getattr(metadata, name)
+            if value is not None:
+                self.__file.write("%s\t%r\n" % (name, value))
+        self.__file.flush()
+
+    def anchor_due(self, timestamp=None):
+        """
+        :return: True if the last anchor is older than the interval.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        return self.__last is None or timestamp - self.__last >= self.interval
+
+    def add_anchor(self, offset, frame_number, timestamp=None):
+        """
+        :return: True if the anchor was written, False if the last anchor is too recent.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        if not self.anchor_due(timestamp):
+            return False
+        self.__last = timestamp
+        self.metadata.anchors.append((offset, frame_number, timestamp))
+        self.__file.write("anchor\t%d\t%d\t%r\n" % (offset, frame_number, timestamp))
+        self.__file.flush()
+        return True
+
+    def close(self):
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def parse_position(value, start_time=None):
+    """
+    Parse the position of a window in a capture, given as frame number ('1234567'), as seconds from the start of
+    the capture ('+90' or '90s'), as time of day on the day of the capture ('14:05:30') or as local date and time
+    ('2017-03-01 14:05:30').
+
+    :param start_time: the wall clock time of the first sample of the capture, needed for the relative forms.
+    :return: a tuple ("frame", frame number) or ("time", wall clock time).
+    """
+    value = value.strip()
+    if value.isdigit():
+        return "frame", int(value)
+    if value.startswith("+") or value.endswith("s"):
+        try:
+            seconds = float(value.strip("+s"))
+        except ValueError:
+            raise ValueError("Invalid position %s" % value)
+        if start_time is None:
+            raise ValueError("The start time of the capture is not known")
+        return "time", start_time + seconds
+    for pattern in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return "time", time.mktime(time.strptime(value, pattern))
+        except ValueError:
+            pass
+    try:
+        clock = time.strptime(value, "%H:%M:%S")
+    except ValueError:
+        raise ValueError("Invalid position %s" % value)
+    if start_time is None:
+        raise ValueError("The start time of the capture is not known")
+    day = time.localtime(start_time)
+    timestamp = time.mktime(day[:3] + clock[3:6] + (0, 0, -1))
+    if timestamp < start_time - 60:
+        timestamp += 24 * 3600  # the capture ran over midnight
+    return "time", timestamp
+
+
+def sample_window(cfile, start=None, end=None):
+    """
+    Find the samples of a window of a capture, using the sidecar of the cfile.
+
+    :param start: the beginning of the window in a form understood by parse_position, None for the beginning
+    of the cfile.
+    :param end: the end of the window, None for the end of the cfile.
+    :return: a tuple of the first sample and the number of samples, which is None up to the end of the cfile.
+    :raises ValueError: if a position can not be parsed or the cfile has no sidecar.
+    """
+    if start is None and end is None:
+        return 0, None
+    metadata = CfileMetadata.load(cfile)
+    if metadata is None:
+        raise ValueError("The cfile has no metadata sidecar %s" % (cfile + META_SUFFIX))
+    parse = lambda value: None if value is None else parse_position(value, metadata.start_time)
+    return metadata.sample_range(parse(start), parse(end))
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Offline A5/1 decryption of burst files. The keystreams of all frames of all sessions are generated at once,
+vectorized over the frames and split across worker processes, instead of burst by burst in the flowgraph.
+"""
+import multiprocessing
+
+import numpy
+
+from core.gsm import a51
+from core.gsm.burstcontainer import iter_burst_chunks
+from core.gsm.burstfile import GSMTAP_ARFCN_F_UPLINK, GSMTAP_ARFCN_MASK
+from core.gsm.burstreader import DUMMY_BURST, SS_FILTER_SDCCH8, BurstArrayReader, write_burst_file
+from core.gsm.kcstore import session_windows
+
+# positions of the 114 encrypted bits in a normal burst, i.e. without tail bits, stealing flags and training sequence
+PAYLOAD_POSITIONS = numpy.r_[3:60, 88:145]
+
+# frame counts per task of a worker process
+CHUNK_SIZE = 2048
+
+# bursts of a burst file decrypted at once
+STREAM_CHUNK_SIZE = 1 << 16
+
+# the Cipher Mode Command is sent unencrypted in the four bursts of an SDCCH block, starting at its frame number
+CMC_BURSTS = 4
+
+
+def _keystreams(task):
+    kc, counts = task
+    # the keystreams are packed 8 bits per byte, they are kept for all frames of a burst file
+    return numpy.packbits(a51.burst_keystreams(kc, counts, 2 * a51.BURST_KEYSTREAM_LENGTH), axis=1)
+
+
+def packed_keystreams(kcs, counts, processes=None):
+    """
+    Generate the downlink and uplink keystreams of several keys for many frames each, using one pool of processes.
+
+    :param kcs: the keys as integers.
+    :param counts: for every key, the frame counts.
+    :param processes: number of worker processes, None for one per core.
+    :return: for every key, an uint8 array of shape (len(counts), 29) with the downlink keystream followed by the
+    uplink keystream, packed 8 bits per byte.
+    """
+    tasks = []
+    for kc, key_counts in zip(kcs, counts):
+        tasks.append([(kc, key_counts[i:i + CHUNK_SIZE]) for i in range(0, len(key_counts), CHUNK_SIZE)])
+    flat = [task for key_tasks in tasks for task in key_tasks]
+    if len(flat) <= 1 or processes == 1:
+        results = [_keystreams(task) for task in flat]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_keystreams, flat)
+        finally:
+            pool.close()
+            pool.join()
+
+    keystreams = []
+    for key_tasks in tasks:
+        key_results, results = results[:len(key_tasks)], results[len(key_tasks):]
+        if key_results:
+            keystreams.append(numpy.concatenate(key_results))
+        else:
+            keystreams.append(numpy.zeros((0, (2 * a51.BURST_KEYSTREAM_LENGTH + 7) // 8), dtype=numpy.uint8))
+    return keystreams
+
+
+def frame_keystreams(kc, counts, processes=None):
+    """
+    Generate the downlink and uplink keystreams of a key for many frames, using several processes.
+
+    :param kc: Kc as integer.
+    :param counts: the frame counts.
+    :param processes: number of worker processes, None for one per core.
+    :return: an uint8 array of shape (len(counts), 228), the downlink keystream followed by the uplink keystream.
+    """
+    packed = packed_keystreams([kc], [counts], processes)[0]
+    return numpy.unpackbits(packed, axis=1)[:, :2 * a51.BURST_KEYSTREAM_LENGTH]
+
+
+def decrypt_bursts(bursts, kc, processes=None):
+    """
+    Decrypt bursts in place. All timeslots of a frame share the keystream, so it is generated once per frame.
+
+    :param bursts: an array of burst_dtype.
+    :param kc: Kc as hex string.
+    :param processes: number of worker processes, None for one per core.
+    """
+    if len(bursts) == 0:
+        return
+    counts, frames = numpy.unique(a51.frame_counts(bursts["frame_number"]), return_inverse=True)
+    _apply_keystreams(bursts, frame_keystreams(int(kc, 16), counts, processes), frames)
+
+
+def _apply_keystreams(bursts, keystreams, frames):
+    """
+    :param keystreams: the keystreams of the frames, as returned by frame_keystreams.
+    :param frames: for every burst, the index of the keystream of its frame.
+    """
+    uplink = (bursts["arfcn"] & GSMTAP_ARFCN_F_UPLINK) != 0
+    columns = numpy.where(uplink, a51.BURST_KEYSTREAM_LENGTH, 0)[:, None] + numpy.arange(a51.BURST_KEYSTREAM_LENGTH)
+    bits = bursts["bits"]
+    bits[:, PAYLOAD_POSITIONS] ^= keystreams[frames[:, None], columns]
+    bursts["bits"] = bits
+
+
+def decrypt_burst_file(source, destination, sessions, subslot_mode=SS_FILTER_SDCCH8, processes=None,
+                       chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Write a copy of a burst file with the bursts of the given sessions decrypted, which can be decoded without key.
+    A session starts after the bursts of its Cipher Mode Command at fnr_start and lasts until its fnr_end or until
+    the next session on the same channel. A session with an ARFCN only applies to the bursts of this ARFCN.
+    Dummy bursts are sent unencrypted and are copied unchanged.
+
+    The burst file is read twice in chunks, so it does not need to fit into memory. The first pass collects the
+    frames of every key, their keystreams are then generated at once by one pool of processes. The second pass
+    decrypts the bursts with these keystreams.
+
+    :param source: the burst file, in the grgsm or the container format.
+    :param destination: the decrypted burst file, in the format of grgsm.burst_file_sink.
+    :param sessions: a list of KcEntry.
+    :param subslot_mode: SS_FILTER_SDCCH8 or SS_FILTER_SDCCH4, the channel combination of the subchannels.
+    :param processes: number of worker processes, None for one per core.
+    :param chunk_size: number of bursts decrypted at once.
+    :return: the number of decrypted bursts.
+    """
+    channels = dict()  # (timeslot, subchannel) -> sessions
+    for session in sessions:
+        channels.setdefault((session.timeslot, session.subchannel), []).append(session)
+
+    windows = []  # timeslot, subchannel, frame numbers, ARFCN and index of the key of the encrypted bursts
+    keys = []
+    for timeslot, subchannel in sorted(channels):
+        channel_sessions = sorted(channels[timeslot, subchannel], key=lambda s: s.fnr_start)
+        for fnr_start, fnr_end, session in session_windows(channel_sessions):
+            if session is None:
+                continue
+            # the Cipher Mode Command itself is sent in plain text
+            windows.append((timeslot, subchannel, fnr_start + CMC_BURSTS, fnr_end, session.arfcn, len(keys)))
+            keys.append(session.kc)
+
+    # the frame counts of the encrypted bursts of every key
+    counts = [[] for key in keys]
+    for bursts in iter_burst_chunks(source, chunk_size=chunk_size):
+        owners = _owners(bursts, windows, subslot_mode)
+        for owner in numpy.unique(owners[owners >= 0]):
+            counts[owner].append(numpy.unique(a51.frame_counts(bursts["frame_number"][owners == owner])))
+    counts = [numpy.unique(numpy.concatenate(key_counts)) if key_counts else numpy.zeros(0, dtype=numpy.int64)
+              for key_counts in counts]
+    keystreams = packed_keystreams([int(kc, 16) for kc in keys], counts, processes)
+
+    decrypted = 0
+    open(destination, "wb").close()
+    for bursts in iter_burst_chunks(source, chunk_size=chunk_size):
+        owners = _owners(bursts, windows, subslot_mode)
+        for owner in numpy.unique(owners[owners >= 0]):
+            indices = numpy.flatnonzero(owners == owner)
+            window = bursts[indices]
+            positions = numpy.searchsorted(counts[owner], a51.frame_counts(window["frame_number"]))
+            positions, frames = numpy.unique(positions, return_inverse=True)
+            _apply_keystreams(window, numpy.unpackbits(keystreams[owner][positions], axis=1), frames)
+            bursts[indices] = window
+            decrypted += len(indices)
+        write_burst_file(destination, bursts, append=True)
+    return decrypted
+
+
+def _owners(bursts, windows, subslot_mode):
+    """
+    :param windows: a list of (timeslot, subchannel, fnr_start, fnr_end, arfcn, key index) tuples.
+    :return: the index of the key of every burst, -1 for the bursts outside of the sessions and for dummy bursts,
+    which are sent unencrypted.
+    """
+    owners = numpy.empty(len(bursts), dtype=numpy.int32)
+    owners.fill(-1)
+    if len(bursts) == 0:
+        return owners
+    reader = BurstArrayReader(bursts)
+    fnr_min, fnr_max = int(bursts["frame_number"].min()), int(bursts["frame_number"].max())
+    for timeslot, subchannel, fnr_start, fnr_end, arfcn, key in windows:
+        if fnr_start > fnr_max or (fnr_end is not None and fnr_end < fnr_min):
+            continue
+        indices = reader.select(timeslot, fnr_start, fnr_end, subchannel, subslot_mode)
+        if arfcn is not None:
+            indices = indices[bursts["arfcn"][indices] & GSMTAP_ARFCN_MASK == arfcn]
+        owners[indices] = key
+    owners[numpy.all(bursts["bits"] == DUMMY_BURST, axis=1)] = -1
+    return owners
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel demodulation of cfiles. A cfile is split into chunks of time that are demodulated by separate worker
+processes, each with its own receiver. Every chunk starts with a lead-in that overlaps the previous chunk, so the
+receiver has synchronized on the cell when the samples of the chunk begin. The bursts of the chunks are merged in
+frame order and the bursts demodulated twice in the overlaps are removed.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import numpy
+
+from core.gsm.burstindex import INDEX_SUFFIX
+from core.gsm.burstreader import BurstFileReader
+from core.gsm.cfile import connect_cfile_source, sample_count
+from core.gsm.cfilemeta import HYPERFRAME
+
+# seconds of samples per chunk, without the lead-in
+CHUNK_SECONDS = 30.0
+
+# seconds of samples in front of a chunk, the receiver synchronizes within about a second
+LEAD_IN_SECONDS = 2.0
+
+# sidecar of a burst file with the parameters it was demodulated with
+PARAMETERS_SUFFIX = ".params"
+
+
+def plan_chunks(start, count, samp_rate, chunk_seconds=CHUNK_SECONDS, lead_in_seconds=LEAD_IN_SECONDS):
+    """
+    Split a range of samples into overlapping chunks.
+
+    :param start: the first sample of the range.
+    :param count: the number of samples of the range.
+    :return: a list of (first sample, number of samples) tuples, including the lead-in.
+    """
+    size = max(1, int(chunk_seconds * samp_rate))
+    lead_in = int(lead_in_seconds * samp_rate)
+    chunks = []
+    for offset in range(start, start + count, size):
+        first = max(start, offset - lead_in)
+        chunks.append((first, min(offset + size, start + count) - first))
+    return chunks
+
+
+def _demodulate(task):
+    """
+    Demodulate a chunk of a cfile into a burst file, in a worker process.
+    """
+    cfile, start, count, burst_file, fc, samp_rate, ppm, arfcn = task
+    # gnuradio is only needed by the workers, the planning and merging of the chunks works without it
+    import grgsm
+    from gnuradio import gr
+
+    tb = gr.top_block("Chunk Demodulator")
+    samples = connect_cfile_source(tb, cfile, start, count)
+    receiver = grgsm.receiver(4, ([arfcn]), ([]))
+    burst_file_sink = grgsm.burst_file_sink(burst_file)
+    if fc is not None:
+        input_adapter = grgsm.gsm_input(ppm=ppm, osr=4, fc=fc, samp_rate_in=samp_rate)
+        offset_control = grgsm.clock_offset_control(fc, samp_rate)
+        tb.msg_connect(offset_control, "ctrl", input_adapter, "ctrl_in")
+        tb.msg_connect(receiver, "measurements", offset_control, "measurements")
+    else:
+        input_adapter = grgsm.gsm_input(ppm=ppm, osr=4, samp_rate_in=samp_rate)
+
+    tb.connect(samples, input_adapter, receiver)
+    tb.msg_connect(receiver, "C0", burst_file_sink, "in")
+    tb.run()
+    return burst_file
+
+
+def merge_burst_files(parts, destination):
+    """
+    Merge the burst files of consecutive chunks. A burst is only taken from a chunk if it is later than the last
+    burst taken from the chunks before, which removes the bursts of the overlaps and keeps the frame order.
+
+    :param parts: the burst files of the chunks, in time order.
+    :param destination: the merged burst file.
+    :return: the number of bursts in the merged burst file.
+    """
+    open(destination, "wb").close()
+    merged = 0
+    last = None  # frame number and timeslot of the last burst taken
+    for part in parts:
+        if not os.path.isfile(part):
+            continue
+        with BurstFileReader(part) as reader:
+            if len(reader) == 0:
+                continue
+            frame_numbers = reader.bursts["frame_number"].astype(numpy.int64)
+            timeslots = reader.bursts["timeslot"].astype(numpy.int64)
+            if last is None:
+                later = numpy.ones(len(reader), dtype=bool)
+            else:
+                # frame numbers wrap around, a frame is later if it is less than half a hyperframe ahead
+                ahead = (frame_numbers - last[0]) % HYPERFRAME
+                later = ((ahead > 0) & (ahead < HYPERFRAME // 2)) | ((ahead == 0) & (timeslots > last[1]))
+            indices = numpy.flatnonzero(later)
+            if len(indices) == 0:
+                continue
+            reader.write(destination, indices, append=True)
+            last = (frame_numbers[indices[-1]], timeslots[indices[-1]])
+            merged += len(indices)
+    return merged
+
+
+def demodulate_cfile(cfile, destination, fc, samp_rate, ppm=0, processes=None, start=0, count=None,
+                     chunk_seconds=CHUNK_SECONDS, arfcn=0):
+    """
+    Demodulate a cfile, raw or quantized, into a burst file using several processes.
+
+    :param cfile: the cfile.
+    :param destination: the burst file, in the format of grgsm.burst_file_sink.
+    :param fc: the center frequency of the capture.
+    :param samp_rate: the sample rate of the cfile.
+    :param ppm: the frequency correction.
+    :param processes: number of worker processes, None for one per core.
+    :param start: the first sample to demodulate.
+    :param count: the number of samples to demodulate, None up to the end of the cfile.
+    :param arfcn: the ARFCN of the capture, the bursts are tagged with it.
+    :return: the number of bursts demodulated.
+    """
+    available = max(0, sample_count(cfile) - start)
+    count = available if count is None else min(count, available)
+    directory = tempfile.mkdtemp(prefix="demodulation")
+    try:
+        tasks = [(cfile, first, size, os.path.join(directory, "chunk%05d.bursts" % i), fc, samp_rate, ppm, arfcn)
+                 for i, (first, size) in enumerate(plan_chunks(start, count, samp_rate, chunk_seconds))]
+        if len(tasks) <= 1 or processes == 1:
+            parts = [_demodulate(task) for task in tasks]
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                parts = pool.map(_demodulate, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        return merge_burst_files(parts, destination)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def write_parameters(burst_file, parameters):
+    """
+    Record the parameters a burst file was demodulated with in a sidecar, a text file with a tab separated name
+    and value per line.
+
+    :param parameters: a dictionary mapping names to values.
+    """
+    with open(burst_file + PARAMETERS_SUFFIX, "w") as f:
+        for name in sorted(parameters):
+            f.write("%s\t%r\n" % (name, parameters[name]))
+
+
+def demodulated_with(burst_file, parameters):
+    """
+    :param parameters: a dictionary mapping names to values.
+    :return: True if the burst file exists and was demodulated with exactly these parameters.
+    """
+    path = burst_file + PARAMETERS_SUFFIX
+    if not os.path.isfile(burst_file) or not os.path.isfile(path):
+        return False
+    with open(path) as f:
+        recorded = dict(line.rstrip("\n").split("\t", 1) for line in f if "\t" in line)
+    return recorded == dict((name, repr(value)) for name, value in parameters.items())
+
+
+class DemodulatedCfile(object):
+    """
+    Context manager that provides the bursts of a cfile in a temporary burst file, demodulated by several processes.
+    """
+
+    def __init__(self, cfile, fc, samp_rate, ppm=0, processes=None, start=0, count=None, arfcn=0):
+        self.cfile = cfile
+        self.fc = fc
+        self.samp_rate = samp_rate
+        self.ppm = ppm
+        self.processes = processes
+        self.start = start
+        self.count = count
+        self.arfcn = arfcn
+        self.path = None
+
+    def __enter__(self):
+        fd, self.path = tempfile.mkstemp(suffix=".bursts")
+        os.close(fd)
+        demodulate_cfile(self.cfile, self.path, self.fc, self.samp_rate, self.ppm, self.processes, self.start,
+                         self.count, arfcn=self.arfcn)
+        return self.path
+
+    def __exit__(self, type, value, traceback):
+        if self.path is None:
+            return
+        for path in (self.path, self.path + INDEX_SUFFIX):
+            if os.path.isfile(path):
+                os.remove(path)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import threading
+
+
+class EarlyTermination(object):
+    """
+    Mixin for gr.top_block subclasses that stops the flowgraph as soon as its results are complete, instead of
+    reading the whole source. Subclasses call complete() once they have all results, typically from the message
+    handler of a block that watches the decoded messages. The flowgraph is stopped by a separate thread, because
+    a block can not stop its own flowgraph from within the scheduler:
+
+        class Extractor(EarlyTermination, gr.top_block):
+            def handle_msg(self, msg):
+                self.complete()
+    """
+    stopped_early = False
+    __watcher = None
+    __wake = None
+    __complete = False
+
+    def complete(self):
+        """
+        Declare the results of the flowgraph complete, so it is stopped. Safe to call from any thread.
+        """
+        self.__complete = True
+        if self.__wake is not None:
+            self.__wake.set()
+
+    def start(self, *args, **kwargs):
+        self.stopped_early = False
+        self.__complete = False
+        self.__wake = threading.Event()
+        self.__watcher = threading.Thread(target=self.__watch)
+        self.__watcher.daemon = True
+        self.__watcher.start()
+        super(EarlyTermination, self).start(*args, **kwargs)
+
+    def wait(self):
+        super(EarlyTermination, self).wait()
+        if self.__watcher is not None:
+            self.__wake.set()
+            self.__watcher.join()
+            self.__watcher = None
+
+    def __watch(self):
+        self.__wake.wait()
+        if self.__complete:
+            self.stopped_early = True
+            self.stop()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Channel coding of the GSM control channels (xCCH) as specified in 3GPP TS 45.003, section 4.1.
+A 23 byte L2 message is coded into 4 bursts of 114 bits: fire code, convolutional code and interleaving.
+"""
+import numpy
+
+MESSAGE_LENGTH = 23
+DATA_BITS = MESSAGE_LENGTH * 8
+PARITY_BITS = 40
+TAIL_BITS = 4
+CODED_BITS = 2 * (DATA_BITS + PARITY_BITS + TAIL_BITS)
+BURSTS = 4
+BURST_BITS = CODED_BITS // BURSTS
+
+# fire code generator polynomial (D^23 + 1)(D^17 + D^3 + 1), without the D^40 term
+FIRE_POLYNOMIAL = 0x0004820009
+
+
+def _parity_matrix():
+    # the parity bits are linear in the data bits, row k holds the remainder of D^(40 + 183 - k) mod g(D)
+    matrix = numpy.zeros((DATA_BITS, PARITY_BITS), dtype=numpy.uint8)
+    remainder = FIRE_POLYNOMIAL  # D^40 mod g(D)
+    for k in range(DATA_BITS - 1, -1, -1):
+        matrix[k] = [(remainder >> (PARITY_BITS - 1 - i)) & 1 for i in range(PARITY_BITS)]
+        carry = remainder >> (PARITY_BITS - 1)
+        remainder = (remainder << 1) & ((1 << PARITY_BITS) - 1)
+        if carry:
+            remainder ^= FIRE_POLYNOMIAL
+    return matrix
+
+
+_parity = _parity_matrix()
+
+# position of every coded bit in the 4 bursts: bit k goes to burst k mod 4, position 2 * (49k mod 57) + (k mod 8) / 4
+_interleaving = numpy.array([(k % 4) * BURST_BITS + 2 * ((49 * k) % 57) + ((k % 8) >> 2) for k in range(CODED_BITS)])
+
+# coded bursts by message bytes, the SACCH messages of a cell repeat for every timing advance and session
+CACHE_SIZE = 4096
+_cache = dict()
+
+
+def encode_xcch(messages):
+    """
+    Code L2 messages into bursts.
+
+    :param messages: an uint8 array of shape (number of messages, 23).
+    :return: an uint8 array of shape (number of messages, 4, 114) with the bits of the bursts.
+    """
+    messages = numpy.atleast_2d(numpy.asarray(messages, dtype=numpy.uint8))
+    count = len(messages)
+
+    # the bits of every octet are transmitted least significant bit first
+    data = numpy.unpackbits(messages[:, :, None], axis=2)[:, :, ::-1].reshape(count, DATA_BITS)
+    parity = (data.astype(numpy.int64).dot(_parity) & 1).astype(numpy.uint8) ^ 1  # the remainder is inverted
+
+    u = numpy.zeros((count, DATA_BITS + PARITY_BITS + TAIL_BITS + 4), dtype=numpy.uint8)
+    u[:, 4:4 + DATA_BITS] = data
+    u[:, 4 + DATA_BITS:4 + DATA_BITS + PARITY_BITS] = parity
+    # rate 1/2 convolutional code, G0 = 1 + D^3 + D^4 and G1 = 1 + D + D^3 + D^4
+    current, d1, d3, d4 = u[:, 4:], u[:, 3:-1], u[:, 1:-3], u[:, :-4]
+    coded = numpy.zeros((count, CODED_BITS), dtype=numpy.uint8)
+    coded[:, 0::2] = current ^ d3 ^ d4
+    coded[:, 1::2] = current ^ d1 ^ d3 ^ d4
+
+    bursts = numpy.zeros((count, CODED_BITS), dtype=numpy.uint8)
+    bursts[:, _interleaving] = coded
+    return bursts.reshape(count, BURSTS, BURST_BITS)
+
+
+def prefix_positions(octets):
+    """
+    Get the positions of the coded bits that only depend on the first octets of a message.
+    The convolutional code has no look-ahead, so these are the first 16 coded bits per octet.
+
+    :param octets: the number of octets.
+    :return: the positions in the bursts of a message, flattened to indices of an array of shape (4 * 114).
+    """
+    return _interleaving[:2 * 8 * octets]
+
+
+def encode_xcch_cached(messages):
+    """
+    Code L2 messages into bursts like encode_xcch. Results are cached by message content, the messages that are
+    not in the cache are coded in one batch.
+
+    :param messages: an uint8 array of shape (number of messages, 23).
+    :return: an uint8 array of shape (number of messages, 4, 114) with the bits of the bursts.
+    """
+    messages = numpy.atleast_2d(numpy.asarray(messages, dtype=numpy.uint8))
+    keys = [message.tostring() for message in messages]
+    missing = sorted(set(key for key in keys if key not in _cache))
+    if missing:
+        if len(_cache) + len(missing) > CACHE_SIZE:
+            _cache.clear()
+        coded = encode_xcch(numpy.frombuffer("".join(missing), dtype=numpy.uint8).reshape(-1, MESSAGE_LENGTH))
+        _cache.update(zip(missing, coded))
+    return numpy.array([_cache[key] for key in keys], dtype=numpy.uint8).reshape(len(keys), BURSTS, BURST_BITS)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import time
+from ConfigParser import NoOptionError, NoSectionError
+
+
+class KcEntry(object):
+    """
+    A session key and the session it was used in. The session lasts from fnr_start to fnr_end, or until
+    the next session on the same channel if fnr_end is None.
+    """
+
+    def __init__(self, kc, arfcn, timeslot, subchannel, fnr_start, fnr_end=None, tmsi=None, source=None):
+        self.kc = kc
+        self.arfcn = arfcn
+        self.timeslot = timeslot
+        self.subchannel = subchannel
+        self.fnr_start = fnr_start
+        self.fnr_end = fnr_end
+        self.tmsi = tmsi
+        self.source = source
+
+    def kc_bytes(self):
+        """
+        :return: Kc as list of 8 ints, the format expected by the gr-gsm decryption.
+        """
+        return [int(self.kc[2 * i:2 * i + 2], 16) for i in range(8)]
+
+
+_columns = ["kc", "arfcn", "timeslot", "subchannel", "fnr_start", "fnr_end", "tmsi", "source"]
+
+
+class KcStore(object):
+    """
+    Persistent store of the session keys, indexed by ARFCN, timeslot, subchannel, frame numbers and TMSI.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__db = sqlite3.connect(path)
+        self.__db.text_factory = str
+        self.__db.execute("CREATE TABLE IF NOT EXISTS keys (kc TEXT, arfcn INTEGER, timeslot INTEGER, "
+                          "subchannel INTEGER, fnr_start INTEGER, fnr_end INTEGER, tmsi TEXT, source TEXT, "
+                          "created REAL, UNIQUE (arfcn, timeslot, subchannel, fnr_start))")
+        self.__db.execute("CREATE INDEX IF NOT EXISTS keys_channel ON keys (timeslot, subchannel, fnr_start)")
+        self.__db.execute("CREATE INDEX IF NOT EXISTS keys_tmsi ON keys (tmsi)")
+        self.__db.commit()
+
+    def close(self):
+        self.__db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def add(self, entry):
+        """
+        Store a key. A key stored before for the same session is replaced.
+
+        :param entry: a KcEntry.
+        """
+        # the unique constraint does not apply to sessions without ARFCN or subchannel, NULLs are distinct in SQLite
+        self.__db.execute("DELETE FROM keys WHERE arfcn IS ? AND timeslot IS ? AND subchannel IS ? AND fnr_start IS ?",
+                          [entry.arfcn, entry.timeslot, entry.subchannel, entry.fnr_start])
+        self.__db.execute("INSERT INTO keys VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                          [getattr(entry, name) for name in _columns] + [time.time()])
+        self.__db.commit()
+
+    def sessions(self, arfcn=None, timeslot=None, subchannel=None, tmsi=None):
+        """
+        Find the stored keys. A criterion that is None matches all entries, an entry without ARFCN
+        matches every ARFCN.
+
+        :return: a list of KcEntry ordered by the first frame number of the sessions.
+        """
+        conditions = []
+        values = []
+        if arfcn is not None:
+            conditions.append("(arfcn IS NULL OR arfcn = ?)")
+            values.append(arfcn)
+        for name, value in (("timeslot", timeslot), ("subchannel", subchannel), ("tmsi", tmsi)):
+            if value is not None:
+                conditions.append("%s = ?" % name)
+                values.append(value)
+        query = "SELECT %s FROM keys" % ", ".join(_columns)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return [KcEntry(*row) for row in self.__db.execute(query + " ORDER BY fnr_start", values)]
+
+    def lookup(self, arfcn, timeslot, subchannel, framenumber):
+        """
+        Find the key of the session a frame belongs to.
+
+        :return: a KcEntry or None.
+        """
+        entry = None
+        for session in self.sessions(arfcn, timeslot, subchannel):
+            if session.fnr_start > framenumber:
+                break
+            entry = session
+        if entry is not None and entry.fnr_end is not None and entry.fnr_end < framenumber:
+            return None
+        return entry
+
+
+def parse_kc(value):
+    """
+    Parse a Kc given as '1234567890ABCDEF', '0x1234567890ABCDEF' or '0x12,0x34,0x56,0x78,0x90,0xAB,0xCD,0xEF'.
+
+    :return: Kc as lower case hex string, None if the value is not a valid key.
+    """
+    value = value.strip().lower()
+    try:
+        if "," in value:
+            octets = [int(octet, 16) for octet in value.split(",")]
+            if len(octets) != 8 or not all(0 <= octet <= 255 for octet in octets):
+                return None
+            return "".join("%02x" % octet for octet in octets)
+        if value.startswith("0x"):
+            value = value[2:]
+        int(value, 16)
+    except ValueError:
+        return None
+    if len(value) != 16:
+        return None
+    return value
+
+
+def session_windows(sessions):
+    """
+    Split the timeline of a channel into the windows of the sessions. An open session ends with the next one.
+
+    :param sessions: a list of KcEntry ordered by the first frame number, as returned by KcStore.sessions.
+    :return: a list of (fnr_start, fnr_end, entry) tuples in frame order, that covers all frame numbers.
+    Frames outside of the sessions are in windows without entry, None stands for no bound.
+    """
+    windows = []
+    fnr = None  # first frame number not covered yet
+    for i, session in enumerate(sessions):
+        if fnr is not None and session.fnr_start < fnr:
+            continue  # overlaps the previous session
+        if i + 1 < len(sessions) and sessions[i + 1].fnr_start == session.fnr_start:
+            continue  # replaced by the next session from its first frame on
+        if fnr is None or session.fnr_start > fnr:
+            windows.append((fnr, session.fnr_start - 1, None))
+        fnr_end = session.fnr_end
+        if i + 1 < len(sessions) and (fnr_end is None or fnr_end >= sessions[i + 1].fnr_start):
+            fnr_end = sessions[i + 1].fnr_start - 1
+        windows.append((session.fnr_start, fnr_end, session))
+        if fnr_end is None:
+            return windows
+        fnr = fnr_end + 1
+    windows.append((fnr, None, None))
+    return windows
+
+
+def open_kc_store(config_provider):
+    """
+    Open the key store configured in the gat section.
+
+    :rtype: KcStore
+    """
+    try:
+        path = config_provider.get("gat", "kc_store")
+    except (NoSectionError, NoOptionError):
+        path = os.path.join(config_provider.config_dir, "kc.db")
+    return KcStore(os.path.expanduser(path))
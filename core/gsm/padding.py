@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Detection of randomized LAPDm padding.
+
+Networks can fill the unused octets of LAPDm frames with random bits instead of 0x2b (3GPP TS 44.006),
+then the plaintext of fill frames is unknown and the SDCCH attack cannot succeed. The padding is
+checked in the unencrypted fill frames in front of the Cipher Mode Command: the coded bits of the
+LAPDm header identify a fill frame regardless of its padding.
+"""
+import numpy
+
+from core.gsm import framecoder
+
+# UI frame on SAPI 0 without information, the idle frame of SDCCH
+LAPDM_FILL_FRAME = [0x03, 0x03, 0x01] + [0x2b] * 20
+HEADER_OCTETS = 3
+
+MAX_HEADER_ERRORS = 4  # bit errors in the 48 coded header bits of a fill frame
+MAX_FIXED_ERRORS = 40  # bit errors in the 408 coded bits of a fill frame with fixed padding
+MIN_RANDOM_ERRORS = 120  # random padding differs from the fixed one in about half of the bits
+
+# a cell is considered to randomize the padding above this probability
+RANDOMIZED_THRESHOLD = 0.8
+
+_fill = framecoder.encode_xcch([LAPDM_FILL_FRAME]).reshape(-1)
+_header = framecoder.prefix_positions(HEADER_OCTETS)
+_padding = numpy.setdiff1d(numpy.arange(len(_fill)), _header)
+
+
+def count_fill_frames(messages):
+    """
+    Count the fill frames with fixed and with randomized padding among unencrypted messages.
+
+    :param messages: the bits of the messages, an uint8 array of shape (number of messages, 4, 114).
+    :return: a tuple of the number of fill frames with fixed and with randomized padding.
+    """
+    messages = numpy.asarray(messages, dtype=numpy.uint8).reshape(-1, len(_fill))
+    errors = messages != _fill
+    is_fill = errors[:, _header].sum(axis=1) <= MAX_HEADER_ERRORS
+    padding_errors = errors[:, _padding].sum(axis=1)
+    fixed = int(numpy.sum(is_fill & (padding_errors <= MAX_FIXED_ERRORS)))
+    randomized = int(numpy.sum(is_fill & (padding_errors >= MIN_RANDOM_ERRORS)))
+    return fixed, randomized
+
+
+def randomization_probability(fixed, randomized):
+    """
+    Estimate the probability that a cell randomizes the padding from the fill frames seen so far.
+    Without any fill frame nothing is known about the cell and the probability is 0, so the LAPDm plaintext keeps
+    its default confidence.
+    """
+    if fixed + randomized == 0:
+        return 0.0
+    return (randomized + 1.0) / (fixed + randomized + 2.0)
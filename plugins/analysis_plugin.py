@@ -2,6 +2,7 @@
 import grgsm
 from gnuradio import gr
 
+from core.gsm.burstcontainer import PlainBurstFile
 from core.plugin.interface import plugin, PluginBase, arg, cmd
 
 channel_modes = ['BCCH_SDCCH4', 'SDCCH8']
@@ -16,9 +17,10 @@ class AnalysisPlugin(PluginBase):
     @arg("--bursts", action="store_path", dest="bursts", help="bursts.")
     @cmd(name='analyze', description='Analyze Immediate Assignments and Cipher Mode Commands in a capture.')
     def analyze(self, args):
-        extractor = InfoExtractor(args.timeslot, args.bursts, args.mode, args.gprs)
-        extractor.start()
-        extractor.wait()
+        with PlainBurstFile(args.bursts) as burst_file:
+            extractor = InfoExtractor(args.timeslot, burst_file, args.mode, args.gprs)
+            extractor.start()
+            extractor.wait()
 
         cmc_fnrs = extractor.gsm_extract_cmc.get_framenumbers()
         cmc_a5vs = extractor.gsm_extract_cmc.get_a5_versions()
@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
-import grgsm
-from gnuradio import gr
-
+from core.gsm.burstcontainer import COMPRESSORS, DEFAULT_CHUNK_SIZE, export_burst_file, import_burst_file, \
+    open_burst_reader, read_arfcn
+from core.gsm.burstreader import SS_FILTER_SDCCH4, SS_FILTER_SDCCH8
+from core.gsm.decryption import decrypt_burst_file
+from core.gsm.kcstore import KcEntry, open_kc_store, parse_kc
 from core.plugin.interface import plugin, PluginBase, cmd, arg, subcmd
 
 
@@ -22,45 +24,66 @@ class BurstfilePlugin(PluginBase):
     @arg("output_burst_file", action="store_path", help="The destination burst file")
     @subcmd(name="filter", help="Prints frequency information for an ARFCN.", parent="bursts")
     def filter(self, args):
-        block = BurstFilter(args.input_burst_file, args.output_burst_file, args.after, args.before, args.timeslot,
-                            args.subslot, args.remove_dummy)
-        block.start()
-        block.wait()
-
-
-class BurstFilter(gr.top_block):
-    def __init__(self, source, destination, framenr_ge=None, framenr_le=None, timeslot=None, subslot=None,
-                 filter_dummy_bursts=False):
-        gr.top_block.__init__(self, "Top Block")
-
-        self.burst_file_source = grgsm.burst_file_source(source)
-        self.burst_file_sink = grgsm.burst_file_sink(destination)
-
-        lastblock = self.burst_file_source
-
-        if framenr_ge is not None:
-            self.burst_fnr_filterge = grgsm.burst_fnr_filter(grgsm.FILTER_GREATER_OR_EQUAL, framenr_ge)
-            self.msg_connect((lastblock, 'out'), (self.burst_fnr_filterge, 'in'))
-            lastblock = self.burst_fnr_filterge
+        # filtering needs no demodulation or decoding, so the bursts are selected directly
+        # from the burst file instead of running a flowgraph. Only the bursts within -a and -b are read,
+        # located by the sidecar index or the chunk headers of a container.
+        with open_burst_reader(args.input_burst_file, args.after, args.before) as reader:
+            indices = reader.select(timeslot=args.timeslot, fnr_start=args.after, fnr_end=args.before,
+                                    subslot=args.subslot, subslot_mode=SS_FILTER_SDCCH8,
+                                    remove_dummy=args.remove_dummy)
+            reader.write(args.output_burst_file, indices)
 
-        if framenr_le is not None:
-            self.burst_fnr_filterle = grgsm.burst_fnr_filter(grgsm.FILTER_LESS_OR_EQUAL, framenr_le)
-            self.msg_connect((lastblock, 'out'), (self.burst_fnr_filterle, 'in'))
-            lastblock = self.burst_fnr_filterle
-
-        if timeslot is not None:
-            self.burst_timeslot_filter = grgsm.burst_timeslot_filter(timeslot)
-            self.msg_connect((lastblock, 'out'), (self.burst_timeslot_filter, 'in'))
-            lastblock = self.burst_timeslot_filter
-
-        if subslot is not None:
-            self.burst_sdcch_subslot_filter = grgsm.burst_sdcch_subslot_filter(grgsm.SS_FILTER_SDCCH8, subslot)
-            self.msg_connect((lastblock, 'out'), (self.burst_sdcch_subslot_filter, 'in'))
-            lastblock = self.burst_sdcch_subslot_filter
-
-        if filter_dummy_bursts:
-            self.dummy_burst_filter = grgsm.dummy_burst_filter()
-            self.msg_connect((lastblock, 'out'), (self.dummy_burst_filter, 'in'))
-            lastblock = self.dummy_burst_filter
+    @arg("-c", action="store", dest="compressor", choices=COMPRESSORS, default="zlib",
+         help="Compressor for the chunks of the burst container")
+    @arg("--chunk-size", action="store", dest="chunk_size", type=int, default=DEFAULT_CHUNK_SIZE,
+         help="Number of bursts per chunk of the burst container")
+    @arg("direction", action="store", choices=["import", "export"],
+         help="import converts a gr-gsm burst file into a burst container, export converts it back")
+    @arg("input_burst_file", action="store_path", help="The source burst file")
+    @arg("output_burst_file", action="store_path", help="The destination burst file")
+    @subcmd(name="convert", help="Converts between gr-gsm burst files and compact burst containers.",
+            parent="bursts")
+    def convert(self, args):
+        if args.direction == "import":
+            count = import_burst_file(args.input_burst_file, args.output_burst_file, args.compressor,
+                                      args.chunk_size)
+        else:
+            count = export_burst_file(args.input_burst_file, args.output_burst_file)
+        self.printmsg("Converted %s bursts." % count)
 
-        self.msg_connect((lastblock, 'out'), (self.burst_file_sink, 'in'))
+    @arg("-k", "--kc", action="store", dest="kc",
+         help="A5/1 session key Kc, e.g. 1234567890ABCDEF. Default: the keys of the sessions in the key store")
+    @arg("-t", action="store", dest="timeslot", type=int,
+         help="Timeslot of the session. Default: all timeslots with stored keys, 0 with --kc")
+    @arg("-s", action="store", dest="subslot", type=int, help="Subslot of the session. Default: all subslots")
+    @arg("-m", action="store", dest="mode", choices=["SDCCH8", "BCCH_SDCCH4"], default="SDCCH8",
+         help="Channel combination of the subslots")
+    @arg("--start", action="store", dest="fnr_start", type=int, default=0,
+         help="Framenumber of the Cipher Mode Command of the session given with --kc")
+    @arg("--end", action="store", dest="fnr_end", type=int, help="Last framenumber of the session given with --kc")
+    @arg("--tmsi", action="store", dest="tmsi", help="Use only the stored keys of the sessions of a TMSI")
+    @arg("-j", action="store", dest="processes", type=int,
+         help="Number of processes generating keystream. Default: one per core")
+    @arg("input_burst_file", action="store_path", help="The encrypted burst file")
+    @arg("output_burst_file", action="store_path", help="The decrypted burst file")
+    @subcmd(name="decrypt", help="Decrypts the A5/1 sessions of a burst file, for decoding without key.",
+            parent="bursts")
+    def decrypt(self, args):
+        if args.kc is not None:
+            kc = parse_kc(args.kc)
+            if kc is None:
+                self.printmsg("Invalid Kc %s" % args.kc)
+                return
+            timeslot = args.timeslot if args.timeslot is not None else 0
+            sessions = [KcEntry(kc, None, timeslot, args.subslot, args.fnr_start, args.fnr_end)]
+        else:
+            arfcn = read_arfcn(args.input_burst_file, args.timeslot)
+            with open_kc_store(self._config_provider) as kc_store:
+                sessions = kc_store.sessions(arfcn, args.timeslot, args.subslot, args.tmsi)
+            if not sessions:
+                self.printmsg("No keys stored for the sessions in %s" % args.input_burst_file)
+                return
+        subslot_mode = SS_FILTER_SDCCH4 if args.mode == "BCCH_SDCCH4" else SS_FILTER_SDCCH8
+        count = decrypt_burst_file(args.input_burst_file, args.output_burst_file, sessions, subslot_mode,
+                                   args.processes)
+        self.printmsg("Decrypted %s bursts of %s sessions." % (count, len(sessions)))
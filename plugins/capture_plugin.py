@@ -1,17 +1,31 @@
 # -*- coding: utf-8 -*-
+import array
 import imp
 import os
 import signal
+import struct
+import time
 from math import pi
 
 import grgsm
+import numpy
 import osmosdr
 import pmt
 from gnuradio import blocks
+from gnuradio import filter
 from gnuradio import gr
+from gnuradio.filter import pfb
 
+from core.gsm.burstcontainer import BurstContainerWriter, COMPRESSORS
+from core.gsm.burstfile import GSMTAP_OFFSET_FRAME_NUMBER
+from core.gsm.burstreader import bursts_from_blobs
+from core.gsm.cfile import SAMPLE_FORMATS, QuantizedCfileWriter, decimation, sample_count
+from core.gsm.cfilemeta import CfileMetadata, CfileMetadataWriter
+from core.gsm.ringcapture import TRIGGERS, Retention, SegmentRing, classify_message
 from core.plugin.interface import plugin, arg_group, arg, PluginBase, arg_exclusive, cmd
 
+CHANNEL_SPACING = 200e3
+
 
 @plugin(name='Capture Plugin', description='Captures transmissions.')
 class CapturePlugin(PluginBase):
@@ -22,6 +36,34 @@ class CapturePlugin(PluginBase):
         arg("--length", action="store", dest="length", type=int, help="Length of the record in seconds."),
         arg("--cfile", action="store_path", dest="cfile", help="cfile."),
         arg("--bursts", action="store_path", dest="bursts", help="bursts."),
+        arg("--compact", action="store", dest="compact", choices=COMPRESSORS,
+            help="Write the bursts as compact burst container using the specified compressor."),
+        arg("--cfile-format", action="store", dest="cfile_format", choices=["complex"] + SAMPLE_FORMATS,
+            default="complex",
+            help="Sample format of the cfile. int16 and int8 store quantized samples, decimated to the rate "
+                 "needed for the channel. Default: %(default)s"),
+        arg("--cfile-amplitude", action="store", dest="cfile_amplitude", type=float,
+            help="Largest magnitude of I and Q that is stored in a quantized cfile without clipping. "
+                 "Default: derived from the peak of the first samples"),
+    ])
+    @arg_group(name="Ring buffer", args=[
+        arg("--ring", action="store", dest="ring", type=int,
+            help="Capture continuously into a ring of segment files holding the last RING seconds, only the "
+                 "surroundings of the triggers are kept."),
+        arg("--segments", action="store", dest="segments", type=int, default=16,
+            help="Number of segment files of the ring. Default: %(default)s"),
+        arg("--keep", action="store_path", dest="keep",
+            help="Directory for the kept surroundings of the triggers. Default: retained in the file store"),
+        arg("--before", action="store", dest="before", type=float, default=10,
+            help="Seconds kept before a trigger. Default: %(default)s"),
+        arg("--after", action="store", dest="after", type=float, default=20,
+            help="Seconds kept after a trigger. Default: %(default)s"),
+        arg("--trigger", action="append", dest="triggers", choices=TRIGGERS,
+            help="Event that triggers keeping its surroundings, can be given several times. Default: ia and cmc"),
+        arg("--tmsi", action="append", dest="tmsis", help="TMSI whose paging is a trigger, e.g. 1234ABCD"),
+        arg("--sdcch8", action="append", dest="sdcch8", type=int,
+            help="Timeslot with a SDCCH/8, whose cipher mode commands are triggers as well as the ones on "
+                 "the SDCCH/4 of timeslot 0."),
     ])
     @arg_group(name="RTL-SDR configuration", args=[
         arg("-p", action="store", dest="ppm", type=int, help="Set ppm. Default: value from config file."),
@@ -31,7 +73,10 @@ class CapturePlugin(PluginBase):
     ])
     @arg_exclusive(args=[
         arg("-a", action="store", dest="arfcn", type=int, help="ARFCN of the BTS."),
-        arg("-f", action="store", dest="freq", type=float, help="Frequency of the BTS.")
+        arg("-f", action="store", dest="freq", type=float, help="Frequency of the BTS."),
+        arg("--arfcns", action="store", dest="arfcns",
+            help="Comma separated ARFCNs within the bandwidth of the device, that are captured at once into "
+                 "one burst file per ARFCN, e.g. 10,14,17")
     ])
     @arg("-b", action="store", dest="band", choices=(grgsm.arfcn.get_bands()), help="GSM band of the ARFCN.")
     @cmd(name="capture_rtlsdr", description="Capture and save GSM transmissions using a RTL-SDR device.")
@@ -51,6 +96,10 @@ class CapturePlugin(PluginBase):
         gsmtap = args.gsmtap
         length = args.length
 
+        if args.arfcns is not None:
+            self.capture_channels(args)
+            return
+
         if freq is not None:
             if band:
                 if not grgsm.arfcn.is_valid_downlink(freq, band):
@@ -88,13 +137,108 @@ class CapturePlugin(PluginBase):
         if args.bursts is not None:
             burstfile = self._data_access_provider.getfilepath(args.bursts)
 
-        if cfile is None and burstfile is None:
+        retention = None
+        if args.ring is not None:
+            retention = self.create_retention(args, sample_rate)
+            if retention is None:
+                return
+        elif cfile is None and burstfile is None:
             self.printmsg("You must provide either a cfile or a burst file as destination.")
             return
 
         tb = grgsm_capture(fc=freq, gain=gain, samp_rate=sample_rate,
                            ppm=ppm, arfcn=arfcn, cfile=cfile,
-                           burst_file=burstfile, band=band, verbose=verbose, gsmtap=gsmtap, rec_length=length)
+                           burst_file=burstfile, band=band, verbose=verbose, gsmtap=gsmtap, rec_length=length,
+                           burst_compressor=args.compact, cfile_format=args.cfile_format,
+                           cfile_amplitude=args.cfile_amplitude, retention=retention,
+                           triggers=args.triggers or ["ia", "cmc"],
+                           tmsis=[tmsi.lower() for tmsi in args.tmsis or []], sdcch8=args.sdcch8 or [])
+
+        def signal_handler(signal, frame):
+            tb.stop()
+            tb.wait()
+
+        signal.signal(signal.SIGINT, signal_handler)
+
+        tb.start()
+        tb.wait()
+
+        if retention is not None:
+            retention.flush()
+            retention.ring.close()
+            self.printmsg("Kept the surroundings of %s triggers in %s" % (len(retention.retained),
+                                                                          retention.directory))
+
+    def create_retention(self, args, sample_rate):
+        """
+        Allocate the ring of segment files for a continuous capture.
+
+        :rtype: Retention
+        """
+        if args.ring < args.before + args.after + 1:
+            self.printmsg("The ring must hold more than the seconds kept before and after a trigger.")
+            return None
+        for tmsi in args.tmsis or []:
+            try:
+                if len(tmsi.decode("hex")) != 4:
+                    raise TypeError()
+            except TypeError:
+                self.printmsg("Invalid TMSI %s" % tmsi)
+                return None
+        keep = self._data_access_provider.getfilepath(args.keep if args.keep is not None else "retained")
+        item_size = gr.sizeof_gr_complex
+        segment_size = int(args.ring * sample_rate / args.segments) * item_size
+        ring = SegmentRing(os.path.join(keep, "ring"), segment_size, args.segments)
+        return Retention(ring, keep, sample_rate, item_size, args.before, args.after)
+
+    def capture_channels(self, args):
+        """
+        Capture several ARFCNs with one device. The bursts of every ARFCN are written into their own burst file,
+        named after the burst file given with --bursts and the ARFCN.
+        """
+        try:
+            arfcns = [int(arfcn) for arfcn in args.arfcns.split(",")]
+        except ValueError:
+            self.printmsg("Invalid list of ARFCNs %s" % args.arfcns)
+            return
+
+        freqs = dict()
+        for arfcn in arfcns:
+            bands = [args.band] if args.band else grgsm.arfcn.get_bands()
+            for band in bands:
+                if grgsm.arfcn.is_valid_arfcn(arfcn, band):
+                    freqs[arfcn] = grgsm.arfcn.arfcn2downlink(arfcn, band)
+                    break
+            else:
+                self.printmsg("ARFCN %s is not valid in the specified band" % arfcn)
+                return
+
+        ppm = args.ppm if args.ppm is not None else self._config_provider.getint("rtl_sdr", "ppm")
+        sample_rate = args.samp_rate
+        if sample_rate is None:
+            sample_rate = self._config_provider.getint("rtl_sdr", "sample_rate")
+        gain = args.gain if args.gain is not None else self._config_provider.getint("rtl_sdr", "gain")
+
+        if args.bursts is None:
+            self.printmsg("You must provide a burst file as destination.")
+            return
+        burstfile = self._data_access_provider.getfilepath(args.bursts)
+        burst_files = dict((arfcn, channel_burst_file(burstfile, arfcn)) for arfcn in arfcns)
+        cfile = self._data_access_provider.getfilepath(args.cfile) if args.cfile is not None else None
+
+        plan = grgsm_multi_capture.channel_plan(freqs, sample_rate)
+        if plan is None:
+            self.printmsg("The ARFCNs do not fit into the bandwidth of %s MHz, the sample rate must be a multiple "
+                          "of 200 kHz" % (sample_rate / 1e6))
+            return
+        self.printmsg("Tuned to %s MHz" % (plan[0] / 1e6))
+        for arfcn in arfcns:
+            self.printmsg("ARFCN %s: %s" % (arfcn, burst_files[arfcn]))
+
+        tb = grgsm_multi_capture(freqs, gain=gain, samp_rate=sample_rate, ppm=ppm, burst_files=burst_files,
+                                 cfile=cfile, verbose=args.print_bursts, rec_length=args.length,
+                                 burst_compressor=args.compact, cfile_format=args.cfile_format,
+                                 cfile_amplitude=args.cfile_amplitude)
 
         def signal_handler(signal, frame):
             tb.stop()
@@ -106,9 +250,18 @@ class CapturePlugin(PluginBase):
         tb.wait()
 
 
+def channel_burst_file(burst_file, arfcn):
+    """
+    :return: the path of the burst file of an ARFCN, e.g. capture_10.bursts for capture.bursts.
+    """
+    root, extension = os.path.splitext(burst_file)
+    return "%s_%s%s" % (root, arfcn, extension)
+
+
 class grgsm_capture(gr.top_block):
     def __init__(self, fc, gain, samp_rate, ppm, arfcn, cfile=None, burst_file=None, band=None, verbose=False,
-                 gsmtap=False, rec_length=None, args=""):
+                 gsmtap=False, rec_length=None, burst_compressor=None, cfile_format="complex", cfile_amplitude=None,
+                 retention=None, triggers=(), tmsis=(), sdcch8=(), args=""):
 
         gr.top_block.__init__(self, "Gr-gsm Capture")
 
@@ -127,6 +280,8 @@ class grgsm_capture(gr.top_block):
         self.gsmtap = gsmtap
         self.shiftoff = shiftoff = 400e3
         self.rec_length = rec_length
+        self.burst_compressor = burst_compressor
+        self.retention = retention
 
         ##################################################
         # Processing Blocks
@@ -149,7 +304,7 @@ class grgsm_capture(gr.top_block):
         if self.rec_length is not None:
             self.blocks_head_0 = blocks.head(gr.sizeof_gr_complex, int(samp_rate * rec_length))
 
-        if self.verbose or self.burst_file:
+        if self.verbose or self.burst_file or self.cfile or self.retention:
             self.gsm_receiver = grgsm.receiver(4, ([self.arfcn]), ([]))
             self.gsm_input = grgsm.gsm_input(
                 ppm=0,
@@ -159,12 +314,31 @@ class grgsm_capture(gr.top_block):
             )
             self.gsm_clock_offset_control = grgsm.clock_offset_control(fc - shiftoff, samp_rate, osr=4)
 
-        if self.burst_file:
+        if self.burst_file and self.burst_compressor:
+            self.gsm_burst_file_sink = BurstContainerSink(self.burst_file, self.burst_compressor)
+        elif self.burst_file:
             self.gsm_burst_file_sink = grgsm.burst_file_sink(self.burst_file)
 
-        if self.cfile:
+        if self.retention:
+            # the samples go into the ring, the decoded control channels trigger keeping their surroundings
+            self.blocks_file_sink = RingFileSink(self.retention)
+            self.burst_retainer = BurstRetainer(self.retention)
+            self.capture_trigger = CaptureTrigger(self.retention, triggers, tmsis)
+            self.trigger_demappers = [grgsm.gsm_bcch_ccch_sdcch4_demapper(timeslot_nr=0, )]
+            self.trigger_demappers += [grgsm.gsm_sdcch8_demapper(timeslot_nr=timeslot, ) for timeslot in sdcch8]
+            self.trigger_decoders = [grgsm.control_channels_decoder() for demapper in self.trigger_demappers]
+        elif self.cfile and cfile_format in SAMPLE_FORMATS:
+            # only the channel is kept, at the lowest sample rate that holds it
+            cfile_decimation = decimation(samp_rate)
+            taps = filter.firdes.low_pass(1, samp_rate, 110e3, 60e3, filter.firdes.WIN_BLACKMAN_hARRIS)
+            self.cfile_filter = filter.fir_filter_ccf(cfile_decimation, taps)
+            self.blocks_file_sink = QuantizedFileSink(self.cfile, cfile_format, samp_rate / cfile_decimation, fc,
+                                                      cfile_amplitude)
+            self.metadata_recorder = MetadataRecorder(self.cfile, CfileMetadata(samp_rate / cfile_decimation, fc, ppm))
+        elif self.cfile:
             self.blocks_file_sink = blocks.file_sink(gr.sizeof_gr_complex * 1, self.cfile, False)
             self.blocks_file_sink.set_unbuffered(False)
+            self.metadata_recorder = MetadataRecorder(self.cfile, CfileMetadata(samp_rate, fc, ppm))
 
         if self.verbose:
             self.gsm_bursts_printer_0 = grgsm.bursts_printer(pmt.intern(""),
@@ -185,10 +359,13 @@ class grgsm_capture(gr.top_block):
         else:
             self.connect((self.rtlsdr_source, 0), (self.blocks_rotator, 0))
 
-        if self.cfile:
+        if hasattr(self, "cfile_filter"):
+            self.connect((self.blocks_rotator, 0), (self.cfile_filter, 0))
+            self.connect((self.cfile_filter, 0), (self.blocks_file_sink, 0))
+        elif self.cfile or self.retention:
             self.connect((self.blocks_rotator, 0), (self.blocks_file_sink, 0))
 
-        if self.verbose or self.burst_file:
+        if self.verbose or self.burst_file or self.cfile or self.retention:
             self.connect((self.gsm_input, 0), (self.gsm_receiver, 0))
             self.connect((self.blocks_rotator, 0), (self.gsm_input, 0))
             self.msg_connect(self.gsm_clock_offset_control, "ctrl", self.gsm_input, "ctrl_in")
@@ -196,9 +373,253 @@ class grgsm_capture(gr.top_block):
 
             if self.burst_file:
                 self.msg_connect(self.gsm_receiver, "C0", self.gsm_burst_file_sink, "in")
+            if self.cfile and not self.retention:
+                self.msg_connect(self.gsm_receiver, "C0", self.metadata_recorder, "in")
             if self.verbose:
                 self.msg_connect(self.gsm_receiver, "C0", self.gsm_bursts_printer_0, "bursts")
             if self.gsmtap:
                 self.msg_connect(self.gsm_receiver, "C0", self.bcch_demapper, "bursts")
                 self.msg_connect(self.bcch_demapper, "bursts", self.cch_decoder, "bursts")
                 self.msg_connect(self.cch_decoder, "msgs", self.socket_pdu, "pdus")
+            if self.retention:
+                self.msg_connect(self.gsm_receiver, "C0", self.burst_retainer, "in")
+                for demapper, decoder in zip(self.trigger_demappers, self.trigger_decoders):
+                    self.msg_connect(self.gsm_receiver, "C0", demapper, "bursts")
+                    self.msg_connect(demapper, "bursts", decoder, "bursts")
+                    self.msg_connect(decoder, "msgs", self.capture_trigger, "msgs")
+
+
+class grgsm_multi_capture(gr.top_block):
+    """
+    Captures several ARFCNs within the bandwidth of the device in one pass. A polyphase filter bank splits
+    the received band into 200 kHz channels, every ARFCN is demodulated by its own receiver and its bursts
+    are written into its own burst file.
+    """
+
+    def __init__(self, freqs, gain, samp_rate, ppm, burst_files, cfile=None, verbose=False, rec_length=None,
+                 burst_compressor=None, cfile_format="complex", cfile_amplitude=None, oversample_rate=2, args=""):
+        """
+        :param freqs: a dictionary mapping the ARFCNs to their downlink frequencies.
+        :param burst_files: a dictionary mapping the ARFCNs to their burst files.
+        :param cfile_format: the sample format of the cfile, the whole band is kept without decimation.
+        :param cfile_amplitude: the largest magnitude stored in a quantized cfile, None to derive it from the samples.
+        :param oversample_rate: sample rate of the channels as multiple of the channel spacing.
+        """
+        gr.top_block.__init__(self, "Gr-gsm Multi Channel Capture")
+
+        self.fc, channels = self.channel_plan(freqs, samp_rate)
+        self.samp_rate = samp_rate
+        self.channel_rate = channel_rate = CHANNEL_SPACING * oversample_rate
+        numchans = int(round(samp_rate / CHANNEL_SPACING))
+
+        self.rtlsdr_source = osmosdr.source(args="numchan=" + str(1) + " " + args)
+        self.rtlsdr_source.set_sample_rate(samp_rate)
+        self.rtlsdr_source.set_center_freq(self.fc, 0)
+        self.rtlsdr_source.set_freq_corr(ppm, 0)
+        self.rtlsdr_source.set_dc_offset_mode(2, 0)
+        self.rtlsdr_source.set_iq_balance_mode(2, 0)
+        self.rtlsdr_source.set_gain_mode(True, 0)
+        self.rtlsdr_source.set_gain(gain, 0)
+        self.rtlsdr_source.set_if_gain(20, 0)
+        self.rtlsdr_source.set_bb_gain(20, 0)
+        self.rtlsdr_source.set_antenna("", 0)
+        self.rtlsdr_source.set_bandwidth(samp_rate, 0)
+
+        source = self.rtlsdr_source
+        if rec_length is not None:
+            self.blocks_head_0 = blocks.head(gr.sizeof_gr_complex, int(samp_rate * rec_length))
+            self.connect((self.rtlsdr_source, 0), (self.blocks_head_0, 0))
+            source = self.blocks_head_0
+
+        if cfile and cfile_format in SAMPLE_FORMATS:
+            self.blocks_file_sink = QuantizedFileSink(cfile, cfile_format, samp_rate, self.fc, cfile_amplitude)
+            self.connect((source, 0), (self.blocks_file_sink, 0))
+        elif cfile:
+            self.blocks_file_sink = blocks.file_sink(gr.sizeof_gr_complex * 1, cfile, False)
+            self.blocks_file_sink.set_unbuffered(False)
+            self.connect((source, 0), (self.blocks_file_sink, 0))
+        # the frame numbers of the anchors are taken from the first ARFCN
+        self.metadata_recorder = MetadataRecorder(cfile, CfileMetadata(samp_rate, self.fc, ppm)) if cfile else None
+
+        taps = filter.firdes.low_pass(1, samp_rate, 125e3, 50e3, filter.firdes.WIN_BLACKMAN_hARRIS)
+        self.channelizer = pfb.channelizer_ccf(numchans, taps, oversample_rate)
+        self.connect((source, 0), (self.channelizer, 0))
+
+        # the blocks of every channel, unused channels are terminated by null sinks
+        self.receivers = dict()
+        self.null_sinks = []
+        used = dict((channels[arfcn], arfcn) for arfcn in channels)
+        for output in range(numchans):
+            if output not in used:
+                self.null_sinks.append(blocks.null_sink(gr.sizeof_gr_complex))
+                self.connect((self.channelizer, output), (self.null_sinks[-1], 0))
+                continue
+            arfcn = used[output]
+            gsm_input = grgsm.gsm_input(ppm=0, osr=4, fc=freqs[arfcn], samp_rate_in=channel_rate)
+            gsm_receiver = grgsm.receiver(4, ([arfcn]), ([]))
+            clock_offset_control = grgsm.clock_offset_control(freqs[arfcn], channel_rate, osr=4)
+            if burst_compressor:
+                burst_sink = BurstContainerSink(burst_files[arfcn], burst_compressor)
+            else:
+                burst_sink = grgsm.burst_file_sink(burst_files[arfcn])
+            self.receivers[arfcn] = (gsm_input, gsm_receiver, clock_offset_control, burst_sink)
+
+            self.connect((self.channelizer, output), (gsm_input, 0))
+            self.connect((gsm_input, 0), (gsm_receiver, 0))
+            self.msg_connect(clock_offset_control, "ctrl", gsm_input, "ctrl_in")
+            self.msg_connect(gsm_receiver, "measurements", clock_offset_control, "measurements")
+            self.msg_connect(gsm_receiver, "C0", burst_sink, "in")
+            if self.metadata_recorder is not None and arfcn == min(channels):
+                self.msg_connect(gsm_receiver, "C0", self.metadata_recorder, "in")
+            if verbose:
+                printer = grgsm.bursts_printer(pmt.intern(""), False, False, False, False)
+                self.receivers[arfcn] += (printer, )
+                self.msg_connect(gsm_receiver, "C0", printer, "bursts")
+
+    @staticmethod
+    def channel_plan(freqs, samp_rate):
+        """
+        Choose the center frequency for capturing several ARFCNs at once. The center frequency is on the channel
+        raster, so every ARFCN falls into one channel of the filter bank, but not on an ARFCN, which would suffer
+        from the DC offset of the device. The outermost channels are left out, they are attenuated by the
+        anti-aliasing filter of the device.
+
+        :param freqs: a dictionary mapping the ARFCNs to their downlink frequencies.
+        :param samp_rate: the sample rate of the device, a multiple of the channel spacing.
+        :return: a tuple of the center frequency and a dictionary mapping the ARFCNs to the channels of the
+        filter bank, None if the ARFCNs do not fit into the bandwidth.
+        """
+        numchans = int(round(samp_rate / CHANNEL_SPACING))
+        if abs(numchans * CHANNEL_SPACING - samp_rate) > 1 or numchans < 3 or not freqs:
+            return None
+        low, high = min(freqs.values()), max(freqs.values())
+        candidates = [low + CHANNEL_SPACING * k for k in range(-numchans, numchans + 1)]
+        for center in sorted(candidates, key=lambda c: abs(c - (low + high) / 2.0)):
+            offsets = dict((arfcn, int(round((freqs[arfcn] - center) / CHANNEL_SPACING))) for arfcn in freqs)
+            if 0 in offsets.values() or max(abs(offset) for offset in offsets.values()) > (numchans - 2) // 2:
+                continue
+            # the filter bank outputs the channels in FFT order, negative offsets at the end
+            return center, dict((arfcn, offsets[arfcn] % numchans) for arfcn in offsets)
+        return None
+
+
+class BurstContainerSink(gr.basic_block):
+    """
+    Message sink that writes the received bursts into a compact burst container.
+    """
+
+    def __init__(self, burst_file, compressor="zlib"):
+        gr.basic_block.__init__(self, name="burst_container_sink", in_sig=[], out_sig=[])
+        self.writer = BurstContainerWriter(burst_file, compressor)
+        self.message_port_register_in(pmt.intern("in"))
+        self.set_msg_handler(pmt.intern("in"), self.handle_msg)
+
+    def handle_msg(self, msg):
+        blob = numpy.array(pmt.u8vector_elements(pmt.cdr(msg)), dtype=numpy.uint8)
+        self.writer.write(bursts_from_blobs(blob.reshape(1, -1)))
+
+    def stop(self):
+        self.writer.close()
+        return True
+
+
+class QuantizedFileSink(gr.sync_block):
+    """
+    Sink that writes the samples into a quantized cfile.
+    """
+
+    def __init__(self, path, sample_format, samp_rate, fc=None, amplitude=None):
+        gr.sync_block.__init__(self, name="quantized_file_sink", in_sig=[numpy.complex64], out_sig=None)
+        self.writer = QuantizedCfileWriter(path, sample_format, samp_rate, fc, amplitude)
+
+    def work(self, input_items, output_items):
+        self.writer.write(input_items[0])
+        return len(input_items[0])
+
+    def stop(self):
+        self.writer.close()
+        return True
+
+
+class MetadataRecorder(gr.basic_block):
+    """
+    Message sink for received bursts, that writes the sidecar of a cfile while it is captured. The anchors relate
+    the number of samples in the cfile to the frame number of the burst just received and the wall clock time.
+    The samples of a burst are written shortly before it is received, so the anchors are accurate to the
+    latency of the receiver and the buffers of the file sink.
+    """
+
+    def __init__(self, cfile, metadata):
+        gr.basic_block.__init__(self, name="metadata_recorder", in_sig=[], out_sig=[])
+        self.cfile = cfile
+        self.metadata = metadata
+        self.writer = None
+        self.message_port_register_in(pmt.intern("in"))
+        self.set_msg_handler(pmt.intern("in"), self.handle_msg)
+
+    def start(self):
+        self.metadata.start_time = time.time()
+        self.writer = CfileMetadataWriter(self.cfile, self.metadata)
+        return True
+
+    def stop(self):
+        if self.writer is not None:
+            self.writer.close()
+        return True
+
+    def handle_msg(self, msg):
+        if self.writer is None or not self.writer.anchor_due() or not os.path.isfile(self.cfile):
+            return
+        blob = array.array("B", pmt.u8vector_elements(pmt.cdr(msg))).tostring()
+        frame_number = struct.unpack_from(">I", blob, GSMTAP_OFFSET_FRAME_NUMBER)[0]
+        self.writer.add_anchor(sample_count(self.cfile), frame_number)
+
+
+class RingFileSink(gr.sync_block):
+    """
+    Sink that writes the samples into the ring of a Retention and keeps the windows of the triggers.
+    """
+
+    def __init__(self, retention):
+        gr.sync_block.__init__(self, name="ring_file_sink", in_sig=[numpy.complex64], out_sig=None)
+        self.retention = retention
+
+    def work(self, input_items, output_items):
+        self.retention.ring.write(input_items[0].tostring())
+        self.retention.poll()
+        return len(input_items[0])
+
+
+class BurstRetainer(gr.basic_block):
+    """
+    Message sink that remembers the received bursts for the windows of the triggers.
+    """
+
+    def __init__(self, retention):
+        gr.basic_block.__init__(self, name="burst_retainer", in_sig=[], out_sig=[])
+        self.retention = retention
+        self.message_port_register_in(pmt.intern("in"))
+        self.set_msg_handler(pmt.intern("in"), self.handle_msg)
+
+    def handle_msg(self, msg):
+        self.retention.add_burst(numpy.array(pmt.u8vector_elements(pmt.cdr(msg)), dtype=numpy.uint8))
+
+
+class CaptureTrigger(gr.basic_block):
+    """
+    Message sink for decoded control channel messages, that triggers keeping the surroundings of events.
+    """
+
+    def __init__(self, retention, triggers, tmsis):
+        gr.basic_block.__init__(self, name="capture_trigger", in_sig=[], out_sig=[])
+        self.retention = retention
+        self.triggers = triggers
+        self.tmsis = tmsis
+        self.message_port_register_in(pmt.intern("msgs"))
+        self.set_msg_handler(pmt.intern("msgs"), self.handle_msg)
+
+    def handle_msg(self, msg):
+        message = array.array("B", pmt.u8vector_elements(pmt.cdr(msg))).tostring()
+        reason = classify_message(message, self.triggers, self.tmsis)
+        if reason is not None:
+            self.retention.trigger(reason)
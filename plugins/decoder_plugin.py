@@ -5,6 +5,11 @@ import os
 
 import grgsm
 
+from core.gsm.burstcontainer import BurstFileWindow, PlainBurstFile, read_arfcn
+from core.gsm.cfile import connect_cfile_source, read_cfile_header
+from core.gsm.cfilemeta import CfileMetadata, sample_window
+from core.gsm.demodulation import DemodulatedCfile
+from core.gsm.kcstore import open_kc_store, session_windows
 from core.plugin.interface import plugin, PluginBase, cmd, arg, arg_exclusive, arg_group
 
 
@@ -43,13 +48,24 @@ class DecoderPlugin(PluginBase):
         arg("-p", action="store", dest="ppm", type=int, help="Set ppm. Default: value from config file."),
         arg("-s", action="store", dest="samp_rate", type=float,
             help="Set sample rate. Default: value from config file."),
-        arg("-g", action="store", type=float, dest="gain", help="Set gain. Default: value from config file.")
+        arg("-g", action="store", type=float, dest="gain", help="Set gain. Default: value from config file."),
+        arg("--from", action="store", dest="window_start",
+            help="Start of the window to read, as frame number, seconds from the start of the capture (+90), time "
+                 "of day (14:05:30) or date and time (2017-03-01 14:05:30). Needs the metadata of the capture."),
+        arg("--to", action="store", dest="window_end", help="End of the window to read, in the forms of --from."),
+        arg("-j", action="store", dest="processes", type=int,
+            help="Demodulate the cfile in chunks with this number of processes, 0 for one per core. "
+                 "Default: a single flowgraph"),
     ])
     @arg_group(name="Decryption Options", args=[
         arg("-5", "--a5", action="store", dest="a5", type=int, help="A5 version.", default=1),
         arg("-k", "--kc", action="store", dest="kc", help="A5 session key Kc. Valid formats are "
                                                                       "'0x12,0x34,0x56,0x78,0x90,0xAB,0xCD,0xEF' "
-                                                                      "and '1234567890ABCDEF'"),
+                                                                      "and '1234567890ABCDEF'."),
+        arg("--use-kc-store", action="store_true", dest="use_kc_store", default=False,
+            help="Decrypt the sessions in a burst file with their keys from the key store."),
+        arg("--tmsi", action="store", dest="tmsi", help="Use only the stored keys of the sessions of a TMSI. "
+                                                         "Implies --use-kc-store."),
     ])
     @arg_group(name="TCH Options", args=[
         arg("-c", action="store", dest="speech_codec", choices=tch_codecs.keys(), help="TCH-F speech codec."),
@@ -109,6 +125,14 @@ class DecoderPlugin(PluginBase):
         if args.kc is not None:
             kc_parse(kc, args.kc)
 
+        # the metadata of a capture and the header of a quantized cfile know the sample rate and center frequency
+        if args.cfile is not None:
+            cfile_path = self._data_access_provider.getfilepath(args.cfile)
+            for known in (CfileMetadata.load(cfile_path), read_cfile_header(cfile_path)):
+                if known is not None:
+                    sample_rate = known.samp_rate
+                    if freq is None and arfcn is None:
+                        freq = known.fc
 
         if freq is not None:
             if band:
@@ -151,14 +175,61 @@ class DecoderPlugin(PluginBase):
             self.printmsg("You must provide either a cfile or a burst file as destination.")
             return
 
-        tb = decoder.grgsm_decoder(timeslot=timeslot, subslot=subslot, chan_mode=mode,
-                                   burst_file=burstfile,
-                                   cfile=cfile, fc=freq, samp_rate=sample_rate,
-                                   a5=args.a5, a5_kc=kc,
-                                   speech_file=args.speech_output_file,
-                                   speech_codec=self.tch_codecs.get(args.speech_codec),
-                                   enable_voice_boundary_detection=False,
-                                   verbose=verbose,
-                                   print_bursts=args.print_bursts, ppm=ppm)
-        tb.start()
-        tb.wait()
+        window = (0, None)
+        if cfile is not None:
+            try:
+                window = sample_window(cfile, args.window_start, args.window_end)
+            except ValueError as e:
+                self.printmsg(str(e))
+                return
+            if args.processes is not None:
+                # the bursts demodulated in parallel are decoded like a captured burst file
+                with DemodulatedCfile(cfile, freq, sample_rate, ppm, args.processes or None, *window,
+                                      arfcn=arfcn or 0) as bursts:
+                    args.cfile, args.bursts, args.processes = None, bursts, None
+                    self.decode(args)
+                return
+
+        def run(burst_file, kc, cfile=None, subslot=subslot):
+            tb = decoder.grgsm_decoder(timeslot=timeslot, subslot=subslot, chan_mode=mode,
+                                       burst_file=burst_file,
+                                       cfile=cfile, fc=freq, samp_rate=sample_rate,
+                                       a5=args.a5, a5_kc=kc,
+                                       speech_file=args.speech_output_file,
+                                       speech_codec=self.tch_codecs.get(args.speech_codec),
+                                       enable_voice_boundary_detection=False,
+                                       verbose=verbose,
+                                       print_bursts=args.print_bursts, ppm=ppm)
+            if cfile is not None:
+                # grgsm_decode reads raw gr_complex samples from the beginning of the cfile, quantized samples
+                # and windows are streamed by a source of our own
+                tb.disconnect(tb.file_source, tb.input_adapter)
+                tb.connect(connect_cfile_source(tb, cfile, *window), tb.input_adapter)
+            tb.start()
+            tb.wait()
+
+        if args.kc is None and (args.use_kc_store or args.tmsi is not None) and burstfile is not None:
+            burst_arfcn = read_arfcn(burstfile, timeslot)
+            with open_kc_store(self._config_provider) as kc_store:
+                sessions = kc_store.sessions(burst_arfcn, timeslot, subslot, args.tmsi)
+            if not sessions:
+                self.printmsg("No stored keys for timeslot %s" % timeslot)
+                return
+            subchannels = collections.OrderedDict()
+            for session in sessions:
+                subchannels.setdefault(session.subchannel, []).append(session)
+            # the flowgraph decrypts with a single key, so every session is decoded with its own key from a
+            # window of the burst file. The subchannels of a timeslot have sessions of their own and are
+            # decoded one after the other.
+            for subchannel, channel_sessions in subchannels.items():
+                for fnr_start, fnr_end, session in session_windows(channel_sessions):
+                    if session is not None:
+                        self.printmsg("Session at %s on subchannel %s: Kc %s" % (session.fnr_start,
+                                                                                 session.subchannel, session.kc))
+                    with BurstFileWindow(burstfile, fnr_start, fnr_end, timeslot) as window_file:
+                        run(window_file, session.kc_bytes() if session is not None else [], subslot=subchannel)
+            return
+
+        # burst containers are exported to a temporary file in the format of grgsm_decode
+        with PlainBurstFile(burstfile) as burstfile:
+            run(burstfile, kc, cfile)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from core.gsm.kcstore import KcEntry, open_kc_store, parse_kc
+from core.plugin.interface import plugin, PluginBase, cmd, arg, subcmd
+
+
+@plugin(name="Kc Store Plugin", description="Manages the session keys used by the decoder")
+class KcStorePlugin(PluginBase):
+    @cmd(name="kc_store", description="Manages the session keys used by the decoder.", parent=True)
+    def kc_store(self, args):
+        pass
+
+    @arg("-a", action="store", dest="arfcn", type=int, help="List only keys of sessions on this ARFCN")
+    @arg("-t", action="store", dest="timeslot", type=int, help="List only keys of sessions on this timeslot")
+    @arg("-s", action="store", dest="subchannel", type=int, help="List only keys of sessions on this subchannel")
+    @arg("--tmsi", action="store", dest="tmsi", help="List only keys of sessions of this TMSI")
+    @subcmd(name="list", help="Lists the stored keys.", parent="kc_store")
+    def list_keys(self, args):
+        with open_kc_store(self._config_provider) as kc_store:
+            sessions = kc_store.sessions(args.arfcn, args.timeslot, args.subchannel, args.tmsi)
+        self.printmsg("Kc\t\t\tARFCN\tTS\tSub\tStart\tEnd\tTMSI\tSource")
+        for s in sessions:
+            self.printmsg("\t".join("-" if value is None else str(value) for value in (
+                s.kc, s.arfcn, s.timeslot, s.subchannel, s.fnr_start, s.fnr_end, s.tmsi, s.source)))
+
+    @arg("-a", action="store", dest="arfcn", type=int, help="ARFCN of the session. Default: any ARFCN")
+    @arg("-t", action="store", dest="timeslot", type=int, help="Timeslot of the session.", default=0)
+    @arg("-s", action="store", dest="subchannel", type=int, help="Subchannel of the session.")
+    @arg("--end", action="store", dest="fnr_end", type=int,
+         help="Last framenumber of the session. Default: until the next session on the channel")
+    @arg("--tmsi", action="store", dest="tmsi", help="TMSI of the session")
+    @arg("kc", action="store", help="The session key, e.g. 1234567890ABCDEF")
+    @arg("fnr_start", action="store", type=int, help="First framenumber of the session, e.g. of the CMC")
+    @subcmd(name="add", help="Stores the key of a session.", parent="kc_store")
+    def add_key(self, args):
+        kc = parse_kc(args.kc)
+        if kc is None:
+            self.printmsg("Invalid Kc %s" % args.kc)
+            return
+        with open_kc_store(self._config_provider) as kc_store:
+            kc_store.add(KcEntry(kc, args.arfcn, args.timeslot, args.subchannel, args.fnr_start, args.fnr_end,
+                                 args.tmsi))
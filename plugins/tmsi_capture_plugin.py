@@ -5,6 +5,10 @@ import grgsm
 from gnuradio import blocks
 from gnuradio import gr
 
+from core.gsm.burstcontainer import PlainBurstFile
+from core.gsm.cfile import connect_cfile_source, read_cfile_header
+from core.gsm.cfilemeta import CfileMetadata, sample_window
+from core.gsm.demodulation import DemodulatedCfile
 from core.plugin.interface import plugin, PluginBase, cmd, arg_group, arg, arg_exclusive, PluginError
 
 
@@ -23,7 +27,14 @@ class TmsiPlugin(PluginBase):
         arg("-p", action="store", dest="ppm", type=int, help="Set ppm. Default: value from config file."),
         arg("-s", action="store", dest="samp_rate", type=float,
             help="Set sample rate. Default: value from config file."),
-        arg("-g", action="store", type=float, dest="gain", help="Set gain. Default: value from config file.")
+        arg("-g", action="store", type=float, dest="gain", help="Set gain. Default: value from config file."),
+        arg("--from", action="store", dest="window_start",
+            help="Start of the window to read, as frame number, seconds from the start of the capture (+90), time "
+                 "of day (14:05:30) or date and time (2017-03-01 14:05:30). Needs the metadata of the capture."),
+        arg("--to", action="store", dest="window_end", help="End of the window to read, in the forms of --from."),
+        arg("-j", action="store", dest="processes", type=int,
+            help="Demodulate the cfile in chunks with this number of processes, 0 for one per core. "
+                 "Default: a single flowgraph"),
     ])
     @arg("-t", action="store", dest="timeslot", type=int, help="Timeslot of the CCCH.", default=0)
     @arg_exclusive(args=[
@@ -55,11 +66,34 @@ class TmsiPlugin(PluginBase):
         if args.bursts is not None:
             burstfile = self._data_access_provider.getfilepath(args.bursts)
 
-        flowgraph = TmsiCapture(timeslot=timeslot, chan_mode=mode,
-                                burst_file=burstfile,
-                                cfile=cfile, fc=freq, samp_rate=sample_rate, ppm=ppm)
-        flowgraph.start()
-        flowgraph.wait()
+        window = (0, None)
+        if cfile is not None:
+            try:
+                window = sample_window(cfile, args.window_start, args.window_end)
+            except ValueError as e:
+                raise PluginError(str(e))
+            # the metadata of a capture and the header of a quantized cfile know the sample rate and center frequency
+            for known in (CfileMetadata.load(cfile), read_cfile_header(cfile)):
+                if known is not None:
+                    sample_rate = known.samp_rate
+                    freq = freq if freq is not None else known.fc
+            if args.processes is not None:
+                if sample_rate is None:
+                    raise PluginError("Provide the sample rate of the cfile.")
+                # the bursts demodulated in parallel are analysed like a captured burst file
+                with DemodulatedCfile(cfile, freq, sample_rate, ppm or 0, args.processes or None, *window,
+                                      arfcn=arfcn or 0) as bursts:
+                    args.cfile, args.bursts, args.processes = None, bursts, None
+                    self.tmsi_capture(args)
+                return
+
+        with PlainBurstFile(burstfile) as burstfile:
+            flowgraph = TmsiCapture(timeslot=timeslot, chan_mode=mode,
+                                    burst_file=burstfile,
+                                    cfile=cfile, cfile_window=window, fc=freq, samp_rate=sample_rate, ppm=ppm,
+                                    arfcn=arfcn or 0)
+            flowgraph.start()
+            flowgraph.wait()
 
         tmsis = dict()
         imsis = dict()
@@ -107,7 +141,7 @@ class TmsiPlugin(PluginBase):
 class TmsiCapture(gr.top_block):
     def __init__(self, timeslot=0, chan_mode='BCCH',
                  burst_file=None,
-                 cfile=None, fc=None, samp_rate=2e6, ppm=0):
+                 cfile=None, cfile_window=(0, None), fc=None, samp_rate=2e6, ppm=0, arfcn=0):
 
         gr.top_block.__init__(self, "gr-gsm TMSI Capture")
 
@@ -118,9 +152,11 @@ class TmsiCapture(gr.top_block):
         self.chan_mode = chan_mode
         self.burst_file = burst_file
         self.cfile = cfile
+        self.cfile_window = cfile_window
         self.fc = fc
         self.samp_rate = samp_rate
         self.ppm = ppm
+        self.arfcn = arfcn
 
         ##################################################
         # Blocks
@@ -129,8 +165,8 @@ class TmsiCapture(gr.top_block):
         if self.burst_file:
             self.burst_file_source = grgsm.burst_file_source(burst_file)
         elif self.cfile:
-            self.file_source = blocks.file_source(gr.sizeof_gr_complex * 1, self.cfile, False)
-            self.receiver = grgsm.receiver(4, ([0]), ([]))
+            self.file_source = connect_cfile_source(self, self.cfile, *self.cfile_window)
+            self.receiver = grgsm.receiver(4, ([self.arfcn]), ([]))
             if self.fc is not None:
                 self.input_adapter = grgsm.gsm_input(ppm=ppm, osr=4, fc=self.fc, samp_rate_in=samp_rate)
                 self.offset_control = grgsm.clock_offset_control(self.fc, self.samp_rate)
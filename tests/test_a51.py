@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy
+
+from core.gsm import a51
+
+
+class A51Test(unittest.TestCase):
+    def test_reference_vector(self):
+        # test vector of the reference implementation by Briceno, Goldberg and Wagner
+        keystreams = a51.burst_keystreams(0x1223456789abcdef, [0x134], 2 * a51.BURST_KEYSTREAM_LENGTH)[0]
+        downlink = numpy.packbits(keystreams[:a51.BURST_KEYSTREAM_LENGTH]).tostring()
+        uplink = numpy.packbits(keystreams[a51.BURST_KEYSTREAM_LENGTH:]).tostring()
+        self.assertEqual(downlink.encode("hex"), "534eaa582fe8151ab6e1855a728c00")
+        self.assertEqual(uplink.encode("hex"), "24fd35a35d5fb6526d32f906df1ac0")
+
+    def test_frame_counts(self):
+        frame_numbers = [0, 1326 * 3 + 51 + 26 + 5, 2715647]
+        expected = [((fn // 1326) << 11) | ((fn % 51) << 5) | (fn % 26) for fn in frame_numbers]
+        self.assertEqual(list(a51.frame_counts(frame_numbers)), expected)
+
+    def test_kc_from_state(self):
+        kc = 0x0123456789abcdef
+        self.assertEqual(a51.kc_from_state(int(a51.loaded_states(kc, [0])[0])), kc)
+
+    def test_find_kc(self):
+        kc = 0x0123456789abcdef
+        count, check_count = [int(c) for c in a51.frame_counts([1000, 1001])]
+        bitpos = 17
+        # the state that outputs keystream bit bitpos, as reported by Kraken
+        registers = a51.unpack(a51.loaded_states(kc, [count]))
+        state = int(a51.pack(*a51.advance(*registers, clocks=a51.MIXING_CLOCKS + 1 + bitpos))[0])
+        check_keystream = a51.burst_keystreams(kc, [check_count])[0]
+        self.assertEqual(a51.find_kc([(state, bitpos)], count, check_count, check_keystream), ["0123456789abcdef"])
+        self.assertEqual(a51.find_kc([(state, bitpos)], count, check_count, 1 - check_keystream), [])
+        self.assertEqual(a51.find_kc([], count, check_count, check_keystream), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
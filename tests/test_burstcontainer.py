@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from core.gsm.burstcontainer import BurstContainerReader, BurstWindowReader, import_burst_file, iter_burst_chunks, \
+    read_arfcn
+from core.gsm.burstreader import burst_dtype, write_burst_file
+
+
+def make_bursts(count, timeslots=8):
+    bursts = numpy.zeros(count, dtype=burst_dtype)
+    bursts["frame_number"] = 1000 + numpy.arange(count) // timeslots
+    bursts["timeslot"] = numpy.arange(count) % timeslots
+    bursts["arfcn"] = numpy.where(bursts["timeslot"] == 5, 43, 42)
+    bursts["bits"] = numpy.random.RandomState(1).randint(0, 2, (count, bursts["bits"].shape[1]))
+    return bursts
+
+
+class BurstContainerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.burst_file = os.path.join(self.directory, "capture.bursts")
+        self.container = os.path.join(self.directory, "capture.gat")
+        self.bursts = make_bursts(8000)
+        write_burst_file(self.burst_file, self.bursts)
+        import_burst_file(self.burst_file, self.container, chunk_size=1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        with BurstContainerReader(self.container) as reader:
+            self.assertTrue(numpy.array_equal(reader.bursts, self.bursts))
+
+    def test_chunks_of_a_window(self):
+        # the window is within the second chunk of the container
+        chunks = list(iter_burst_chunks(self.container, 1130, 1140))
+        self.assertEqual([len(chunk) for chunk in chunks], [1000])
+        self.assertTrue(numpy.array_equal(chunks[0], self.bursts[1000:2000]))
+        # a burst file in the grgsm format is read within the window located by its index
+        chunks = list(iter_burst_chunks(self.burst_file, 1130, 1140, chunk_size=50))
+        self.assertEqual([len(chunk) for chunk in chunks], [50, 38])
+        self.assertEqual(chunks[0]["frame_number"][0], 1130)
+        self.assertEqual(chunks[-1]["frame_number"][-1], 1140)
+
+    def test_windows(self):
+        for path in (self.burst_file, self.container):
+            with BurstWindowReader(path) as windows:
+                reader = windows.window(1500, 1509)
+                indices = reader.select(timeslot=3, fnr_start=1500, fnr_end=1509)
+                self.assertEqual(reader.bursts["frame_number"][indices].tolist(), range(1500, 1510))
+
+    def test_read_arfcn(self):
+        for path in (self.burst_file, self.container):
+            self.assertEqual(read_arfcn(path), 42)
+            self.assertEqual(read_arfcn(path, 5), 43)
+            self.assertIsNone(read_arfcn(path, 9))
+
+
+if __name__ == "__main__":
+    unittest.main()
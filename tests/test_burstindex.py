@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from core.gsm.burstindex import BurstFileIndex
+from core.gsm.burstreader import burst_dtype, write_burst_file
+
+
+def make_bursts(frame_numbers, timeslot=0):
+    bursts = numpy.zeros(len(frame_numbers), dtype=burst_dtype)
+    bursts["frame_number"] = frame_numbers
+    bursts["timeslot"] = timeslot
+    return bursts
+
+
+class BurstFileIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.burst_file = os.path.join(self.directory, "capture.bursts")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_appended_bursts_are_indexed(self):
+        write_burst_file(self.burst_file, make_bursts(range(100, 110)))
+        index = BurstFileIndex(self.burst_file)
+        write_burst_file(self.burst_file + ".more", make_bursts(range(110, 115)))
+        with open(self.burst_file, "ab") as f:
+            f.write(open(self.burst_file + ".more", "rb").read())
+        index.refresh()
+        self.assertEqual(list(index.entries["frame_number"]), range(100, 115))
+
+    def test_rewritten_file_is_indexed_again(self):
+        write_burst_file(self.burst_file, make_bursts(range(100, 110)))
+        index = BurstFileIndex(self.burst_file)
+        # the same file is rewritten with more bursts, so it is larger and keeps its inode
+        write_burst_file(self.burst_file, make_bursts(range(500, 512), timeslot=2))
+        os.utime(self.burst_file, (0, 0))
+        index.refresh()
+        self.assertEqual(list(index.entries["frame_number"]), range(500, 512))
+        self.assertTrue(numpy.all(index.entries["timeslot"] == 2))
+
+    def test_stored_index_of_replaced_file_is_rebuilt(self):
+        write_burst_file(self.burst_file, make_bursts(range(100, 110)))
+        BurstFileIndex(self.burst_file)
+        replacement = os.path.join(self.directory, "replacement.bursts")
+        write_burst_file(replacement, make_bursts(range(300, 310)))
+        os.rename(replacement, self.burst_file)
+        index = BurstFileIndex(self.burst_file)
+        self.assertEqual(list(index.entries["frame_number"]), range(300, 310))
+
+    def test_truncated_last_burst_is_ignored(self):
+        write_burst_file(self.burst_file, make_bursts(range(100, 110)))
+        with open(self.burst_file, "ab") as f:
+            f.write("\x07\x06")
+        index = BurstFileIndex(self.burst_file)
+        self.assertEqual(len(index.entries), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from core.gsm.burstreader import DUMMY_BURST, BurstFileReader, burst_dtype, write_burst_file
+
+
+def make_bursts(frame_numbers, timeslots=(0, 2)):
+    bursts = numpy.zeros(len(frame_numbers) * len(timeslots), dtype=burst_dtype)
+    bursts["frame_number"] = numpy.repeat(frame_numbers, len(timeslots))
+    bursts["timeslot"] = numpy.tile(timeslots, len(frame_numbers))
+    return bursts
+
+
+class RecordingBursts(object):
+    """
+    Stands in for the burst array of a reader and records the ranges of bursts that are read.
+    """
+
+    def __init__(self, bursts):
+        self.bursts = bursts
+        self.ranges = []
+
+    def __len__(self):
+        return len(self.bursts)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise AssertionError("Bursts read without a window: %r" % (key,))
+        self.ranges.append(key.indices(len(self.bursts))[:2])
+        return self.bursts[key]
+
+
+class BurstFileReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.burst_file = os.path.join(self.directory, "capture.bursts")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_select_reads_only_the_window(self):
+        bursts = make_bursts(range(1000, 2000))
+        bursts["bits"][bursts["frame_number"] == 1504] = DUMMY_BURST
+        write_burst_file(self.burst_file, bursts)
+        with BurstFileReader(self.burst_file) as reader:
+            reader.bursts = RecordingBursts(reader.bursts)
+            indices = reader.select(timeslot=2, fnr_start=1500, fnr_end=1509, remove_dummy=True)
+            self.assertEqual(reader.bursts.ranges, [(1000, 1020)])
+            self.assertEqual(list(indices), [1001 + 2 * i for i in range(10) if i != 4])
+
+    def test_select_without_window(self):
+        write_burst_file(self.burst_file, make_bursts(range(1000, 1010)))
+        with BurstFileReader(self.burst_file) as reader:
+            self.assertEqual(list(reader.select(timeslot=0)), range(0, 20, 2))
+            self.assertEqual(list(reader.select(fnr_start=1008)), [16, 17, 18, 19])
+            self.assertEqual(len(reader.select(fnr_start=2000)), 0)
+
+    def test_wrapped_frame_numbers_are_scanned(self):
+        write_burst_file(self.burst_file, make_bursts([2715646, 2715647, 0, 1]))
+        with BurstFileReader(self.burst_file) as reader:
+            self.assertEqual(list(reader.select(timeslot=2, fnr_start=2715647)), [3])
+            self.assertEqual(list(reader.select(fnr_end=1)), [4, 5, 6, 7])
+
+
+if __name__ == "__main__":
+    unittest.main()
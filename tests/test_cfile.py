@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from core.gsm.cfile import PEAK_HEADROOM, QuantizedCfileWriter, read_cfile_header, read_samples
+
+
+class QuantizedCfileWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "capture.cfile")
+        state = numpy.random.RandomState(3)
+        self.samples = (0.01 * (state.randn(1000) + 1j * state.randn(1000))).astype(numpy.complex64)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_scale_follows_the_peak_of_the_first_samples(self):
+        with QuantizedCfileWriter(self.path, "int8", 400e3) as writer:
+            writer.write(self.samples[:500])
+            writer.write(self.samples[500:])
+        header = read_cfile_header(self.path)
+        peak = numpy.max(numpy.abs(self.samples[:500].view(numpy.float32)))
+        self.assertAlmostEqual(header.scale * 127, PEAK_HEADROOM * peak, places=6)
+        # a weak signal keeps its resolution in int8
+        self.assertLess(numpy.max(numpy.abs(read_samples(self.path) - self.samples)), header.scale)
+
+    def test_explicit_amplitude(self):
+        with QuantizedCfileWriter(self.path, "int16", 400e3, amplitude=0.5) as writer:
+            writer.write(self.samples)
+        self.assertAlmostEqual(read_cfile_header(self.path).scale, 0.5 / 32767)
+        self.assertEqual(len(read_samples(self.path)), len(self.samples))
+
+    def test_empty_cfile_has_a_header(self):
+        QuantizedCfileWriter(self.path, "int16", 400e3).close()
+        self.assertIsNotNone(read_cfile_header(self.path))
+        self.assertEqual(len(read_samples(self.path)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from core.gsm.burstreader import DUMMY_BURST, BurstFileReader, burst_dtype, write_burst_file
+from core.gsm.decryption import decrypt_burst_file, decrypt_bursts
+from core.gsm.kcstore import KcEntry
+
+
+class DecryptBurstFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, "encrypted.bursts")
+        self.destination = os.path.join(self.directory, "decrypted.bursts")
+        self.bursts = numpy.zeros(800, dtype=burst_dtype)
+        self.bursts["frame_number"] = 1000 + numpy.arange(800) // 4
+        self.bursts["timeslot"] = numpy.arange(800) % 4
+        self.bursts["arfcn"] = 42
+        self.bursts["bits"] = numpy.random.RandomState(1).randint(0, 2, (800, self.bursts["bits"].shape[1]))
+        self.bursts["bits"][(self.bursts["frame_number"] == 1100) & (self.bursts["timeslot"] == 1)] = DUMMY_BURST
+        write_burst_file(self.source, self.bursts)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_sessions(self):
+        sessions = [KcEntry("1223456789abcdef", None, 1, None, 1050), KcEntry("0123456789abcdef", 42, 1, None, 1120),
+                    KcEntry("00112233445566ff", 17, 2, None, 1000)]
+        expected = self.bursts.copy()
+        frame_numbers, timeslots = expected["frame_number"], expected["timeslot"]
+        # the four bursts of the cipher mode command and dummy bursts are not encrypted, the session of
+        # another ARFCN does not apply
+        for kc, selected in [("1223456789abcdef", (frame_numbers >= 1054) & (frame_numbers < 1120)),
+                             ("0123456789abcdef", frame_numbers >= 1124)]:
+            indices = numpy.flatnonzero(selected & (timeslots == 1) & (frame_numbers != 1100))
+            window = expected[indices]
+            decrypt_bursts(window, kc, processes=1)
+            expected[indices] = window
+
+        count = decrypt_burst_file(self.source, self.destination, sessions, processes=1, chunk_size=77)
+        self.assertEqual(count, (1120 - 1054 - 1) + (1200 - 1124))
+        with BurstFileReader(self.destination) as reader:
+            self.assertTrue(numpy.array_equal(reader.bursts["bits"], expected["bits"]))
+            self.assertTrue(numpy.array_equal(reader.bursts["frame_number"], self.bursts["frame_number"]))
+
+    def test_decryption_is_symmetric(self):
+        bursts = self.bursts.copy()
+        decrypt_bursts(bursts, "1223456789abcdef", processes=1)
+        self.assertFalse(numpy.array_equal(bursts["bits"], self.bursts["bits"]))
+        decrypt_bursts(bursts, "1223456789abcdef", processes=1)
+        self.assertTrue(numpy.array_equal(bursts["bits"], self.bursts["bits"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from core.gsm.burstreader import BurstFileReader, burst_dtype, write_burst_file
+from core.gsm.cfilemeta import HYPERFRAME
+from core.gsm.demodulation import demodulated_with, merge_burst_files, plan_chunks, write_parameters
+
+
+def make_bursts(frames, arfcn=0):
+    """
+    :param frames: a list of (frame number, timeslot) tuples.
+    """
+    bursts = numpy.zeros(len(frames), dtype=burst_dtype)
+    bursts["arfcn"] = arfcn
+    for i, (frame_number, timeslot) in enumerate(frames):
+        bursts[i]["frame_number"] = frame_number
+        bursts[i]["timeslot"] = timeslot
+        bursts[i]["bits"][:] = (frame_number + timeslot) % 2
+    return bursts
+
+
+class PlanChunksTest(unittest.TestCase):
+    def test_chunks_overlap_by_the_lead_in(self):
+        self.assertEqual(plan_chunks(100, 1000, 1.0, chunk_seconds=400, lead_in_seconds=50),
+                         [(100, 400), (450, 450), (850, 250)])
+
+    def test_short_range_is_one_chunk(self):
+        self.assertEqual(plan_chunks(0, 10, 1.0, chunk_seconds=400, lead_in_seconds=50), [(0, 10)])
+        self.assertEqual(plan_chunks(0, 0, 1.0), [])
+
+
+class MergeBurstFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.destination = os.path.join(self.directory, "merged.bursts")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def parts(self, *chunks, **kwargs):
+        paths = []
+        for i, frames in enumerate(chunks):
+            paths.append(os.path.join(self.directory, "chunk%d.bursts" % i))
+            write_burst_file(paths[-1], make_bursts(frames, **kwargs))
+        return paths
+
+    def merged(self):
+        with BurstFileReader(self.destination) as reader:
+            return zip(reader.bursts["frame_number"].tolist(), reader.bursts["timeslot"].tolist())
+
+    def test_lead_in_bursts_are_removed(self):
+        frames = [(fn, ts) for fn in range(100, 130) for ts in (0, 2)]
+        # the second chunk demodulates the frames of its lead-in again, from the middle of frame 119 on
+        parts = self.parts(frames[:40], frames[37:])
+        self.assertEqual(merge_burst_files(parts, self.destination), len(frames))
+        self.assertEqual(self.merged(), frames)
+
+    def test_frame_numbers_wrap_around(self):
+        frames = [(fn % HYPERFRAME, 0) for fn in range(HYPERFRAME - 20, HYPERFRAME + 20)]
+        parts = self.parts(frames[:25], frames[15:])
+        self.assertEqual(merge_burst_files(parts, self.destination), len(frames))
+        self.assertEqual(self.merged(), frames)
+
+    def test_arfcn_is_kept(self):
+        frames = [(fn, ts) for fn in range(100, 110) for ts in (0, 2)]
+        parts = self.parts(frames[:12], frames[8:], arfcn=871)
+        merge_burst_files(parts, self.destination)
+        with BurstFileReader(self.destination) as reader:
+            self.assertTrue(numpy.all(reader.bursts["arfcn"] == 871))
+            self.assertEqual(reader.get_arfcn(2), 871)
+
+    def test_missing_and_empty_parts(self):
+        frames = [(fn, 0) for fn in range(100, 110)]
+        parts = self.parts(frames[:6], [], frames[4:])
+        parts.insert(1, os.path.join(self.directory, "missing.bursts"))
+        self.assertEqual(merge_burst_files(parts, self.destination), len(frames))
+        self.assertEqual(self.merged(), frames)
+
+
+class ParametersTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.burst_file = os.path.join(self.directory, "capture.bursts")
+        self.parameters = dict(cfile="capture.cfile", size=1024, freq=935.2e6, samp_rate=1e6, ppm=0, arfcn=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_same_parameters(self):
+        write_burst_file(self.burst_file, make_bursts([(100, 0)]))
+        self.assertFalse(demodulated_with(self.burst_file, self.parameters))
+        write_parameters(self.burst_file, self.parameters)
+        self.assertTrue(demodulated_with(self.burst_file, dict(self.parameters)))
+
+    def test_changed_parameters(self):
+        write_burst_file(self.burst_file, make_bursts([(100, 0)]))
+        write_parameters(self.burst_file, self.parameters)
+        self.assertFalse(demodulated_with(self.burst_file, dict(self.parameters, arfcn=2)))
+        self.assertFalse(demodulated_with(self.burst_file, dict(self.parameters, freq=935.4e6)))
+        os.remove(self.burst_file)
+        self.assertFalse(demodulated_with(self.burst_file, self.parameters))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy
+
+from core.adapterinterfaces.a5 import A5ReconstructionAdapter, bits_from_strings
+from core.gsm import framecoder
+from core.gsm.padding import LAPDM_FILL_FRAME
+
+
+class FramecoderTest(unittest.TestCase):
+    def test_lapdm_fill_frame(self):
+        bursts = framecoder.encode_xcch([LAPDM_FILL_FRAME])
+        self.assertEqual(bursts.shape, (1, 4, 114))
+        self.assertTrue(numpy.array_equal(bursts[0], bits_from_strings(A5ReconstructionAdapter.lapdm_ui)))
+
+    def test_batch_matches_single_messages(self):
+        messages = numpy.random.RandomState(1).randint(0, 256, (3, 23))
+        bursts = framecoder.encode_xcch(messages)
+        for i in range(len(messages)):
+            self.assertTrue(numpy.array_equal(bursts[i], framecoder.encode_xcch([messages[i]])[0]))
+
+    def test_cached_matches_uncached(self):
+        messages = numpy.random.RandomState(2).randint(0, 256, (3, 23))
+        messages = messages[[0, 1, 0, 2, 1]]
+        expected = framecoder.encode_xcch(messages)
+        self.assertTrue(numpy.array_equal(framecoder.encode_xcch_cached(messages[:2]), expected[:2]))
+        self.assertTrue(numpy.array_equal(framecoder.encode_xcch_cached(messages), expected))
+        self.assertIn(messages[2].astype(numpy.uint8).tostring(), framecoder._cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
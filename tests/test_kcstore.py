@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from core.gsm.kcstore import KcEntry, KcStore, parse_kc, session_windows
+
+
+def windows(sessions):
+    return [(fnr_start, fnr_end, session.kc if session is not None else None)
+            for fnr_start, fnr_end, session in session_windows(sessions)]
+
+
+class SessionWindowsTest(unittest.TestCase):
+    def test_no_sessions(self):
+        self.assertEqual(windows([]), [(None, None, None)])
+
+    def test_closed_sessions(self):
+        sessions = [KcEntry("a" * 16, 1, 1, 0, 100, 199), KcEntry("b" * 16, 1, 1, 0, 300, 399)]
+        self.assertEqual(windows(sessions), [(None, 99, None), (100, 199, "a" * 16), (200, 299, None),
+                                             (300, 399, "b" * 16), (400, None, None)])
+
+    def test_open_session_ends_with_the_next(self):
+        sessions = [KcEntry("a" * 16, 1, 1, 0, 100), KcEntry("b" * 16, 1, 1, 0, 300)]
+        self.assertEqual(windows(sessions), [(None, 99, None), (100, 299, "a" * 16), (300, None, "b" * 16)])
+
+    def test_overlapping_sessions(self):
+        # a session that begins within the one before ends it
+        sessions = [KcEntry("a" * 16, 1, 1, 0, 100, 299), KcEntry("b" * 16, 1, 1, 0, 200, 399),
+                    KcEntry("c" * 16, 1, 1, 0, 250, 260)]
+        self.assertEqual(windows(sessions), [(None, 99, None), (100, 199, "a" * 16), (200, 249, "b" * 16),
+                                             (250, 260, "c" * 16), (261, None, None)])
+
+    def test_sessions_with_the_same_start(self):
+        sessions = [KcEntry("a" * 16, 1, 1, 0, 100), KcEntry("b" * 16, 1, 1, 0, 100, 199)]
+        self.assertEqual(windows(sessions), [(None, 99, None), (100, 199, "b" * 16), (200, None, None)])
+
+
+class KcStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = KcStore(os.path.join(self.directory, "keys.sqlite"))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_lookup(self):
+        self.store.add(KcEntry("a" * 16, None, 1, 2, 100, 199))
+        self.assertEqual(self.store.lookup(10, 1, 2, 150).kc, "a" * 16)
+        self.assertIsNone(self.store.lookup(10, 1, 2, 250))
+        self.assertIsNone(self.store.lookup(10, 1, 3, 150))
+
+    def test_session_is_replaced(self):
+        for kc in ("a" * 16, "b" * 16):
+            self.store.add(KcEntry(kc, None, 1, None, 100))
+            self.store.add(KcEntry(kc, 10, 1, 2, 100))
+        self.assertEqual(sorted((entry.arfcn, entry.subchannel, entry.kc) for entry in self.store.sessions(timeslot=1)),
+                         [(None, None, "b" * 16), (10, 2, "b" * 16)])
+
+    def test_subchannels_have_separate_windows(self):
+        # overlapping sessions of two subchannels of a timeslot must not cut each other short
+        self.store.add(KcEntry("a" * 16, 1, 1, 0, 100, 499))
+        self.store.add(KcEntry("b" * 16, 1, 1, 4, 200, 299))
+        subchannels = dict()
+        for session in self.store.sessions(arfcn=1, timeslot=1):
+            subchannels.setdefault(session.subchannel, []).append(session)
+        self.assertEqual(windows(subchannels[0]), [(None, 99, None), (100, 499, "a" * 16), (500, None, None)])
+        self.assertEqual(windows(subchannels[4]), [(None, 199, None), (200, 299, "b" * 16), (300, None, None)])
+
+    def test_parse_kc(self):
+        self.assertEqual(parse_kc("0x01,0x23,0x45,0x67,0x89,0xAB,0xCD,0xEF"), "0123456789abcdef")
+        self.assertEqual(KcEntry(parse_kc("0x0123456789abcdef"), 1, 1, 0, 0).kc_bytes(),
+                         [0x01, 0x23, 0x45, 0x67, 0x89, 0xab, 0xcd, 0xef])
+
+
+if __name__ == "__main__":
+    unittest.main()
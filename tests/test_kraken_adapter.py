@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from adapter.kraken_adapter import KrakenCache
+
+
+class KrakenCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "kraken.cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def last_used(self, keystream):
+        db = sqlite3.connect(self.path)
+        try:
+            return db.execute("SELECT last_used FROM results WHERE keystream = ?", (keystream,)).fetchone()[0]
+        finally:
+            db.close()
+
+    def test_round_trip(self):
+        cache = KrakenCache(self.path)
+        cache.put("0101", [("0123456789abcdef", 12)])
+        cache.put("1111", [])
+        self.assertEqual(cache.get("0101"), [("0123456789abcdef", 12)])
+        self.assertEqual(cache.get("1111"), [])
+        self.assertIsNone(cache.get("0000"))
+        cache.close()
+
+    def test_lookups_are_written_in_one_transaction(self):
+        cache = KrakenCache(self.path)
+        cache.put("0101", [])
+        stored = self.last_used("0101")
+        cache.get("0101")
+        self.assertEqual(self.last_used("0101"), stored)
+        cache.flush()
+        self.assertGreaterEqual(self.last_used("0101"), stored)
+        cache.close()
+
+    def test_cache_with_kc_column(self):
+        db = sqlite3.connect(self.path)
+        db.execute("CREATE TABLE results (table_set TEXT, keystream TEXT, candidates TEXT, kc TEXT, last_used REAL, "
+                   "PRIMARY KEY (table_set, keystream))")
+        db.commit()
+        db.close()
+        cache = KrakenCache(self.path)
+        cache.put("0101", [("0123456789abcdef", 12)])
+        self.assertEqual(cache.get("0101"), [("0123456789abcdef", 12)])
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy
+
+from adapter.kraken_scheduler import KrakenScheduler
+from core.adapterinterfaces.a5 import BURST_PAYLOAD_LENGTH, A5BurstSetBatch
+
+
+def make_batch(frame_numbers):
+    bits = numpy.zeros((len(frame_numbers), BURST_PAYLOAD_LENGTH), dtype=numpy.uint8)
+    return A5BurstSetBatch(frame_numbers, bits, bits, [fn + 1000 for fn in frame_numbers], bits, bits)
+
+
+class KrakenSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = KrakenScheduler()
+        self.kinds = ["SACCH TA"] * 3 + ["SACCH"] * 3 + ["LAPDm"] * 3
+        self.batch = make_batch(range(100, 100 + len(self.kinds)))
+
+    def test_order_by_score(self):
+        batch, kinds = self.scheduler.schedule(self.batch, self.kinds, race=False)
+        self.assertEqual(kinds, ["LAPDm"] * 3 + ["SACCH"] * 3 + ["SACCH TA"] * 3)
+        self.assertEqual(list(batch.frame_numbers), range(106, 109) + range(103, 106) + range(100, 103))
+
+    def test_race_between_channels(self):
+        batch, kinds = self.scheduler.schedule(self.batch, self.kinds, race=True)
+        # the SDCCH and SACCH take turns, the timing advance guesses stay behind the SACCH guesses
+        self.assertEqual(kinds, ["LAPDm", "SACCH"] * 3 + ["SACCH TA"] * 3)
+        self.assertEqual(list(batch.frame_numbers), [106, 103, 107, 104, 108, 105, 100, 101, 102])
+
+    def test_weights_and_snr(self):
+        snr = {106: 1.0, 107: 1.0}
+        batch, kinds = self.scheduler.schedule(self.batch, self.kinds, snr, race=False, weights={"LAPDm": 0.5})
+        self.assertEqual(list(batch.frame_numbers[:4]), [103, 104, 105, 108])
+
+    def test_hit_statistics_refine_the_prior(self):
+        before = self.scheduler.hit_rate("SACCH TA")
+        for i in range(10):
+            self.scheduler.submitted("SACCH TA")
+            self.scheduler.found("SACCH TA")
+        self.assertGreater(self.scheduler.hit_rate("SACCH TA"), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
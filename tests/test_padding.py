@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy
+
+from core.gsm import framecoder
+from core.gsm.padding import LAPDM_FILL_FRAME, count_fill_frames, randomization_probability
+
+
+class PaddingTest(unittest.TestCase):
+    def test_count_fill_frames(self):
+        fixed = framecoder.encode_xcch([LAPDM_FILL_FRAME])
+        padding = numpy.random.RandomState(1).randint(0, 256, 20)
+        random_padding = framecoder.encode_xcch([LAPDM_FILL_FRAME[:3] + list(padding)])
+        other = framecoder.encode_xcch([[0x01, 0x03, 0x41] + [0x55] * 20])
+        self.assertEqual(count_fill_frames(numpy.concatenate((fixed, fixed, random_padding, other))), (2, 1))
+
+    def test_no_fill_frames_keeps_the_lapdm_prior(self):
+        self.assertEqual(randomization_probability(0, 0), 0.0)
+
+    def test_randomization_probability(self):
+        self.assertLess(randomization_probability(10, 0), 0.1)
+        self.assertGreater(randomization_probability(0, 10), 0.9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from core.gsm.burstfile import GSMTAP_HEADER_LENGTH, GSMTAP_OFFSET_SUB_TYPE
+from core.gsm.ringcapture import classify_message, initial_tmsi
+
+GSMTAP_CHANNEL_SDCCH8 = 0x08
+GSMTAP_CHANNEL_CCCH = 0x02
+
+
+def make_message(l3, channel=GSMTAP_CHANNEL_SDCCH8):
+    """
+    :param l3: the L3 message as hex string.
+    :return: GSMTAP header and L2 frame of the message, with a LAPDm header on dedicated channels.
+    """
+    header = bytearray(GSMTAP_HEADER_LENGTH)
+    header[GSMTAP_OFFSET_SUB_TYPE] = channel
+    l3 = l3.decode("hex")
+    if channel == GSMTAP_CHANNEL_SDCCH8:
+        # UA frame of the contention resolution
+        l2 = "\x01\x73" + chr(len(l3) << 2 | 1) + l3
+    else:
+        l2 = chr(len(l3) << 2 | 1) + l3
+    return str(header) + l2 + "\x2b" * (23 - len(l2))
+
+
+class InitialTmsiTest(unittest.TestCase):
+    def test_paging_response(self):
+        self.assertEqual(initial_tmsi(make_message("0627" "07" "03" "575880" "05f4" "1234abcd")), "1234abcd")
+
+    def test_location_updating_request(self):
+        # the sequence number in the message type of a R99 mobile is ignored
+        message = make_message("0548" "70" "62f2200001" "57" "05f4" "deadbeef")
+        self.assertEqual(initial_tmsi(message), "deadbeef")
+
+    def test_cm_service_request(self):
+        self.assertEqual(initial_tmsi(make_message("0524" "01" "03" "575880" "05f4" "00c0ffee")), "00c0ffee")
+
+    def test_identity_by_imsi(self):
+        self.assertIsNone(initial_tmsi(make_message("0524" "01" "03" "575880" "08" "29260000000000f0")))
+
+    def test_other_messages(self):
+        # cipher mode command on the dedicated channel, paging request with a TMSI on the CCCH
+        self.assertIsNone(initial_tmsi(make_message("0635" "01")))
+        paging = make_message("0621" "00" "05f4" "1234abcd", GSMTAP_CHANNEL_CCCH)
+        self.assertIsNone(initial_tmsi(paging))
+        self.assertEqual(classify_message(paging, ["tmsi"], ["1234abcd"]), "tmsi")
+
+
+if __name__ == "__main__":
+    unittest.main()